@@ -0,0 +1,49 @@
+"""
+Compares the BeautifulSoup and the lxml parsers of the screener page on the saved HTML fixtures
+
+Usage: python benchmarks/bench_parsing.py [-n 50]
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from mad_money_backtesting.data import NoDataForDateException, _parse_daily_data  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def _parse_or_empty(html: str, parser: str) -> list:
+    try:
+        return _parse_daily_data(html, "2021-06-01", parser)
+    except NoDataForDateException:
+        return []
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=50, help="Number of parses per fixture and parser")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+
+    print(f"{'fixture':<30}{'rows':>6}{'bs4 [ms]':>12}{'lxml [ms]':>12}{'speedup':>10}")
+
+    for fixture_path in sorted(FIXTURES_DIR.glob("screener_*.html")):
+        html = fixture_path.read_text(encoding="utf-8")
+
+        bs4_rows = _parse_or_empty(html, "bs4")
+        lxml_rows = _parse_or_empty(html, "lxml")
+        if bs4_rows != lxml_rows:
+            raise RuntimeError(f"The parsers returned different rows for {fixture_path.name}")
+
+        times = {parser: timeit.timeit(lambda: _parse_or_empty(html, parser), number=args.number) / args.number
+                 for parser in ("bs4", "lxml")}
+
+        print(f"{fixture_path.name:<30}{len(bs4_rows):>6}{times['bs4'] * 1000:>12.3f}{times['lxml'] * 1000:>12.3f}"
+              f"{times['bs4'] / times['lxml']:>9.1f}x")
@@ -0,0 +1,265 @@
+"""
+Offline benchmarks of the backtesting pipeline on synthetic data (see `synthetic.py`)
+
+Every benchmark is timed on a grid of the sizes which matter for it (symbols, days of hourly bars, recommendations
+per symbol), and the results are saved as JSON. With `--baseline` the timings are compared to a previous run,
+and the exit code is 1 if something got slower than `--threshold` times the baseline
+
+Usage: python benchmarks/bench_suite.py [-o results.json] [--baseline old_results.json] [--only strategy startup]
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import backtesting
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import mad_money_backtesting as mmb  # noqa: E402
+from mad_money_backtesting import backtesting_strategies  # noqa: E402
+from synthetic import make_prices, make_raw_recommendations_df, make_recommendations_df, make_stock_df, \
+    make_symbols  # noqa: E402
+
+STRATEGIES = {
+    "AfterShowBuyNextDayCloseSell": (backtesting_strategies.AfterShowBuyNextDayCloseSell, {}),
+    "AfterShowBuyNextDayOpenSell": (backtesting_strategies.AfterShowBuyNextDayOpenSell, {}),
+    "NextDayOpenBuyNextDayCloseSell": (backtesting_strategies.NextDayOpenBuyNextDayCloseSell, {}),
+    "BuyAndHold": (backtesting_strategies.BuyAndHold, {"sell_horizon": 7}),
+}
+
+# How the strategies are run: bar loop of backtesting.py (with and without precomputed signals), vectorized engine
+ENGINES = ["next", "precompute", "vectorized"]
+
+CASH = 1000
+COMMISSION = 0.002
+
+
+def time_function(fn: Callable, repeat: int) -> Dict[str, float]:
+    """
+    Runs the function `repeat` times (after a warm-up run) and returns the best and the median time
+    """
+
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"best_s": min(times), "median_s": float(np.median(times))}
+
+
+def _recommendation_dates(recommendations_df: pd.DataFrame, symbol: str) -> list:
+    return [mmb.pd_date_to_datetime(d) for d in recommendations_df[recommendations_df["symbol"] == symbol]["date"]]
+
+
+def _strategy_instance(strategy_class, stock_df: pd.DataFrame, **params):
+    """
+    Strategy instance without a backtest, so its date methods can be called directly
+    """
+
+    strategy = strategy_class.__new__(strategy_class)
+    strategy.calendar = mmb.TradingCalendar.from_df(stock_df)
+    for k, v in params.items():
+        setattr(strategy, k, v)
+    return strategy
+
+
+def bench_strategy(name: str, engine: str, nb_days: int, recommendations_per_symbol: int):
+    strategy_class, params = STRATEGIES[name]
+    stock_df = make_stock_df(nb_days)
+    symbol = make_symbols(1)[0]
+    recommendation_dates = _recommendation_dates(
+        make_recommendations_df([symbol], recommendations_per_symbol, nb_days), symbol)
+
+    if engine == "vectorized":
+        return lambda: mmb.run_vectorized(stock_df, strategy_class, recommendation_dates, CASH, COMMISSION, 0.02, 0.05,
+                                          **params)
+
+    bt = backtesting.Backtest(stock_df, strategy_class, cash=CASH, commission=COMMISSION, trade_on_close=True)
+    return lambda: bt.run(recommendation_dates=recommendation_dates, stop_loss_perc=0.02, take_profit_perc=0.05,
+                          precompute_signals=engine == "precompute", **params)
+
+
+def bench_fix_non_existent_dates(nb_days: int, recommendations_per_symbol: int):
+    stock_df = make_stock_df(nb_days)
+    symbol = make_symbols(1)[0]
+    recommendation_dates = _recommendation_dates(
+        make_recommendations_df([symbol], recommendations_per_symbol, nb_days), symbol)
+
+    strategy = _strategy_instance(backtesting_strategies.AfterShowBuyNextDayCloseSell, stock_df)
+    # Buy dates at 15:30 and sell dates at the weekend, so both the existing and the missing dates are resolved
+    dates = [d.replace(hour=15, minute=30) for d in recommendation_dates] + \
+            [d + datetime.timedelta(days=(5 - d.weekday()) % 7) for d in recommendation_dates]
+    return lambda: strategy._fix_non_existent_dates(dates, mode="next_date")
+
+
+def bench_drop_dates_based_on_elapsed_time(nb_days: int, recommendations_per_symbol: int):
+    stock_df = make_stock_df(nb_days)
+    symbol = make_symbols(1)[0]
+    recommendation_dates = _recommendation_dates(
+        make_recommendations_df([symbol], recommendations_per_symbol, nb_days), symbol)
+
+    strategy = _strategy_instance(backtesting_strategies.BuyAndHold, stock_df, sell_horizon=7)
+    return lambda: strategy._drop_dates_based_on_elapsed_time(recommendation_dates, datetime.timedelta(days=7))
+
+
+def bench_transform(nb_symbols: int, recommendations_per_symbol: int):
+    raw_df = make_raw_recommendations_df(make_symbols(nb_symbols), recommendations_per_symbol, nb_days=250)
+    return lambda: mmb.transform_cramer_call_raw_dataframe(df=raw_df.copy())
+
+
+def bench_summarize(nb_symbols: int, nb_days: int):
+    symbols = make_symbols(nb_symbols)
+    prices = make_prices(symbols, nb_days)
+    recommendations_df = make_recommendations_df(symbols, 5, nb_days)
+    results = mmb.run_vectorized_for_symbols(prices, backtesting_strategies.AfterShowBuyNextDayCloseSell,
+                                             recommendations_df, CASH, COMMISSION)
+    return lambda: mmb.summarize_backtesting_results(list(results.values()), list(results.keys()),
+                                                     sort_by="Return [%]")
+
+
+# Cold start of the commands, every case is a new interpreter (the scrape command only needs the data module)
+STARTUP_COMMANDS = {
+    "import": ["-c", "import mad_money_backtesting"],
+    "cli_help": ["-m", "mad_money_backtesting", "--help"],
+    "scrape_imports": ["-c", "import mad_money_backtesting.data"],
+}
+
+
+def bench_startup(name: str):
+    command = [sys.executable] + STARTUP_COMMANDS[name]
+    repo_root = Path(__file__).resolve().parents[1]
+    return lambda: subprocess.run(command, cwd=repo_root, check=True, stdout=subprocess.DEVNULL)
+
+
+def get_benchmarks(args) -> List[dict]:
+    """
+    The benchmark cases: name, sizes and a factory which prepares the data and returns the function to time
+    """
+
+    cases = []
+
+    for name, engine, nb_days, recommendations in itertools.product(STRATEGIES, ENGINES, args.days,
+                                                                     args.recommendations):
+        cases.append({"name": f"strategy/{name}/{engine}",
+                      "params": {"days": nb_days, "recommendations": recommendations},
+                      "factory": lambda n=name, e=engine, d=nb_days, r=recommendations: bench_strategy(n, e, d, r)})
+
+    for nb_days, recommendations in itertools.product(args.days, args.recommendations):
+        cases.append({"name": "dates/_fix_non_existent_dates",
+                      "params": {"days": nb_days, "recommendations": recommendations},
+                      "factory": lambda d=nb_days, r=recommendations: bench_fix_non_existent_dates(d, r)})
+        cases.append({"name": "dates/_drop_dates_based_on_elapsed_time",
+                      "params": {"days": nb_days, "recommendations": recommendations},
+                      "factory": lambda d=nb_days, r=recommendations: bench_drop_dates_based_on_elapsed_time(d, r)})
+
+    for nb_symbols, recommendations in itertools.product(args.symbols, args.recommendations):
+        cases.append({"name": "data/transform_cramer_call_raw_dataframe",
+                      "params": {"symbols": nb_symbols, "recommendations": recommendations},
+                      "factory": lambda s=nb_symbols, r=recommendations: bench_transform(s, r)})
+
+    for nb_symbols, nb_days in itertools.product(args.symbols, args.days):
+        cases.append({"name": "results/summarize_backtesting_results",
+                      "params": {"symbols": nb_symbols, "days": nb_days},
+                      "factory": lambda s=nb_symbols, d=nb_days: bench_summarize(s, d)})
+
+    for name in STARTUP_COMMANDS:
+        cases.append({"name": f"startup/{name}", "params": {}, "factory": lambda n=name: bench_startup(n)})
+
+    if args.only:
+        cases = [c for c in cases if any(pattern in c["name"] for pattern in args.only)]
+    return cases
+
+
+def _case_key(result: dict) -> str:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare_to_baseline(results: List[dict], baseline_path: Path, threshold: float) -> List[dict]:
+    """
+    Prints the ratio of the timings to the baseline, and returns the regressions
+    """
+
+    baseline = {_case_key(r): r for r in json.loads(baseline_path.read_text())["results"]}
+    regressions = []
+
+    print(f"\n{'benchmark':<90}{'baseline [ms]':>15}{'now [ms]':>12}{'ratio':>8}")
+    for result in results:
+        baseline_result = baseline.get(_case_key(result))
+        if baseline_result is None:
+            continue
+        ratio = result["best_s"] / baseline_result["best_s"]
+        flag = "  <-- slower" if ratio > threshold else ""
+        print(f"{_case_key(result):<90}{baseline_result['best_s'] * 1000:>15.3f}{result['best_s'] * 1000:>12.3f}"
+              f"{ratio:>8.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(result)
+
+    return regressions
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--symbols", type=int, nargs="+", default=[10, 100],
+                        help="Number of symbols (transform and summarizer)")
+    parser.add_argument("-d", "--days", type=int, nargs="+", default=[60, 250],
+                        help="Number of days of hourly stock data")
+    parser.add_argument("-r", "--recommendations", type=int, nargs="+", default=[5, 20],
+                        help="Number of recommendations per symbol")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of timed runs of every case")
+    parser.add_argument("--only", type=str, nargs="+", default=None,
+                        help="Only the benchmarks which contain one of these strings, e.g. strategy or transform")
+    parser.add_argument("-o", "--output", type=str, default="benchmark_results.json", help="Output file path")
+    parser.add_argument("--baseline", type=str, default=None, help="Results of a previous run to compare to")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="A case is a regression if it is this many times slower than the baseline")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    # backtesting.py warns about the unclosed trades at the end of the data
+    warnings.simplefilter("ignore")
+
+    results = []
+    for case in get_benchmarks(args):
+        timings = time_function(case["factory"](), args.repeat)
+        results.append({"name": case["name"], "params": case["params"], "repeat": args.repeat, **timings})
+        params_str = ", ".join(f"{k}={v}" for k, v in case["params"].items())
+        print(f"{case['name']:<55}{params_str:<35}{timings['best_s'] * 1000:>12.3f} ms")
+
+    output = {"meta": {"created_at": datetime.datetime.now().isoformat(),
+                       "git_commit": _git_commit(),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "numpy": np.__version__,
+                       "pandas": pd.__version__,
+                       "backtesting": backtesting.__version__},
+              "results": results}
+    Path(args.output).write_text(json.dumps(output, indent=2))
+    print(f"Results are saved to {args.output}")
+
+    if args.baseline is not None:
+        regressions = compare_to_baseline(results, Path(args.baseline), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks are slower than {args.threshold}x of the baseline")
+            raise SystemExit(1)
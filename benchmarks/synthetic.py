@@ -0,0 +1,87 @@
+"""
+Seeded generators of synthetic stock data and recommendations, so the benchmarks do not need the network
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from mad_money_backtesting.data import transform_cramer_call_raw_dataframe  # noqa: E402
+
+START_DATE = "2020-01-02"
+
+# The same hourly bars as yfinance returns with interval="1h" and prepost=False
+BAR_TIMES = ["09:30", "10:30", "11:30", "12:30", "13:30", "14:30", "15:30"]
+
+SEGMENTS = ["D", "F", "I", "L", "M"]
+
+
+def make_symbols(nb_symbols: int) -> List[str]:
+    return [f"SYM{i}" for i in range(nb_symbols)]
+
+
+def make_stock_df(nb_days: int, seed: int = 0, start_date: str = START_DATE) -> pd.DataFrame:
+    """
+    Hourly OHLCV bars (random walk) of `nb_days` business days, in the format we use for backtesting
+    """
+
+    rng = np.random.default_rng(seed)
+
+    days = pd.bdate_range(start_date, periods=nb_days)
+    offsets = pd.to_timedelta([f"{t}:00" for t in BAR_TIMES])
+    index = (days.values[:, None] + offsets.values[None, :]).ravel()
+    index = pd.DatetimeIndex(index).tz_localize("America/New_York")
+
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(index))))
+    open_ = np.r_[close[0], close[:-1]] * (1 + rng.normal(0, 0.002, len(index)))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.004, len(index))))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.004, len(index))))
+    volume = rng.integers(1_000, 100_000, len(index))
+
+    stock_df = pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}, index=index)
+    stock_df["Date"] = stock_df.index
+    return stock_df
+
+
+def make_prices(symbols: List[str], nb_days: int, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    return {symbol: make_stock_df(nb_days, seed=seed + i) for i, symbol in enumerate(symbols)}
+
+
+def make_raw_recommendations_df(symbols: List[str], recommendations_per_symbol: int, nb_days: int, seed: int = 0,
+                                start_date: str = START_DATE) -> pd.DataFrame:
+    """
+    Recommendations in the format of `scrape_cramer_calls` (the input of the transform)
+    """
+
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start_date, periods=nb_days)
+
+    nb_rows = len(symbols) * recommendations_per_symbol
+    dates = days[np.concatenate([np.sort(rng.choice(len(days), recommendations_per_symbol,
+                                                    replace=recommendations_per_symbol > len(days)))
+                                 for _ in symbols])]
+    row_symbols = np.repeat(symbols, recommendations_per_symbol)
+
+    return pd.DataFrame({
+        "name": [f"Company {s} ({s.lower()})" for s in row_symbols],
+        "month_and_day": dates.strftime("%-m/%-d"),
+        "segment": rng.choice(SEGMENTS, nb_rows),
+        "call": rng.integers(1, 6, nb_rows).astype(str),
+        "current_price": [f"${p:,.2f}" for p in rng.uniform(5, 1500, nb_rows)],
+        "date": dates.strftime("%Y-%m-%d"),
+    })
+
+
+def make_recommendations_df(symbols: List[str], recommendations_per_symbol: int, nb_days: int,
+                            seed: int = 0) -> pd.DataFrame:
+    """
+    Recommendations in the format of `transform_cramer_call_raw_dataframe` (the input of the backtests)
+    """
+
+    raw_df = make_raw_recommendations_df(symbols, recommendations_per_symbol, nb_days, seed)
+    return transform_cramer_call_raw_dataframe(df=raw_df)
@@ -1,5 +1,69 @@
-from mad_money_backtesting.backtesting_strategies import AfterShowBuyNextDayCloseSell, AfterShowBuyNextDayOpenSell, \
-    NextDayOpenBuyNextDayCloseSell, BuyAndHold
-from mad_money_backtesting.data import scrape_cramer_calls, transform_cramer_call_raw_dataframe, PageNotWorkingError
-from mad_money_backtesting.results import summarize_backtesting_results
-from mad_money_backtesting.untils import pd_date_to_datetime, paginated_html_table
+"""
+The public names are imported lazily (on first use, PEP 562), so e.g. the scraper does not load `backtesting`
+and `import mad_money_backtesting` does not load any of the heavy dependencies
+"""
+
+import importlib
+
+# Public name -> submodule which defines it
+_ATTRIBUTES = {
+    "AfterShowBuyNextDayCloseSell": "backtesting_strategies",
+    "AfterShowBuyNextDayOpenSell": "backtesting_strategies",
+    "NextDayOpenBuyNextDayCloseSell": "backtesting_strategies",
+    "BuyAndHold": "backtesting_strategies",
+    "run_batch": "batch",
+    "BatchResult": "batch",
+    "CostModel": "costs",
+    "cost_grid": "costs",
+    "reprice": "costs",
+    "reprice_ledgers": "costs",
+    "cost_sensitivity": "costs",
+    "scrape_cramer_calls": "data",
+    "iter_cramer_calls": "data",
+    "stream_cramer_calls": "data",
+    "transform_cramer_call_raw_dataframe": "data",
+    "PageNotWorkingError": "data",
+    "event_windows": "event_study",
+    "EventWindows": "event_study",
+    "Instrumentation": "instrumentation",
+    "enable_instrumentation": "instrumentation",
+    "disable_instrumentation": "instrumentation",
+    "get_instrumentation": "instrumentation",
+    "PartitionedDataset": "partitioned_dataset",
+    "run_portfolio": "portfolio",
+    "PortfolioResult": "portfolio",
+    "PriceStore": "price_store",
+    "YFinanceFetcher": "price_store",
+    "LocalFetcher": "price_store",
+    "RecommendationStore": "recommendations",
+    "ResultCache": "result_cache",
+    "summarize_backtesting_results": "results",
+    "ResultsStore": "results_store",
+    "monte_carlo": "significance",
+    "MonteCarloResult": "significance",
+    "sweep": "sweeps",
+    "rank_sweep_results": "sweeps",
+    "TradingCalendar": "trading_calendar",
+    "ScraperTransport": "transport",
+    "pd_date_to_datetime": "untils",
+    "paginated_html_table": "untils",
+    "run_vectorized": "vectorized",
+    "run_vectorized_for_symbols": "vectorized",
+}
+
+__all__ = list(_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    module_name = _ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f"{__name__}.{module_name}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_ATTRIBUTES))
+
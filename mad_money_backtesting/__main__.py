@@ -0,0 +1,4 @@
+from mad_money_backtesting.cli import main
+
+if __name__ == "__main__":
+    main()
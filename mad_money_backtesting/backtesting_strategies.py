@@ -1,12 +1,15 @@
-from copy import deepcopy
 from datetime import datetime, timedelta
 from typing import List, Tuple
 
 import backtesting
+import numpy as np
 import pandas as pd
 import pytz
 
 import mad_money_backtesting as mmb
+from mad_money_backtesting.instrumentation import count_resolved_dates, get_instrumentation
+from mad_money_backtesting.scheduling import HOLDING_POLICIES, schedule_positions
+from mad_money_backtesting.trading_calendar import TradingCalendar
 
 # TODO: the TZ handling is pretty bad here - that needs a refactoring, it's 100%
 
@@ -17,15 +20,7 @@ class _BaseMadMoneyStrategy(backtesting.Strategy):
     """
 
     def __init__(self, broker, data, params):
-        # Cramer's buy recommendation dates for the stock
-        self.recommendation_dates: List[datetime] = None
-
-        # Stop loss - if None, there is no stop loss
-        self.stop_loss_perc: float = None
-
-        # Take profit - if None there is no take profit
-        self.take_profit_perc: float = None
-
+        self._declare_parameters()
         super().__init__(broker, data, params)
 
         if len(self.recommendation_dates) == 0:
@@ -35,17 +30,59 @@ class _BaseMadMoneyStrategy(backtesting.Strategy):
         # self.available_trade_days: pd.Series = self.data.df.groupby(pd.Grouper(key="Date",
         #                                                                        freq="D")).first().reset_index()["Date"]
 
-        buy_dates, sell_dates = self._calculate_buy_sell_dates(self.recommendation_dates)
+        if self.calendar is None:
+            self.calendar = TradingCalendar.from_df(self.data.df)
+
+        instrumentation = get_instrumentation()
+        instrumentation.count("bars", len(self.data))
 
-        buy_dates = self._localize_dates(buy_dates)
-        self.buy_dates = self._fix_non_existent_dates(buy_dates, mode="next_date")
+        # The calendar localizes the dates, so they can be compared to the dates in the data
+        with instrumentation.stage("dates.calculate"):
+            buy_dates, sell_dates = self._calculate_buy_sell_dates(self.recommendation_dates)
+        with instrumentation.stage("dates.fix"):
+            self.buy_dates = self._fix_non_existent_dates(buy_dates, mode="next_date")
+            self.sell_dates = self._fix_non_existent_dates(sell_dates, mode="next_date")
 
-        sell_dates = self._localize_dates(sell_dates)
-        self.sell_dates = self._fix_non_existent_dates(sell_dates, mode="next_date")
+    def _declare_parameters(self):
+        """
+        Sets the default values of the strategy parameters, `backtesting.Strategy` only accepts the parameters
+        which are already defined on the instance
+        """
+
+        # Cramer's buy recommendation dates for the stock
+        self.recommendation_dates: List[datetime] = None
+
+        # Stop loss - if None, there is no stop loss
+        self.stop_loss_perc: float = None
+
+        # Take profit - if None there is no take profit
+        self.take_profit_perc: float = None
+
+        # If True, the buy/sell dates are converted to signal arrays in `init()`, so `next()` does not need to
+        # convert and look up the current date on every bar
+        self.precompute_signals: bool = False
+
+        # Index of the available bars - if None, it is built from the data. It can be shared between the runs
+        # on the same stock data
+        self.calendar: TradingCalendar = None
 
     def init(self):
         super().init()
 
+        if self.precompute_signals:
+            bar_dates = pd.DatetimeIndex(self.data.df["Date"])
+            self.buy_signal = bar_dates.isin(pd.DatetimeIndex(self.buy_dates))
+            # Number of positions (lots) to close on the bar
+            self.sell_signal = np.bincount(bar_dates.get_indexer(pd.DatetimeIndex(self.sell_dates)),
+                                           minlength=len(bar_dates))
+
+            # The levels are calculated for every bar, but they are only used on the buy bars
+            close = self.data.Close
+            if self.stop_loss_perc:
+                self.stop_loss_levels = self.I(lambda: close - (close * self.stop_loss_perc), name="SL")
+            if self.take_profit_perc:
+                self.take_profit_levels = self.I(lambda: close + (close * self.take_profit_perc), name="TP")
+
     def _localize_dates(self, dates: list):
         """
         Assign TZs to the dates, this is important as it's needed for the caluclation with the dates
@@ -67,46 +104,25 @@ class _BaseMadMoneyStrategy(backtesting.Strategy):
 
         - drop: date is completely dropped from the list
         - next_date: we get the closes date in the stock data and switch it with the non existing one
+        - prev_date: we get the closest previous date in the stock data and switch it with the non existing one
         """
 
-        assert mode in {"drop", "next_date"}, f"Mode {mode} not available"
-
-        # Drop: The date will be removed
-        # Next_Date: The closes date will be selected to the original buy/sell date
-
-        problematic_date_indices = []
-
-        for i, d in enumerate(date_list):
-            if sum(self.data.df["Date"] == d) == 0:
-                # Calculated date is not part of the data (this can happen because of wrong calculation
-                # or because of missing data)
-                problematic_date_indices.append(i)
-
-        fixed_date_list = deepcopy(date_list)
-
-        for i in problematic_date_indices:
-            if mode == "drop":
-                item_to_drop = date_list[i]
-                fixed_date_list.remove(item_to_drop)
-            elif mode == "next_date":
-                greater_dates_than_bad_one = self.data.df["Date"][self.data.df["Date"] > date_list[i]]
-                if len(greater_dates_than_bad_one) == 0:
-                    # When we don't have greater close dates, then we can drop the date
-                    fixed_date_list.remove(date_list[i])
-                else:
-                    closest_date = greater_dates_than_bad_one.values[0]
-                    closest_date = mmb.pd_date_to_datetime(closest_date)
-                    closest_date = self._localize_dates([closest_date])[0]
-                    fixed_date_list[i] = closest_date
-                    # print(f"Problem: {date_list[i]}, fixed to {closest_date}")
-        return fixed_date_list
+        resolved_dates = self.calendar.resolve_dates(date_list, mode)
+        count_resolved_dates(self.calendar, date_list, len(resolved_dates))
+        return resolved_dates
 
     def next(self):
         super().next()
 
+        if self.precompute_signals:
+            self._next_with_signals()
+            return
+
         current_date = mmb.pd_date_to_datetime(self.data.Date[-1])
         current_date = self._localize_dates([current_date])[0]
 
+        nb_sells = self.sell_dates.count(current_date)
+
         if current_date in self.buy_dates:
             current_close_value = self.data.Close[-1]
             stop_loss_value = None
@@ -116,11 +132,43 @@ class _BaseMadMoneyStrategy(backtesting.Strategy):
             if self.take_profit_perc:
                 take_profit_value = current_close_value + (current_close_value * self.take_profit_perc)
 
-            self.buy(size=0.999, sl=stop_loss_value, tp=take_profit_value)
+            self.buy(size=self._buy_size(nb_sells), sl=stop_loss_value, tp=take_profit_value)
 
-        if current_date in self.sell_dates:
+        if nb_sells > 0:
             if self.position.size > 0:
-                self.position.close(1.0)
+                self._close_position(nb_sells)
+
+    def _next_with_signals(self):
+        """
+        Same as `next()`, but it only reads the signal arrays created in `init()`
+        """
+
+        current_bar = len(self.data) - 1
+        nb_sells = self.sell_signal[current_bar]
+
+        if self.buy_signal[current_bar]:
+            stop_loss_value = self.stop_loss_levels[-1] if self.stop_loss_perc else None
+            take_profit_value = self.take_profit_levels[-1] if self.take_profit_perc else None
+            self.buy(size=self._buy_size(nb_sells), sl=stop_loss_value, tp=take_profit_value)
+
+        if nb_sells > 0:
+            if self.position.size > 0:
+                self._close_position(nb_sells)
+
+    def _buy_size(self, nb_sells: int) -> float:
+        """
+        Fraction of the available cash used for a new position, `nb_sells` is the number of sell dates on the
+        current bar
+        """
+
+        return 0.999
+
+    def _close_position(self, nb_sells: int):
+        """
+        Closes the position, `nb_sells` is the number of sell dates on the current bar
+        """
+
+        self.position.close(1.0)
 
 
 class _QuickBuySellStrategies(_BaseMadMoneyStrategy):
@@ -172,57 +220,61 @@ class BuyAndHold(_BaseMadMoneyStrategy):
     This strategy implements the Buy & Hold strategy, but you can define the time horizon for holding
     """
 
-    def __init__(self, broker, data, params):
+    def _declare_parameters(self):
+        super()._declare_parameters()
+
         # Number of days to close the long position
         # (if it's more than the available data, e.g. 100000, then it's a "pure" buy and hold)
         self.sell_horizon: int = None
-        super().__init__(broker, data, params)
 
-    def _calculate_buy_sell_dates(self, recommendation_dates: list) -> Tuple[list, list]:
-        buy_dates, sell_dates = [], []
-        # offset = pd.tseries.offsets.BDay(self.sell_horizon)
-        offset = timedelta(days=self.sell_horizon)
+        # What happens with a recommendation while we hold the stock (see `scheduling.HOLDING_POLICIES`)
+        self.holding_policy: str = "skip"
 
-        for recomm in recommendation_dates:
-            buy = mmb.pd_date_to_datetime(recomm, hour=15, minute=30)
-            buy_dates.append(buy)
+        # Maximum number of concurrent lots (only used with the "lots" holding policy)
+        self.max_lots: int = 1
 
-        # We do not want to buy more until we sell in the defined time horizon
-        buy_dates = self._drop_dates_based_on_elapsed_time(buy_dates, timedelta(days=self.sell_horizon))
+    def _calc_buy_date(self, recommendation_date) -> datetime:
+        return mmb.pd_date_to_datetime(recommendation_date, hour=15, minute=30)
 
-        for buy in buy_dates:
-            sell = buy.replace(hour=15, minute=30) + offset
-            sell_dates.append(sell)
+    def _schedule_positions(self, buy_dates) -> Tuple[np.ndarray, np.ndarray]:
+        return schedule_positions(buy_dates, timedelta(days=self.sell_horizon), policy=self.holding_policy,
+                                  max_lots=self.max_lots)
 
-        return buy_dates, sell_dates
+    def _check_holding_parameters(self):
+        if self.holding_policy not in HOLDING_POLICIES:
+            raise ValueError(f"Unknown holding policy {self.holding_policy!r}, "
+                             f"available: {', '.join(sorted(HOLDING_POLICIES))}")
+        if self.max_lots < 1:
+            raise ValueError(f"max_lots should be at least 1, got {self.max_lots}")
+
+    def _calculate_buy_sell_dates(self, recommendation_dates: list) -> Tuple[np.ndarray, np.ndarray]:
+        self._check_holding_parameters()
+        return self._schedule_positions([self._calc_buy_date(d) for d in recommendation_dates])
 
     def _drop_dates_based_on_elapsed_time(self, dates, elapsed_time: timedelta) -> list:
         """
         Based on the sell horizon we are using we filter out dates.
 
-        The end result only makes sense if dates are sorted ascending (if i is the present, then i+1 is the future)
-        Example: input: dates=[1, 3, 4, 12, 15, 36, 34], elapsed=10 --> new_dates=[1, 12, 36]
+        Example: input: dates=[1, 3, 4, 12, 15, 36, 34], elapsed=10 --> new_dates=[1, 12, 34]
         """
 
-        current_index = 0
-        indices_to_remove = []
-
-        while True:
-            for k in range(current_index + 1, len(dates)):
-                if (dates[k] - dates[current_index]) < elapsed_time:
-                    indices_to_remove.append(k)
-
-            current_index += 1
-
-            if len(indices_to_remove) > 0:
-                if current_index < (max(indices_to_remove) + 1):
-                    current_index = max(indices_to_remove) + 1
-
-            if current_index >= len(dates):
-                break
-
-        new_date_list = deepcopy(dates)
-        for i in indices_to_remove:
-            new_date_list.remove(dates[i])
-
-        return new_date_list
+        buy_dates, _ = schedule_positions(dates, elapsed_time, policy="skip")
+        return [mmb.pd_date_to_datetime(d) for d in buy_dates]
+
+    def _is_using_lots(self) -> bool:
+        return self.holding_policy == "lots" and self.max_lots > 1
+
+    def _buy_size(self, nb_sells: int) -> float:
+        if not self._is_using_lots():
+            return super()._buy_size(nb_sells)
+        # The cash is split equally between the lots which are not yet opened. The lots sold on the current bar are
+        # still in `self.trades`, but the broker closes them before it opens the new lot
+        nb_open_lots = max(len(self.trades) - nb_sells, 0)
+        return 0.999 / (self.max_lots - nb_open_lots)
+
+    def _close_position(self, nb_sells: int):
+        if not self._is_using_lots():
+            return super()._close_position(nb_sells)
+        # The lots have the same holding period, so the oldest ones should be sold
+        for trade in self.trades[:nb_sells]:
+            trade.close()
@@ -0,0 +1,335 @@
+import concurrent.futures
+import os
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import backtesting
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from mad_money_backtesting.instrumentation import disable_instrumentation, enable_instrumentation, \
+    get_instrumentation
+from mad_money_backtesting.result_cache import ResultCache, fingerprint, hash_prices, refresh_range_stats, \
+    relevant_bars
+from mad_money_backtesting.results import summarize_backtesting_results
+from mad_money_backtesting.results_store import ResultsStore
+from mad_money_backtesting.untils import pd_date_to_datetime
+from mad_money_backtesting.vectorized import run_vectorized
+
+ENGINES = {"vectorized", "backtesting"}
+
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# The shared price arrays of the worker processes (set by `_attach_shared_prices`)
+_worker_prices: "SharedPrices" = None
+
+
+class SharedPrices:
+    """
+    Stock data of all the symbols packed into two shared memory blocks (timestamps and OHLCV values),
+    so the worker processes can read them without pickling every DataFrame
+    """
+
+    def __init__(self, layout: Dict[str, Tuple[int, int, str]], nb_bars: int, timestamps_name: str,
+                 values_name: str):
+        # Symbol -> (first row, last row (exclusive), timezone)
+        self.layout = layout
+        self.nb_bars = nb_bars
+        self.timestamps_name = timestamps_name
+        self.values_name = values_name
+
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._timestamps: np.ndarray = None
+        self._values: np.ndarray = None
+
+    @classmethod
+    def create(cls, prices: Dict[str, pd.DataFrame]) -> "SharedPrices":
+        layout = {}
+        start = 0
+        for symbol, stock_df in prices.items():
+            layout[symbol] = (start, start + len(stock_df), str(stock_df.index.tz) if stock_df.index.tz else None)
+            start += len(stock_df)
+
+        # Shared memory blocks can not be empty
+        nb_bars = max(start, 1)
+        timestamps_block = shared_memory.SharedMemory(create=True, size=nb_bars * 8)
+        values_block = shared_memory.SharedMemory(create=True, size=nb_bars * len(PRICE_COLUMNS) * 8)
+
+        shared_prices = cls(layout, nb_bars, timestamps_block.name, values_block.name)
+        shared_prices._set_blocks(timestamps_block, values_block)
+
+        for symbol, stock_df in prices.items():
+            first_row, last_row, _ = layout[symbol]
+            shared_prices._timestamps[first_row:last_row] = stock_df.index.values.astype("datetime64[ns]").view(np.int64)
+            shared_prices._values[first_row:last_row] = stock_df.reindex(columns=PRICE_COLUMNS,
+                                                                         fill_value=0).to_numpy(dtype=float)
+
+        return shared_prices
+
+    def _set_blocks(self, timestamps_block: shared_memory.SharedMemory, values_block: shared_memory.SharedMemory):
+        self._blocks = [timestamps_block, values_block]
+        self._timestamps = np.ndarray((self.nb_bars,), dtype=np.int64, buffer=timestamps_block.buf)
+        self._values = np.ndarray((self.nb_bars, len(PRICE_COLUMNS)), dtype=float, buffer=values_block.buf)
+
+    def attach(self):
+        """
+        Attaches to the blocks which were created by another process
+        """
+
+        if self._blocks:
+            # The blocks are already mapped (e.g. the worker was forked from the creator process)
+            return
+
+        names = (self.timestamps_name, self.values_name)
+        try:
+            # The creator process is responsible for removing the blocks, the workers should not track them
+            blocks = [shared_memory.SharedMemory(name=name, track=False) for name in names]
+        except TypeError:
+            # Before Python 3.13 the workers share the resource tracker of the creator process
+            blocks = [shared_memory.SharedMemory(name=name) for name in names]
+        self._set_blocks(*blocks)
+
+    def __getstate__(self):
+        # Only the names of the blocks are sent to the workers
+        return {"layout": self.layout, "nb_bars": self.nb_bars, "timestamps_name": self.timestamps_name,
+                "values_name": self.values_name}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def stock_df(self, symbol: str) -> pd.DataFrame:
+        """
+        Stock data of a symbol in the format we use for backtesting (with a "Date" column)
+        """
+
+        first_row, last_row, tz = self.layout[symbol]
+        index = pd.DatetimeIndex(self._timestamps[first_row:last_row].astype("datetime64[ns]"))
+        if tz is not None:
+            index = index.tz_localize("UTC").tz_convert(tz)
+
+        stock_df = pd.DataFrame(self._values[first_row:last_row], index=index, columns=PRICE_COLUMNS)
+        stock_df["Date"] = stock_df.index
+        return stock_df
+
+    def close(self, unlink: bool = False):
+        self._timestamps, self._values = None, None
+        for block in self._blocks:
+            block.close()
+            if unlink:
+                block.unlink()
+        self._blocks = []
+
+
+class BatchResult:
+    """
+    Results of a batch backtest: the stats for every symbol and the symbols which failed
+    (these are the symbols which were not backtested, but Cramer mentioned them)
+
+    If the batch was run with a `ResultsStore`, the stats are only in the store (and `results` is empty)
+    """
+
+    def __init__(self, results: Dict[str, pd.Series], failed: Dict[str, str], store: ResultsStore = None):
+        self.results = results
+        self.failed = failed
+        self.store = store
+
+    def summarize(self, include_parameters: bool = True, sort_by: str = None) -> pd.DataFrame:
+        if self.store is not None:
+            return self.store.summarize(include_parameters=include_parameters, sort_by=sort_by)
+        return summarize_backtesting_results(results=list(self.results.values()),
+                                             symbols=list(self.results.keys()),
+                                             include_parameters=include_parameters,
+                                             sort_by=sort_by)
+
+
+def _attach_shared_prices(shared_prices: SharedPrices, instrumentation_settings: dict = None):
+    global _worker_prices
+    shared_prices.attach()
+    _worker_prices = shared_prices
+
+    # The workers record their own instrumentation (a forked worker should not continue the one of the parent),
+    # which is sent back per symbol with the results
+    if instrumentation_settings is not None:
+        enable_instrumentation(**instrumentation_settings)
+    else:
+        disable_instrumentation()
+
+
+def _with_open_trades(trades: pd.DataFrame, strategy: backtesting.Strategy) -> pd.DataFrame:
+    """
+    backtesting.py only reports the closed trades, the positions which are still open at the end are added the same
+    way as the vectorized engine has them (no exit, so the ledger adds up to the final equity)
+    """
+
+    if len(strategy.trades) == 0:
+        return trades
+
+    open_trades = pd.DataFrame({"Size": [t.size for t in strategy.trades],
+                                "EntryBar": [t.entry_bar for t in strategy.trades],
+                                "ExitBar": -1,
+                                "EntryPrice": [t.entry_price for t in strategy.trades],
+                                "ExitPrice": np.nan,
+                                "PnL": np.nan,
+                                "ReturnPct": np.nan,
+                                "EntryTime": [t.entry_time for t in strategy.trades],
+                                "ExitTime": pd.NaT})
+    return pd.concat([trades, open_trades], ignore_index=True) if len(trades) else open_trades
+
+
+def _backtest_single_stock(stock_df: pd.DataFrame, strategy_class, recommendation_dates: list, config: dict) -> pd.Series:
+    if len(stock_df) < 1:
+        raise ValueError("There is not data in the dataframe")
+
+    if config["engine"] == "vectorized":
+        return run_vectorized(stock_df, strategy_class, recommendation_dates, config["cash"], config["commission"],
+                              config["stop_loss_perc"], config["take_profit_perc"], **config["strategy_params"])
+
+    bt = backtesting.Backtest(stock_df, strategy_class, cash=config["cash"], commission=config["commission"],
+                              trade_on_close=True)
+    results = bt.run(recommendation_dates=recommendation_dates,
+                     stop_loss_perc=config["stop_loss_perc"],
+                     take_profit_perc=config["take_profit_perc"],
+                     **config["strategy_params"])
+    results["_trades"] = _with_open_trades(results["_trades"], results["_strategy"])
+    # The strategy instance holds the whole broker and data, only its name and parameters are kept
+    results["_strategy"] = str(results["_strategy"])
+    if config["drop_equity_curve"]:
+        # The store and the cache do not keep the equity curve, it should not be sent back from the worker
+        results = results.drop("_equity_curve")
+    return results
+
+
+def _run_chunk(strategy_class, chunk: List[Tuple[str, list]], config: dict) -> List[Tuple[str, pd.Series, str]]:
+    """
+    Backtests a chunk of symbols in a worker process, errors are collected per symbol
+    """
+
+    instrumentation = get_instrumentation()
+    chunk_results = []
+    for symbol, recommendation_dates in chunk:
+        try:
+            with instrumentation.symbol(symbol), instrumentation.profile(symbol), instrumentation.stage("backtest"):
+                stock_df = _worker_prices.stock_df(symbol)
+                result = _backtest_single_stock(stock_df, strategy_class, recommendation_dates, config)
+            if instrumentation.enabled:
+                result["_instrumentation"] = instrumentation.symbol_report(symbol, pop=True)
+            chunk_results.append((symbol, result, None))
+        except Exception as e:
+            chunk_results.append((symbol, None, str(e)))
+    return chunk_results
+
+
+def run_batch(strategy_class,
+              recommendations_df: pd.DataFrame,
+              prices: Dict[str, pd.DataFrame],
+              cash: float,
+              commission: float,
+              stop_loss_perc: float = None,
+              take_profit_perc: float = None,
+              engine: str = "vectorized",
+              max_workers: int = None,
+              chunk_size: int = 16,
+              progress: bool = True,
+              store: ResultsStore = None,
+              cache: ResultCache = None,
+              **strategy_params) -> BatchResult:
+    """
+    Backtests every symbol of the recommendations DataFrame in a process pool
+
+    The stock data is put into shared memory once, the workers only receive the symbols and the recommendation
+    dates (in chunks of `chunk_size` symbols). Symbols without stock data, or for which the backtest failed,
+    are collected in `BatchResult.failed`
+
+    With a `store`, the results are appended to it as they arrive (with their trades), instead of keeping every
+    result Series in memory
+
+    With a `cache`, the symbols whose inputs (strategy, parameters, recommendation dates, stock data, cash and
+    commission) did not change since a previous run are not backtested again, their results are read from the cache.
+    Only the bars up to the last trade are part of the key (see `result_cache.relevant_bars`), so new bars after it
+    (e.g. the prices of a new day) do not invalidate it, the start, end and buy & hold return of a cached result are
+    updated for the current bars (the other whole-range stats of the backtesting.py engine, e.g. the Sharpe ratio,
+    are the ones of the run which cached it). The results of the store and the cache do not have the `_equity_curve`
+    """
+
+    assert engine in ENGINES, f"Engine {engine} not available"
+
+    instrumentation = get_instrumentation()
+    instrumentation_settings = {"profile_dir": instrumentation.profile_dir} if instrumentation.enabled else None
+
+    config = {"engine": engine,
+              "cash": cash,
+              "commission": commission,
+              "stop_loss_perc": stop_loss_perc,
+              "take_profit_perc": take_profit_perc,
+              "strategy_params": strategy_params,
+              "drop_equity_curve": store is not None or cache is not None}
+    store_params = {"stop_loss_perc": stop_loss_perc, "take_profit_perc": take_profit_perc, **strategy_params}
+
+    results = {}
+    failed = {}
+    tasks = []
+    cache_keys = {}
+    nb_cached = 0
+
+    def _collect_result(symbol: str, result: pd.Series):
+        if store is not None:
+            store.append(symbol, strategy_class, store_params, result, trades=result["_trades"])
+        else:
+            results[symbol] = result
+
+    for symbol, dates in recommendations_df.groupby("symbol", observed=True, sort=False)["date"]:
+        if symbol not in prices or len(prices[symbol]) == 0:
+            failed[symbol] = f"There is not data in the dataframe for: {symbol}"
+            continue
+        recommendation_dates = [pd_date_to_datetime(d) for d in dates]
+
+        if cache is not None:
+            nb_bars = relevant_bars(strategy_class, prices[symbol], recommendation_dates, strategy_params)
+            cache_keys[symbol] = fingerprint(strategy_class, store_params, recommendation_dates,
+                                             hash_prices(prices[symbol], nb_bars), cash, commission, engine)
+            cached_result = cache.get(cache_keys[symbol])
+            if cached_result is not None:
+                _collect_result(symbol, refresh_range_stats(cached_result, prices[symbol]))
+                nb_cached += 1
+                continue
+
+        tasks.append((symbol, recommendation_dates))
+
+    if cache is not None:
+        print(f"{nb_cached} symbols are loaded from the result cache, {len(tasks)} symbols will be backtested")
+
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    shared_prices = SharedPrices.create({symbol: prices[symbol] for symbol, _ in tasks})
+
+    pbar = tqdm(total=len(tasks), desc="Backtesting...", disable=not progress)
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                                    initializer=_attach_shared_prices,
+                                                    initargs=(shared_prices, instrumentation_settings)) as executor:
+            futures = {executor.submit(_run_chunk, strategy_class, chunk, config): chunk for chunk in chunks}
+
+            for f in concurrent.futures.as_completed(futures):
+                try:
+                    chunk_results = f.result()
+                except Exception as e:
+                    # The whole worker failed (e.g. it was killed), every symbol of the chunk is marked as failed
+                    chunk_results = [(symbol, None, str(e)) for symbol, _ in futures[f]]
+
+                for symbol, result, error in chunk_results:
+                    if error is None:
+                        if "_instrumentation" in result:
+                            instrumentation.add_symbol_report(symbol, result["_instrumentation"])
+                        if cache is not None:
+                            # The timings of this run should not be reused with the result
+                            cache.put(cache_keys[symbol], result.drop("_instrumentation", errors="ignore"))
+                        _collect_result(symbol, result)
+                    else:
+                        failed[symbol] = error
+                pbar.update(len(chunk_results))
+    finally:
+        pbar.close()
+        shared_prices.close(unlink=True)
+
+    return BatchResult(results, failed, store)
@@ -0,0 +1,265 @@
+"""
+Command line interface: python -m mad_money_backtesting {scrape,backtest,summarize} ...
+
+Only `argparse` is imported at the start, the dependencies of a command are loaded when it runs
+(e.g. `scrape` never loads `backtesting`, and `--help` does not load pandas)
+"""
+
+import argparse
+from pathlib import Path
+from typing import List
+
+STRATEGIES = ["AfterShowBuyNextDayCloseSell", "AfterShowBuyNextDayOpenSell", "NextDayOpenBuyNextDayCloseSell",
+              "BuyAndHold"]
+
+
+def _parse_param(text: str) -> tuple:
+    """
+    Strategy parameter from the command line: "sell_horizon=7" -> ("sell_horizon", 7)
+    """
+
+    if "=" not in text:
+        raise argparse.ArgumentTypeError(f"Parameter should be in name=value format: {text}")
+    name, value = text.split("=", 1)
+    for value_type in (int, float):
+        try:
+            return name, value_type(value)
+        except ValueError:
+            pass
+    return name, value
+
+
+def add_scrape_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-f", "--from-date", type=str, default="2020-01-01",
+                        help="The scraping will start at this date.")
+    parser.add_argument("-t", "--to-date", type=str, default=None,
+                        help="The scraping will end at this date. If not defined, then today will be used")
+    parser.add_argument("-o", "--output", type=str, default="mad_money.csv", help="Output file path")
+    parser.add_argument("-p", "--max-price", type=int, default=1000)
+    parser.add_argument("-c", "--cache-dir", type=str, default=None,
+                        help="Every scraped date is stored here, and the already scraped dates are not scraped again")
+    parser.add_argument("--keep-html", action="store_true",
+                        help="The scraped pages are also stored in the cache directory (only with --cache-dir)")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="Only the dates after the last date of the existing (raw) output are scraped, "
+                             "and they are appended to it")
+    parser.add_argument("--parser", type=str, default="bs4", choices=["bs4", "lxml"],
+                        help="Parser of the page, lxml is faster as it only parses the table with the calls")
+    parser.add_argument("-s", "--stream-to", type=str, default=None,
+                        help="Every scraped date is transformed and written to this monthly partitioned dataset "
+                             "right away (instead of the csv outputs)")
+    parser.add_argument("--stream-format", type=str, default="parquet", choices=["parquet", "csv"],
+                        help="File format of the partitions of the streamed dataset")
+
+
+def add_backtest_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-r", "--recommendations", type=str, required=True,
+                        help="Transformed recommendations: .csv or .parquet file, or a partitioned dataset directory")
+    parser.add_argument("--prices", type=str, required=True, help="Directory of the price store")
+    parser.add_argument("--no-download", action="store_true",
+                        help="Only the stored prices are used, nothing is downloaded")
+    parser.add_argument("-s", "--strategy", type=str, default="BuyAndHold", choices=STRATEGIES)
+    parser.add_argument("-P", "--param", type=_parse_param, action="append", default=[],
+                        help="Strategy parameter, e.g. -P sell_horizon=7 -P holding_policy=extend")
+    parser.add_argument("--start", type=str, default=None, help="First recommendation date (inclusive)")
+    parser.add_argument("--end", type=str, default=None, help="Last recommendation date (exclusive)")
+    parser.add_argument("--calls", type=str, nargs="+", default=None, help="Only these calls, e.g. buy positive")
+    parser.add_argument("--cash", type=float, default=1000)
+    parser.add_argument("--commission", type=float, default=0.002)
+    parser.add_argument("--stop-loss", type=float, default=None, help="Stop loss percentage, e.g. 0.05")
+    parser.add_argument("--take-profit", type=float, default=None, help="Take profit percentage, e.g. 0.1")
+    parser.add_argument("--engine", type=str, default="vectorized", choices=["vectorized", "backtesting"])
+    parser.add_argument("-w", "--max-workers", type=int, default=None)
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="Result cache, only the symbols with changed inputs are backtested again")
+    parser.add_argument("--store", type=str, default=None,
+                        help="The results (and trades) are saved to this results store directory")
+    parser.add_argument("-o", "--output", type=str, default="backtest_results.csv", help="Output file path")
+    parser.add_argument("--timings", type=str, default=None,
+                        help="The stage timings and counters of the run are written to this JSON file")
+
+
+def add_summarize_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("store", type=str, help="Results store directory")
+    parser.add_argument("--by", type=str, nargs="+", default=None,
+                        help="Group by these columns (default: the strategy and every parameter)")
+    parser.add_argument("--column", type=str, default="Return [%]", help="Aggregated result column")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Output file path (otherwise printed)")
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m mad_money_backtesting")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scrape_parser = subparsers.add_parser("scrape", help="Scrape the recommendations of Cramer")
+    add_scrape_arguments(scrape_parser)
+    scrape_parser.set_defaults(func=scrape)
+
+    backtest_parser = subparsers.add_parser("backtest", help="Backtest a strategy for every recommended symbol")
+    add_backtest_arguments(backtest_parser)
+    backtest_parser.set_defaults(func=backtest)
+
+    summarize_parser = subparsers.add_parser("summarize", help="Aggregate the results of a results store")
+    add_summarize_arguments(summarize_parser)
+    summarize_parser.set_defaults(func=summarize)
+
+    return parser
+
+
+def _stream(args):
+    import pandas as pd
+
+    import mad_money_backtesting as mmb
+
+    dataset = mmb.PartitionedDataset(args.stream_to, args.stream_format)
+
+    from_date = args.from_date
+    if args.incremental:
+        last_date = dataset.last_date()
+        if last_date is not None:
+            # The last date is scraped again (and replaced), as it could have changed since the last run
+            from_date = max(pd.to_datetime(args.from_date), last_date)
+            print(f"Incremental scraping from {from_date.date()}")
+
+    try:
+        failed_dates = mmb.stream_cramer_calls(dataset, from_date, args.to_date, max_price=args.max_price,
+                                               request_timeout=10, cache_dir=args.cache_dir, parser=args.parser,
+                                               keep_html=args.keep_html)
+    except mmb.PageNotWorkingError:
+        print("Page is not working, so we are not scraping the site")
+        raise SystemExit
+
+    if len(failed_dates) > 0:
+        # The incremental run starts at the last date, so it would not fill the gaps before it
+        print(f"The dataset is missing {len(failed_dates)} dates, scrape them again with "
+              f"--from-date {failed_dates[0]} (without --incremental)")
+        raise SystemExit(1)
+
+
+def scrape(args):
+    import pandas as pd
+
+    import mad_money_backtesting as mmb
+
+    if args.stream_to is not None:
+        _stream(args)
+        return
+
+    output_path = Path(args.output)
+    raw_output_path = Path(f"{output_path.stem}_RAW.csv")
+
+    from_date = args.from_date
+    existing_df = None
+
+    if args.incremental:
+        if raw_output_path.exists():
+            existing_df = pd.read_csv(raw_output_path)
+            # The last date is scraped again, as it could have changed since the last run
+            from_date = max(pd.to_datetime(args.from_date), pd.to_datetime(existing_df["date"]).max())
+            existing_df = existing_df[pd.to_datetime(existing_df["date"]) < from_date]
+            print(f"Incremental scraping from {from_date.date()}")
+        else:
+            print(f"There is no existing data at {raw_output_path}, everything will be scraped")
+
+    try:
+        df = mmb.scrape_cramer_calls(from_date, args.to_date, args.max_price, request_timeout=10,
+                                     cache_dir=args.cache_dir, parser=args.parser, keep_html=args.keep_html)
+    except mmb.PageNotWorkingError:
+        print("Page is not working, so we are not scraping the site")
+        raise SystemExit
+
+    if len(df.attrs["failed_dates"]) > 0:
+        # A partial output would look complete to the next incremental run, so the outputs are not touched
+        print(f"{len(df.attrs['failed_dates'])} dates could not be scraped, {raw_output_path} and {output_path} are "
+              f"not updated. Run the command again (with --cache-dir the finished dates are not scraped again)")
+        raise SystemExit(1)
+
+    if existing_df is not None:
+        df = pd.concat([existing_df, df], ignore_index=True)
+    df.to_csv(raw_output_path, index=False)
+
+    df = mmb.transform_cramer_call_raw_dataframe(df=df)
+    df.to_csv(output_path, index=False)
+
+
+def _read_recommendations(path: Path):
+    import mad_money_backtesting as mmb
+
+    if path.is_dir():
+        return mmb.RecommendationStore(mmb.PartitionedDataset(path).read())
+    if path.suffix == ".parquet":
+        return mmb.RecommendationStore.from_parquet(path)
+    return mmb.RecommendationStore.from_csv(path)
+
+
+def backtest(args):
+    import pandas as pd
+
+    import mad_money_backtesting as mmb
+
+    instrumentation = mmb.enable_instrumentation() if args.timings is not None else None
+
+    recommendations = _read_recommendations(Path(args.recommendations))
+    df = recommendations.query(start=args.start, end=args.end, calls=args.calls)
+    if len(df) == 0:
+        print("There are no recommendations to backtest")
+        raise SystemExit(1)
+
+    # The prices are needed from the first recommendation until today (the positions can be held until the end)
+    prices_start = df["date"].min().normalize()
+    prices_end = pd.Timestamp.today().normalize() + pd.Timedelta(days=1)
+
+    price_store = mmb.PriceStore(args.prices)
+    if not args.no_download:
+        price_store.prefetch(df, prices_start, prices_end)
+
+    prices = {}
+    for symbol in df["symbol"].unique():
+        try:
+            prices[symbol] = price_store.get(symbol, prices_start, prices_end, download=False)
+        except Exception as e:
+            print(f"There was a problem with {symbol} - {e}")
+
+    strategy_class = getattr(mmb, args.strategy)
+    store = mmb.ResultsStore(args.store) if args.store is not None else None
+    cache = mmb.ResultCache(args.cache_dir) if args.cache_dir is not None else None
+
+    result = mmb.run_batch(strategy_class, df, prices, args.cash, args.commission, args.stop_loss, args.take_profit,
+                           engine=args.engine, max_workers=args.max_workers, store=store, cache=cache,
+                           **dict(args.param))
+
+    results_df = result.summarize(sort_by="Return [%]")
+    results_df.to_csv(args.output)
+    print(f"{len(results_df)} symbols are backtested ({len(result.failed)} failed), "
+          f"mean return: {results_df['Return [%]'].mean():.2f}%, median return: "
+          f"{results_df['Return [%]'].median():.2f}%. The results are saved to {args.output}")
+
+    if store is not None:
+        store.save()
+    if instrumentation is not None:
+        instrumentation.to_json(args.timings)
+        mmb.disable_instrumentation()
+
+
+def summarize(args):
+    import pandas as pd
+
+    import mad_money_backtesting as mmb
+
+    store = mmb.ResultsStore.load(args.store)
+    if len(store) == 0:
+        print(f"There are no results at {args.store}")
+        raise SystemExit(1)
+
+    aggregated_df = store.aggregate(by=args.by, column=args.column)
+    if args.output is not None:
+        aggregated_df.to_csv(args.output, index=False)
+        print(f"The summary is saved to {args.output}")
+    else:
+        with pd.option_context("display.max_columns", None, "display.width", 200):
+            print(aggregated_df.to_string(index=False))
+
+
+def main(argv: List[str] = None):
+    args = get_parser().parse_args(argv)
+    args.func(args)
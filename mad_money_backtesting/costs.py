@@ -0,0 +1,204 @@
+import itertools
+from typing import Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from mad_money_backtesting.results_store import KEY_COLUMNS, STAT_COLUMNS, ResultsStore
+from mad_money_backtesting.vectorized import POSITION_SIZE
+
+COST_COLUMNS = ["Fixed [$]", "Percentage", "Per Share [$]", "Slippage"]
+
+
+class CostModel:
+    """
+    Trading costs of a broker (every component is optional):
+
+    - fixed: $ per order
+    - percentage: fraction of the traded value (this is the `commission` of the backtests)
+    - per_share: $ per traded share
+    - slippage: fraction of the price we lose on every fill (buys are filled higher, sells lower), e.g. half of
+    the bid-ask spread
+    """
+
+    def __init__(self, fixed: float = 0.0, percentage: float = 0.0, per_share: float = 0.0, slippage: float = 0.0,
+                 name: str = None):
+        self.fixed = fixed
+        self.percentage = percentage
+        self.per_share = per_share
+        self.slippage = slippage
+        self.name = name if name is not None else \
+            f"fixed={fixed:g},percentage={percentage:g},per_share={per_share:g},slippage={slippage:g}"
+
+    def __repr__(self) -> str:
+        return f"CostModel({self.name})"
+
+
+def cost_grid(fixed: Iterable[float] = (0.0,), percentage: Iterable[float] = (0.0,),
+              per_share: Iterable[float] = (0.0,), slippage: Iterable[float] = (0.0,)) -> List[CostModel]:
+    """
+    Every combination of the cost components
+    """
+
+    return [CostModel(*values) for values in itertools.product(fixed, percentage, per_share, slippage)]
+
+
+def _ledger_matrix(trades: pd.DataFrame, run_index: np.ndarray, nb_runs: int, column: str) -> np.ndarray:
+    """
+    (runs x trade ordinal) matrix of a ledger column, padded with NaN
+    """
+
+    trade_ordinals = trades["Trade"].to_numpy(dtype=np.int64)
+    matrix = np.full((nb_runs, trade_ordinals.max() + 1 if len(trades) else 0), np.nan)
+    matrix[run_index, trade_ordinals] = trades[column].to_numpy(dtype=float)
+    return matrix
+
+
+def _replay(cash: np.ndarray, entry_prices: np.ndarray, exit_prices: np.ndarray, last_prices: np.ndarray,
+            fixed: np.ndarray, percentage: np.ndarray, per_share: np.ndarray, slippage: np.ndarray) -> np.ndarray:
+    """
+    Final equity of every (run, scenario): the trades of the runs are replayed in order with the sizing of the
+    engines (`POSITION_SIZE` of the cash after the previous trades), so only the loop over the trade ordinals is
+    sequential, every step is vectorized across the runs and the scenarios
+
+    The prices are (runs x trades) matrices (NaN where a run has no such trade, the exit price is NaN for the
+    position which is still open, `last_prices` is its valuation), the cost components are (scenarios,) arrays
+    """
+
+    equity = np.repeat(cash[:, None], len(fixed), axis=1)
+    for k in range(entry_prices.shape[1]):
+        entry = entry_prices[:, k, None] * (1 + slippage)
+        has_trade = ~np.isnan(entry)
+        is_closed = ~np.isnan(exit_prices[:, k, None])
+
+        with np.errstate(invalid="ignore"):
+            sizes = np.floor_divide(equity * POSITION_SIZE - fixed, entry * (1 + percentage) + per_share)
+        sizes = np.where(has_trade, np.maximum(sizes, 0), 0)
+        entry_cost = sizes * (entry * (1 + percentage) + per_share) + np.where(sizes > 0, fixed, 0)
+
+        exit_ = exit_prices[:, k, None] * (1 - slippage)
+        exit_value = sizes * (exit_ * (1 - percentage) - per_share) - np.where(sizes > 0, fixed, 0)
+        # The position which is still open is valued at the last price, its exit costs are not paid yet
+        open_value = sizes * last_prices[:, None]
+
+        equity = equity + np.where(is_closed, np.nan_to_num(exit_value), np.nan_to_num(open_value)) - \
+            np.nan_to_num(entry_cost)
+
+    return equity
+
+
+def reprice_ledgers(runs: pd.DataFrame, trades: pd.DataFrame, scenarios: Sequence[CostModel], commission: float,
+                    cash: float = None) -> pd.DataFrame:
+    """
+    Re-prices the stored trade ledgers of the runs (see `ResultsStore.to_frame()` and `ResultsStore.trades()`)
+    under every cost scenario, without running the backtests again
+
+    The entries and exits of the trades do not depend on the costs, only the position sizes and the cash do.
+    `commission` is the one which was used for the runs: the open positions are valued with it. The initial cash
+    is calculated from the stored "Return [%]" and "Equity Final [$]" if `cash` is not defined
+
+    The runs should hold a single position at a time (e.g. the "lots" holding policy of `BuyAndHold` is not
+    supported). Returns a row per (run, scenario) with the recalculated "Return [%]" and "Equity Final [$]"
+    (NaN for the runs whose ledger does not add up to their stored final equity)
+    """
+
+    runs = runs.reset_index(drop=True)
+    nb_runs = len(runs)
+
+    if cash is None:
+        initial_cash = runs["Equity Final [$]"].to_numpy(dtype=float) / (1 + runs["Return [%]"].to_numpy(
+            dtype=float) / 100)
+    else:
+        initial_cash = np.full(nb_runs, float(cash))
+
+    run_keys = pd.MultiIndex.from_arrays([runs["Batch"].astype(str), runs["Run"]])
+    run_index = run_keys.get_indexer(pd.MultiIndex.from_arrays([trades["Batch"].astype(str), trades["Run"]]))
+    order = np.lexsort((trades["Trade"].to_numpy(dtype=np.int64), run_index))
+    order = order[run_index[order] >= 0]
+    trades, run_index = trades.iloc[order], run_index[order]
+
+    exit_bars = trades["ExitBar"].to_numpy(dtype=float)
+    previous_exit_bars = np.r_[np.nan, exit_bars[:-1]]
+    is_same_run = np.r_[False, run_index[1:] == run_index[:-1]]
+    if np.any(is_same_run & (trades["EntryBar"].to_numpy(dtype=float) < previous_exit_bars)):
+        raise NotImplementedError("The runs should hold a single position at a time")
+
+    entry_prices = _ledger_matrix(trades, run_index, nb_runs, "EntryPrice")
+    exit_prices = _ledger_matrix(trades, run_index, nb_runs, "ExitPrice")
+    sizes = _ledger_matrix(trades, run_index, nb_runs, "Size")
+
+    # The price at which the still open positions were valued: replaying the runs with their own costs gives the
+    # cash before the open position, the rest of the final equity is the value of the position
+    zero = np.zeros(1)
+    last_prices = np.full(nb_runs, np.nan)
+    has_open = np.any(~np.isnan(entry_prices) & np.isnan(exit_prices), axis=1)
+    if np.any(has_open):
+        closed_entry_prices = np.where(np.isnan(exit_prices), np.nan, entry_prices)
+        cash_before_open = _replay(initial_cash, closed_entry_prices, exit_prices, last_prices, zero,
+                                   np.full(1, commission), zero, zero)[:, 0]
+        open_trades = np.isnan(exit_prices) & ~np.isnan(entry_prices)
+        open_sizes = np.where(open_trades, sizes, 0).sum(axis=1)
+        open_entry_costs = np.where(open_trades, sizes * entry_prices * (1 + commission), 0).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            last_prices = np.where(has_open, (runs["Equity Final [$]"].to_numpy(dtype=float) - cash_before_open +
+                                              open_entry_costs) / open_sizes, np.nan)
+
+    last_prices = np.nan_to_num(last_prices)
+
+    # The runs without a complete stored ledger (e.g. the ledgers of the backtesting.py engine were stored without the
+    # positions which are still open at the end before) can not be re-priced
+    replayed_equity = _replay(initial_cash, entry_prices, exit_prices, last_prices, zero, np.full(1, commission), zero,
+                              zero)[:, 0]
+    final_equity = runs["Equity Final [$]"].to_numpy(dtype=float)
+    is_incomplete = ~np.isclose(replayed_equity, final_equity, rtol=1e-9, atol=1e-6)
+    if np.any(is_incomplete):
+        print(f"{is_incomplete.sum()} runs are not re-priced, their ledgers do not add up to their final equity")
+
+    fixed, percentage, per_share, slippage = (np.array([getattr(s, k) for s in scenarios], dtype=float)
+                                              for k in ("fixed", "percentage", "per_share", "slippage"))
+    equity = _replay(initial_cash, entry_prices, exit_prices, last_prices, fixed, percentage, per_share, slippage)
+    equity[is_incomplete] = np.nan
+
+    # The stats which are not recalculated are dropped
+    repriced_df = runs.drop(columns=["Return [%]", "Equity Final [$]", "Equity Peak [$]", "Win Rate [%]"])
+    repriced_df = repriced_df.loc[np.repeat(np.arange(nb_runs), len(scenarios))].reset_index(drop=True)
+    repriced_df["Scenario"] = pd.Categorical(np.tile([s.name for s in scenarios], nb_runs),
+                                             categories=list(dict.fromkeys(s.name for s in scenarios)))
+    for column, values in zip(COST_COLUMNS, (fixed, percentage, per_share, slippage)):
+        repriced_df[column] = np.tile(values, nb_runs)
+    repriced_df["Equity Final [$]"] = equity.ravel()
+    repriced_df["Return [%]"] = (equity - initial_cash[:, None]).ravel() / np.repeat(initial_cash,
+                                                                                     len(scenarios)) * 100
+    return repriced_df
+
+
+def reprice(store: ResultsStore, scenarios: Sequence[CostModel], commission: float,
+            cash: float = None) -> pd.DataFrame:
+    """
+    `reprice_ledgers` for every run of a results store (which was created with a `root`, so it has the ledgers)
+    """
+
+    if store.root is None:
+        raise ValueError("The results store has no trade ledgers (it was created without a root), so the runs can "
+                         "not be re-priced")
+    return reprice_ledgers(store.to_frame(), store.trades(), scenarios, commission, cash)
+
+
+def cost_sensitivity(repriced_df: pd.DataFrame, by: Sequence[str] = None,
+                     column: str = "Return [%]") -> pd.DataFrame:
+    """
+    Mean and median of a result column (across the symbols) for every cost scenario, and by default for every
+    strategy and parameter combination
+    """
+
+    if by is None:
+        excluded_columns = KEY_COLUMNS + STAT_COLUMNS + ["Scenario"] + COST_COLUMNS
+        by = ["Strategy"] + [c for c in repriced_df.columns if c not in excluded_columns]
+    repriced_df = repriced_df[list(by) + ["Scenario"] + COST_COLUMNS + [column]].assign(
+        hit=(repriced_df[column] > 0) * 100.0)
+    grouped = repriced_df.groupby(list(by) + ["Scenario"] + COST_COLUMNS, dropna=False, observed=True)
+
+    return pd.DataFrame({"Mean": grouped[column].mean(),
+                         "Median": grouped[column].median(),
+                         "Hit Rate [%]": grouped["hit"].mean(),
+                         "Runs": grouped[column].size()}).reset_index()
@@ -1,24 +1,29 @@
-import concurrent.futures
 import datetime
-import re
 from pathlib import Path
-from typing import Union
+from typing import Iterator, List, Tuple, Union
 
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+from mad_money_backtesting.instrumentation import get_instrumentation
+from mad_money_backtesting.partitioned_dataset import PartitionedDataset
+from mad_money_backtesting.parsing import columns_to_rows, parse_stock_table
+from mad_money_backtesting.scrape_cache import ScrapeCache, date_to_str
+from mad_money_backtesting.transport import ScraperTransport
+
 URL = "https://madmoney.thestreet.com/screener/index.cfm?showview=stocks&showrows=500"
 HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+PARSERS = {"bs4", "lxml"}
+CALLS = ["sell", "negative", "hold", "positive", "buy", "I have no idea what is this"]
 
 
-def test_if_page_working() -> bool:
+def test_if_page_working(transport: ScraperTransport = None) -> bool:
     """
     Test if the page is working at all
     """
 
-    resp = requests.get(URL)
+    resp = transport.get() if transport is not None else requests.get(URL)
     if resp.status_code == 200:
         return True
     return False
@@ -70,24 +75,16 @@ def _get_data_from_row_in_table(cols: list) -> dict:
             "current_price": current_price}
 
 
-def _download_data_for_date(date: Union[str, datetime.datetime], max_price: int, timeout: int):
-    """
-    Scrapes the data for a single date_format
-    """
-
-    date_format = "%Y-%m-%d"
-    if not isinstance(date, str):
-        date = date.strftime(date_format)
-    else:
-        date = pd.to_datetime(date).strftime(date_format)
+def _parse_rows_with_bs4(html: str) -> list:
+    # Imported here, so the scraper with the lxml parser does not load BeautifulSoup
+    from bs4 import BeautifulSoup
 
-    page = requests.post(url=URL, headers=HEADERS, data=_create_form_input(date, max_price), timeout=timeout)
-    soup = BeautifulSoup(page.text, features="lxml")
+    soup = BeautifulSoup(html, features="lxml")
 
     stock_table = soup.find("table", attrs={"id": "stockTable"})
     stock_table_rows = stock_table.find_all("tr")
 
-    daily_data = []
+    rows = []
 
     for row in stock_table_rows:
         cols_in_table = row.find_all("td")
@@ -98,8 +95,28 @@ def _download_data_for_date(date: Union[str, datetime.datetime], max_price: int,
             # This happens when there is not data in one of the rows in the table
             # Usually this is the first/last row so totally normal no need to panic
             continue
+        rows.append(row_data)
+
+    return rows
+
+
+def _parse_daily_data(html: str, date: str, parser: str = "bs4") -> list:
+    """
+    Parses the table of the page for a single date
+
+    - bs4: BeautifulSoup tree of the whole page
+    - lxml: XPath queries on the stockTable only (see `parsing.parse_stock_table`)
+    """
+
+    assert parser in PARSERS, f"Parser {parser} not available"
+
+    if parser == "lxml":
+        daily_data = columns_to_rows(parse_stock_table(html))
+    else:
+        daily_data = _parse_rows_with_bs4(html)
+
+    for row_data in daily_data:
         row_data["date"] = date
-        daily_data.append(row_data)
 
     if len(daily_data) == 0:
         # If there is no data for a day, it's fine (no show on weekends) but we should
@@ -110,56 +127,184 @@ def _download_data_for_date(date: Union[str, datetime.datetime], max_price: int,
     return daily_data
 
 
-def scrape_cramer_calls(from_date: Union[str, datetime.datetime],
-                        to_date: Union[str, datetime.datetime] = None,
-                        max_price: int = 1000,
-                        request_timeout: int = 10) -> pd.DataFrame:
+def _download_data_for_date(date: Union[str, datetime.datetime], max_price: int, timeout: int,
+                            cache: ScrapeCache = None, transport: ScraperTransport = None, parser: str = "bs4"):
     """
-    Given a date range it scrapes the data day-by-day (in parallel calls) and stores it in a DataFrame
+    Scrapes the data for a single date_format
+    If a cache is defined, the result (rows or the lack of them) is stored as soon as it is available
     """
 
-    if not test_if_page_working():
+    date = date_to_str(date)
+    instrumentation = get_instrumentation()
+
+    with instrumentation.stage("scrape.request"):
+        if transport is not None:
+            page = transport.post(headers=HEADERS, data=_create_form_input(date, max_price))
+        else:
+            page = requests.post(url=URL, headers=HEADERS, data=_create_form_input(date, max_price), timeout=timeout)
+
+    if cache is not None:
+        cache.put_html(date, page.text)
+
+    try:
+        with instrumentation.stage("scrape.parse"):
+            daily_data = _parse_daily_data(page.text, date, parser)
+    except NoDataForDateException:
+        if cache is not None:
+            cache.put_no_data(date)
+        raise
+
+    if cache is not None:
+        cache.put_rows(date, daily_data)
+
+    return daily_data
+
+
+def _scrape_dates(dates_to_scrape: list, transport: ScraperTransport, max_price: int, request_timeout: int,
+                  cache: ScrapeCache, parser: str, failed_dates: List[str]) -> Iterator[Tuple[str, List[dict]]]:
+    """
+    Scrapes the dates with the transport, yields (date, rows) as the dates are finished (see `iter_cramer_calls`)
+    """
+
+    instrumentation = get_instrumentation()
+    nb_retries_before = transport.nb_retries
+
+    if len(dates_to_scrape) > 0 and not test_if_page_working(transport):
         raise PageNotWorkingError()
 
-    all_data = []
+    def _download(date):
+        return _download_data_for_date(date=date, max_price=max_price, timeout=request_timeout, cache=cache,
+                                       transport=transport, parser=parser)
+
+    pbar = tqdm(total=len(dates_to_scrape), desc="Scraping dates from Mad Money...")
+
+    try:
+        for date, data, error in transport.map(_download, dates_to_scrape, no_retry=(NoDataForDateException,)):
+            pbar.update(1)
+            if error is None:
+                instrumentation.count("scrape.dates")
+                instrumentation.count("scrape.rows", len(data))
+                yield date_to_str(date), data
+            elif isinstance(error, NoDataForDateException):
+                print(f"There is no data for the date: {date}. Maybe there was no show, or the data is not recorded yet on their website")
+                instrumentation.count("scrape.no_data_dates")
+                yield date_to_str(date), []
+            else:
+                print(f"Date failed: {date} - {error}, giving up after {transport.max_attempts} attempts")
+                instrumentation.count("scrape.failed_dates")
+                if failed_dates is not None:
+                    failed_dates.append(date_to_str(date))
+    finally:
+        pbar.close()
+        instrumentation.count("http.retries", transport.nb_retries - nb_retries_before)
+
+
+def iter_cramer_calls(from_date: Union[str, datetime.datetime],
+                      to_date: Union[str, datetime.datetime] = None,
+                      max_price: int = 1000,
+                      request_timeout: int = 10,
+                      cache_dir: Union[Path, str] = None,
+                      resume: bool = True,
+                      transport: ScraperTransport = None,
+                      parser: str = "bs4",
+                      failed_dates: List[str] = None,
+                      keep_html: bool = False) -> Iterator[Tuple[str, List[dict]]]:
+    """
+    Generator version of `scrape_cramer_calls`: yields (date, rows) for every finished date as soon as it is
+    available (dates without a show have no rows), so only the dates in progress are kept in memory
+
+    The dates which failed after all the attempts are appended to `failed_dates` (if it is given)
+    """
+
+    instrumentation = get_instrumentation()
 
     if to_date is None:
         to_date = datetime.datetime.now().replace(hour=0, minute=0, second=0)
     dates_to_scrape = list(pd.bdate_range(from_date, to_date))
 
-    pbar = tqdm(total=len(dates_to_scrape), desc="Scraping dates from Mad Money...")
+    cache = ScrapeCache(cache_dir, keep_html=keep_html) if cache_dir is not None else None
+
+    if cache is not None and resume:
+        cached_dates = [d for d in dates_to_scrape if cache.is_cached(d)]
+        cached_dates_set = set(cached_dates)
+        dates_to_scrape = [d for d in dates_to_scrape if d not in cached_dates_set]
+        print(f"{len(cached_dates)} dates are loaded from the cache, {len(dates_to_scrape)} dates will be scraped")
+        instrumentation.count("scrape.cached_dates", len(cached_dates))
+        for date in cached_dates:
+            yield date_to_str(date), cache.get_rows(date)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=None) as executor:
-        while len(dates_to_scrape) > 0:
-            completed_dates = []
-            futures = {}
-
-            for date in dates_to_scrape:
-                f = executor.submit(_download_data_for_date, date=date, max_price=max_price, timeout=request_timeout)
-                futures[f] = date
-
-            for f in concurrent.futures.as_completed(futures):
-                date = futures[f]
-                try:
-                    data = f.result()
-                    all_data.extend(data)
-                    completed_dates.append(date)
-                    pbar.update(1)
-                except NoDataForDateException:
-                    print(f"There is no data for the date: {date}. Maybe there was no show, or the data is not recorded yet on their website")
-                    completed_dates.append(date)
-                    pbar.update(1)
-                except Exception as e:
-                    print(f"Date failed: {date} - {e}, will try again")
-
-            _ = [dates_to_scrape.remove(d) for d in completed_dates]
-
-    pbar.close()
+    if transport is not None:
+        yield from _scrape_dates(dates_to_scrape, transport, max_price, request_timeout, cache, parser, failed_dates)
+        return
+
+    # The transport which is created here is closed at the end (a given transport is closed by the caller)
+    with ScraperTransport(URL, timeout=request_timeout) as transport:
+        yield from _scrape_dates(dates_to_scrape, transport, max_price, request_timeout, cache, parser, failed_dates)
+
+
+def scrape_cramer_calls(from_date: Union[str, datetime.datetime],
+                        to_date: Union[str, datetime.datetime] = None,
+                        max_price: int = 1000,
+                        request_timeout: int = 10,
+                        cache_dir: Union[Path, str] = None,
+                        resume: bool = True,
+                        transport: ScraperTransport = None,
+                        parser: str = "bs4",
+                        keep_html: bool = False) -> pd.DataFrame:
+    """
+    Given a date range it scrapes the data day-by-day (in parallel calls) and stores it in a DataFrame
+
+    If `cache_dir` is defined, every scraped date is stored there. With `resume`, the dates which are already in
+    the cache (and are not stale) are not scraped again, their rows are read from the cache
+
+    The requests are made by the `transport` (concurrency, rate limit and retries are defined there). The dates
+    which failed after all the attempts are listed in `df.attrs["failed_dates"]`
+
+    `parser` is either "bs4" (BeautifulSoup) or "lxml" (faster, it only parses the stockTable). With `keep_html`,
+    the scraped pages are also stored in the cache (e.g. to parse them again later without scraping)
+    """
+
+    all_data = []
+    failed_dates = []
+
+    for _, data in iter_cramer_calls(from_date, to_date, max_price, request_timeout, cache_dir, resume, transport,
+                                     parser, failed_dates, keep_html):
+        all_data.extend(data)
+
+    if len(failed_dates) > 0:
+        print(f"These dates could not be scraped: {sorted(failed_dates)}")
 
     df = pd.DataFrame(all_data)
+    df.attrs["failed_dates"] = sorted(failed_dates)
     return df
 
 
+def stream_cramer_calls(dataset: PartitionedDataset,
+                        from_date: Union[str, datetime.datetime],
+                        to_date: Union[str, datetime.datetime] = None,
+                        **scrape_kwargs) -> List[str]:
+    """
+    Scrapes the date range into the monthly partitioned dataset: every finished date is transformed and written
+    to its partition right away (parse -> transform -> write), so the memory usage does not grow with the range
+
+    The parameters of the scraping are the same as at `scrape_cramer_calls`. Returns the failed dates
+    """
+
+    failed_dates = []
+
+    batches = iter_cramer_calls(from_date, to_date, failed_dates=failed_dates, **scrape_kwargs)
+    transformed_batches = ((date, transform_cramer_call_raw_dataframe(df=pd.DataFrame(rows)))
+                           for date, rows in batches if len(rows) > 0)
+
+    for date, df in transformed_batches:
+        dataset.write_date(date, df)
+
+    if len(failed_dates) > 0:
+        print(f"These dates could not be scraped: {sorted(failed_dates)}")
+
+    return sorted(failed_dates)
+
+
 def transform_cramer_call_raw_dataframe(*, df: pd.DataFrame = None, file_path: Union[Path, str] = None) -> pd.DataFrame:
     """
     Transforms the created dataframe by the `scrape_cramer_calls()` to a more useful format
@@ -172,24 +317,33 @@ def transform_cramer_call_raw_dataframe(*, df: pd.DataFrame = None, file_path: U
     if df is None:
         raise ValueError("Either df ot file_path to a csv file should be given")
 
-    df["date"] = pd.to_datetime(df["date"])
-
-    # Transform call values
-    df["call"] = df["call"].astype(int)
-
-    # Verbose call values
-    call_dict = {1: "sell", 2: "negative", 3: "hold", 4: "positive", 5: "buy", 6: "I have no idea what is this"}
-    df["call"] = df["call"].transform(lambda x: call_dict[x])
-
-    # Convert price to number
-    df["current_price"] = df["current_price"].replace(r"[\$,]", "", regex=True).astype(float)
-
-    # Extract symbol
-    pattern = r"\(([^\)]+)\)"
-    df["symbol"] = df["name"].transform(lambda x: re.findall(pattern, x)[-1].upper())
-
-    # Let's sort the dataframe on 2 levels: date and symbol
-    df = df.sort_values(["date", "name"])
-    df = df.reset_index(drop=True)
+    with get_instrumentation().stage("transform"):
+        df["date"] = pd.to_datetime(df["date"])
+
+        # Verbose call values (the codes are 1-based)
+        call_codes = pd.to_numeric(df["call"], errors="coerce")
+        invalid_calls = ~call_codes.isin(range(1, len(CALLS) + 1))
+        if invalid_calls.any():
+            raise ValueError(f"Unknown call codes (they should be 1-{len(CALLS)}): "
+                             f"{df.loc[invalid_calls, 'call'].unique().tolist()}")
+        df["call"] = pd.Categorical.from_codes(call_codes.astype(int) - 1, categories=CALLS)
+
+        # Convert price to number
+        df["current_price"] = df["current_price"].replace(r"[\$,]", "", regex=True).astype(float)
+
+        # Extract symbol (the last parenthesized part of the name, the greedy .* skips the previous ones)
+        df["symbol"] = df["name"].str.extract(r".*\(([^\)]+)\)", expand=False).str.upper()
+        missing_symbols = df["symbol"].isna()
+        if missing_symbols.any():
+            raise ValueError("The symbol could not be extracted from the names: "
+                             f"{df.loc[missing_symbols, 'name'].tolist()}")
+
+        # The same few values are repeated across the years of the data, categoricals are much smaller than strings
+        df["segment"] = df["segment"].astype("category")
+        df["symbol"] = df["symbol"].astype("category")
+
+        # Let's sort the dataframe on 2 levels: date and symbol
+        df = df.sort_values(["date", "name"])
+        df = df.reset_index(drop=True)
 
     return df
@@ -0,0 +1,160 @@
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from mad_money_backtesting.instrumentation import get_instrumentation
+from mad_money_backtesting.trading_calendar import DEFAULT_TZ, TradingCalendar
+
+# When the position would be opened after a recommendation: (days after the show, hour, minute) in New York time,
+# resolved to the first bar at or after it (the same as the buy dates of the strategies)
+ANCHORS = {
+    "after_show_close": (0, 15, 30),
+    "next_day_open": (1, 9, 30),
+    "next_day_close": (1, 15, 30),
+}
+
+FIELDS = ["Open", "High", "Low", "Close"]
+
+
+class EventWindows:
+    """
+    Prices around the recommendations: `values` is an (events x offsets x fields) masked array, where the offsets
+    are bars relative to the anchor bar of the event. Bars outside of the stock data of the symbol are masked
+
+    `events` has a row per event (symbol, date, call, segment and the time of the anchor bar)
+    """
+
+    def __init__(self, values: np.ma.MaskedArray, offsets: np.ndarray, fields: List[str], events: pd.DataFrame):
+        self.values = values
+        self.offsets = offsets
+        self.fields = fields
+        self.events = events
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def field(self, name: str) -> np.ma.MaskedArray:
+        """
+        (events x offsets) prices of a field
+        """
+
+        return self.values[:, :, self.fields.index(name)]
+
+    def cumulative_returns(self, field: str = "Close") -> np.ma.MaskedArray:
+        """
+        (events x offsets) returns [%] relative to the price at the anchor bar
+        """
+
+        prices = self.field(field)
+        anchor_prices = prices[:, np.flatnonzero(self.offsets == 0)[0]]
+        return (prices / anchor_prices[:, None] - 1) * 100
+
+    def curves(self, by: Union[str, Sequence[str]] = ("call", "segment"), field: str = "Close") -> pd.DataFrame:
+        """
+        Mean and median cumulative return curves for every group of events (e.g. call type and segment)
+
+        Returns a tidy DataFrame with a row per (group, offset), the masked bars are left out of the statistics
+        """
+
+        by = [by] if isinstance(by, str) else list(by)
+        returns = self.cumulative_returns(field).filled(np.nan)
+
+        frames = []
+        for keys, indices in self.events.groupby(by, observed=True, sort=True).indices.items():
+            group_returns = returns[indices]
+            nb_events = np.count_nonzero(~np.isnan(group_returns), axis=0)
+            with np.errstate(all="ignore"):
+                frame = pd.DataFrame({"Offset": self.offsets,
+                                      "Mean [%]": np.nanmean(group_returns, axis=0),
+                                      "Median [%]": np.nanmedian(group_returns, axis=0),
+                                      "Events": nb_events})
+            keys = keys if isinstance(keys, tuple) else (keys,)
+            for i, (column, key) in enumerate(zip(by, keys)):
+                frame.insert(i, column, key)
+            frames.append(frame)
+
+        if len(frames) == 0:
+            return pd.DataFrame(columns=by + ["Offset", "Mean [%]", "Median [%]", "Events"])
+        return pd.concat(frames, ignore_index=True)
+
+
+def _anchor_times(calendar: TradingCalendar, dates: np.ndarray, anchor: str) -> pd.DatetimeIndex:
+    days, hour, minute = ANCHORS[anchor]
+    dates = dates.astype("datetime64[D]") + np.timedelta64(days, "D")
+    return calendar.localize(dates + np.timedelta64(hour * 60 + minute, "m"))
+
+
+def _utc_times(bar_dates: pd.DatetimeIndex) -> np.ndarray:
+    if bar_dates.tz is None:
+        bar_dates = bar_dates.tz_localize(DEFAULT_TZ)
+    return bar_dates.tz_convert("UTC").tz_localize(None).values
+
+
+def event_windows(recommendations_df: pd.DataFrame,
+                  prices: Dict[str, pd.DataFrame],
+                  before: int = 7,
+                  after: int = 35,
+                  anchor: str = "after_show_close",
+                  fields: List[str] = None) -> EventWindows:
+    """
+    Extracts the prices from `before` bars before to `after` bars after the anchor bar of every recommendation
+    (see `ANCHORS`)
+
+    The stock data of the symbols is concatenated, so after finding the anchor bars (a binary search per symbol)
+    all the windows are gathered with a single fancy indexing
+    """
+
+    assert anchor in ANCHORS, f"Anchor {anchor} not available"
+    fields = list(fields or FIELDS)
+    offsets = np.arange(-before, after + 1)
+
+    recommendations_df = recommendations_df.reset_index(drop=True)
+
+    with get_instrumentation().stage("event_study"):
+        symbol_values = []
+        event_rows = []
+        anchor_rows = []
+        anchor_times = []
+        symbol_starts = []
+        symbol_stops = []
+        start = 0
+
+        for symbol, symbol_df in recommendations_df.groupby("symbol", observed=True, sort=False):
+            if symbol not in prices or len(prices[symbol]) == 0:
+                print(f"There was a problem with {symbol} - There is not data in the dataframe")
+                continue
+            stock_df = prices[symbol]
+            calendar = TradingCalendar.from_df(stock_df)
+
+            times = _anchor_times(calendar, pd.DatetimeIndex(symbol_df["date"]).values, anchor)
+            bars = calendar.search(times, side="left")
+            is_valid = bars < len(stock_df)
+
+            symbol_values.append(stock_df[fields].to_numpy(dtype=float))
+            event_rows.append(symbol_df.index.to_numpy()[is_valid])
+            anchor_rows.append(start + bars[is_valid])
+            anchor_times.append(_utc_times(calendar.bar_dates[bars[is_valid]]))
+            symbol_starts.append(np.full(is_valid.sum(), start))
+            symbol_stops.append(np.full(is_valid.sum(), start + len(stock_df)))
+            start += len(stock_df)
+
+        if len(symbol_values) == 0:
+            raise RuntimeError("None of the symbols have stock data")
+
+        all_values = np.concatenate(symbol_values)
+        anchor_rows = np.concatenate(anchor_rows)
+        window_rows = anchor_rows[:, None] + offsets[None, :]
+        is_outside = (window_rows < np.concatenate(symbol_starts)[:, None]) | \
+            (window_rows >= np.concatenate(symbol_stops)[:, None])
+
+        values = all_values[np.where(is_outside, 0, window_rows)]
+        mask = is_outside[:, :, None] | np.isnan(values)
+        values = np.ma.MaskedArray(values, mask=mask)
+
+    events = recommendations_df.loc[np.concatenate(event_rows),
+                                    [c for c in ["symbol", "date", "call", "segment"] if c in recommendations_df]]
+    events = events.reset_index(drop=True)
+    events["anchor_time"] = pd.DatetimeIndex(np.concatenate(anchor_times)).tz_localize("UTC")
+
+    return EventWindows(values, offsets, fields, events)
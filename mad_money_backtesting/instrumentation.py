@@ -0,0 +1,198 @@
+import contextlib
+import cProfile
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Union
+
+# Reusable context manager of the disabled instrumentation
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+def _new_report() -> dict:
+    return {"stages": {}, "counters": {}}
+
+
+def _add_report(target: dict, report: dict):
+    for name, stage in report["stages"].items():
+        target_stage = target["stages"].setdefault(name, {"calls": 0, "total_s": 0.0})
+        target_stage["calls"] += stage["calls"]
+        target_stage["total_s"] += stage["total_s"]
+    for name, value in report["counters"].items():
+        target["counters"][name] = target["counters"].get(name, 0) + value
+
+
+class Instrumentation:
+    """
+    Per-stage timers and counters of a run (e.g. price download, date resolution, backtest, summarization)
+
+    Everything is recorded in the totals, and also per symbol while inside a `with instrumentation.symbol(...)`
+    block (the symbol is thread-local). If `profile_dir` is defined, `profile(symbol)` blocks are profiled with
+    cProfile and dumped to `profile_dir/<symbol>.prof`
+    """
+
+    enabled = True
+
+    def __init__(self, profile_dir: Union[str, Path] = None):
+        self.profile_dir = Path(profile_dir) if profile_dir is not None else None
+        if self.profile_dir is not None:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+
+        self.totals = _new_report()
+        self.symbols: Dict[str, dict] = {}
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def current_symbol(self) -> str:
+        return getattr(self._local, "symbol", None)
+
+    @contextlib.contextmanager
+    def symbol(self, symbol: str):
+        previous_symbol = self.current_symbol
+        self._local.symbol = symbol
+        try:
+            yield
+        finally:
+            self._local.symbol = previous_symbol
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def _reports(self) -> list:
+        symbol = self.current_symbol
+        if symbol is None:
+            return [self.totals]
+        return [self.totals, self.symbols.setdefault(symbol, _new_report())]
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            for report in self._reports():
+                stage = report["stages"].setdefault(name, {"calls": 0, "total_s": 0.0})
+                stage["calls"] += 1
+                stage["total_s"] += seconds
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            for report in self._reports():
+                report["counters"][name] = report["counters"].get(name, 0) + value
+
+    @contextlib.contextmanager
+    def profile(self, symbol: str):
+        if self.profile_dir is None:
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(self.profile_dir / f"{symbol.replace('/', '_')}.prof")
+
+    def symbol_report(self, symbol: str, pop: bool = False) -> dict:
+        with self._lock:
+            if pop:
+                return self.symbols.pop(symbol, _new_report())
+            return self.symbols.get(symbol, _new_report())
+
+    def add_symbol_report(self, symbol: str, report: dict):
+        """
+        Adds the report of a symbol which was recorded somewhere else (e.g. in a worker process)
+        """
+
+        with self._lock:
+            _add_report(self.totals, report)
+            _add_report(self.symbols.setdefault(symbol, _new_report()), report)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps({"totals": self.totals, "symbols": self.symbols}))
+
+    def to_json(self, file_path: Union[str, Path] = None) -> str:
+        text = json.dumps(self.to_dict(), indent=2)
+        if file_path is not None:
+            Path(file_path).write_text(text)
+        return text
+
+
+class _DisabledInstrumentation:
+    """
+    Instrumentation which does nothing, this is used when it is not enabled
+    """
+
+    enabled = False
+    profile_dir = None
+    current_symbol = None
+
+    def symbol(self, symbol: str):
+        return _NULL_CONTEXT
+
+    def stage(self, name: str):
+        return _NULL_CONTEXT
+
+    def profile(self, symbol: str):
+        return _NULL_CONTEXT
+
+    def add_time(self, name: str, seconds: float):
+        pass
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def symbol_report(self, symbol: str, pop: bool = False) -> dict:
+        return _new_report()
+
+    def add_symbol_report(self, symbol: str, report: dict):
+        pass
+
+    def to_dict(self) -> dict:
+        return {"totals": _new_report(), "symbols": {}}
+
+    def to_json(self, file_path: Union[str, Path] = None) -> str:
+        return json.dumps(self.to_dict())
+
+
+_instrumentation = _DisabledInstrumentation()
+
+
+def count_resolved_dates(calendar, dates: list, nb_resolved: int):
+    """
+    Counts the dates which were moved to another bar ("dates.fixed") or dropped ("dates.dropped")
+    by the calendar of the stock data
+    """
+
+    if not _instrumentation.enabled:
+        return
+    nb_dropped = len(dates) - nb_resolved
+    nb_existing = len(calendar.resolve_bars(dates, mode="drop"))
+    _instrumentation.count("dates.dropped", nb_dropped)
+    _instrumentation.count("dates.fixed", nb_resolved - nb_existing)
+
+
+def get_instrumentation() -> Union[Instrumentation, _DisabledInstrumentation]:
+    return _instrumentation
+
+
+def enable_instrumentation(profile_dir: Union[str, Path] = None) -> Instrumentation:
+    """
+    Starts a new recording, the instrumented code paths (scraping, price store, strategies, batch runs,
+    summarization) report to it until `disable_instrumentation()` is called
+    """
+
+    global _instrumentation
+    _instrumentation = Instrumentation(profile_dir)
+    return _instrumentation
+
+
+def disable_instrumentation():
+    global _instrumentation
+    _instrumentation = _DisabledInstrumentation()
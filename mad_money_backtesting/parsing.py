@@ -0,0 +1,40 @@
+from typing import Dict, List
+
+import lxml.html
+
+STOCK_TABLE_COLUMNS = ["name", "month_and_day", "segment", "call", "current_price"]
+
+# Only the rows which have all the 6 cells and the segment/call images are data rows
+# (the header and the last row of the table are not)
+_ROW_XPATH = ".//tr[count(td)=6 and td[3]//img[@alt] and td[4]//img[@alt]]"
+
+_COLUMN_XPATHS = {"name": f"{_ROW_XPATH}/td[1]",
+                  "month_and_day": f"{_ROW_XPATH}/td[2]",
+                  "segment": f"{_ROW_XPATH}/td[3]/descendant::img[@alt][1]/@alt",
+                  "call": f"{_ROW_XPATH}/td[4]/descendant::img[@alt][1]/@alt",
+                  "current_price": f"{_ROW_XPATH}/td[5]"}
+
+
+def parse_stock_table(html: str) -> Dict[str, List[str]]:
+    """
+    Extracts the rows of the `table#stockTable` with lxml XPath queries
+
+    The result is a columnar batch (column name -> values), with the same values as the BeautifulSoup parser
+    """
+
+    # The page is parsed by lxml (not cut with string operations), so nested tables in the cells are handled
+    tables = lxml.html.fromstring(html).xpath('//table[@id="stockTable"]')
+    if len(tables) == 0:
+        raise ValueError("There is no stockTable on the page")
+    table = tables[0]
+
+    columns = {}
+    for column, xpath in _COLUMN_XPATHS.items():
+        values = table.xpath(xpath)
+        columns[column] = [str(v) if isinstance(v, str) else v.text_content() for v in values]
+
+    return columns
+
+
+def columns_to_rows(columns: Dict[str, List[str]]) -> List[dict]:
+    return [dict(zip(columns.keys(), values)) for values in zip(*columns.values())]
@@ -0,0 +1,100 @@
+import datetime
+import os
+from pathlib import Path
+from typing import List, Union
+
+import pandas as pd
+
+FILE_FORMATS = {"parquet", "csv"}
+CATEGORICAL_COLUMNS = ["segment", "call", "symbol"]
+
+
+class PartitionedDataset:
+    """
+    Transformed recommendations stored in monthly partitions: `root/year=YYYY/month=MM/part.<format>`
+
+    A date is written by rewriting its month (the rows of the date are replaced), and the new file is moved to its
+    place atomically, so a partition can be read at any time (e.g. while the scraping is still running).
+    The temporary files start with a dot, so they are skipped by `pd.read_parquet(root)` as well
+    """
+
+    def __init__(self, root: Union[str, Path], file_format: str = "parquet"):
+        assert file_format in FILE_FORMATS, f"File format {file_format} not available"
+
+        self.root = Path(root)
+        self.file_format = file_format
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def partition_path(self, date: Union[str, datetime.datetime]) -> Path:
+        date = pd.Timestamp(date)
+        return self.root / f"year={date.year}" / f"month={date.month:02d}" / f"part.{self.file_format}"
+
+    def partitions(self) -> List[Path]:
+        return sorted(self.root.glob(f"year=*/month=*/part.{self.file_format}"))
+
+    def _read_partition(self, path: Path) -> pd.DataFrame:
+        if self.file_format == "parquet":
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path)
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    def _write_partition(self, path: Path, df: pd.DataFrame):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        if self.file_format == "parquet":
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def write_date(self, date: Union[str, datetime.datetime], df: pd.DataFrame):
+        """
+        Stores the (transformed) rows of a single date, the previously stored rows of the date are replaced
+        """
+
+        path = self.partition_path(date)
+        date = pd.Timestamp(date).normalize()
+
+        if path.exists():
+            existing_df = self._read_partition(path)
+            existing_df = existing_df[existing_df["date"] != date]
+            df = pd.concat([existing_df, df], ignore_index=True)
+
+        df = df.sort_values(["date", "name"]).reset_index(drop=True)
+        self._write_partition(path, df)
+
+    def last_date(self) -> pd.Timestamp:
+        partitions = self.partitions()
+        if len(partitions) == 0:
+            return None
+        return self._read_partition(partitions[-1])["date"].max()
+
+    def read(self, start: Union[str, datetime.datetime] = None,
+             end: Union[str, datetime.datetime] = None) -> pd.DataFrame:
+        """
+        Reads the rows between `start` and `end` (both inclusive), only the partitions of these months are read
+        """
+
+        partitions = self.partitions()
+        if start is not None:
+            partitions = [p for p in partitions if p >= self.partition_path(pd.Timestamp(start).replace(day=1))]
+        if end is not None:
+            partitions = [p for p in partitions if p <= self.partition_path(end)]
+
+        if len(partitions) == 0:
+            return pd.DataFrame()
+
+        df = pd.concat([self._read_partition(p) for p in partitions], ignore_index=True)
+        if start is not None:
+            df = df[df["date"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["date"] <= pd.Timestamp(end)]
+
+        # The partitions were written separately, so the categories are not the same in them
+        for column in CATEGORICAL_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype("category")
+
+        return df.reset_index(drop=True)
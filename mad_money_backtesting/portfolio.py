@@ -0,0 +1,208 @@
+import heapq
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from mad_money_backtesting.trading_calendar import TradingCalendar
+from mad_money_backtesting.untils import pd_date_to_datetime
+from mad_money_backtesting.vectorized import POSITION_SIZE, candidate_exits, candidate_positions, resolve_signal_bars
+
+TRADE_COLUMNS = ["Symbol", "Size", "EntryTime", "ExitTime", "EntryPrice", "ExitPrice", "PnL", "ReturnPct",
+                 "ExitReason"]
+
+
+class PortfolioResult:
+    """
+    Result of a portfolio backtest: the stats, the equity curve (on the merged timeline of all the symbols),
+    the trades, and the positions which were not opened because of the cash or the position limit
+    """
+
+    def __init__(self, stats: pd.Series, equity: pd.Series, trades: pd.DataFrame, rejected: pd.DataFrame):
+        self.stats = stats
+        self.equity = equity
+        self.trades = trades
+        self.rejected = rejected
+
+
+def _symbol_candidates(strategy_class, stock_df: pd.DataFrame, recommendation_dates: list,
+                       stop_loss_perc: float, take_profit_perc: float, strategy_params: dict) -> dict:
+    """
+    Candidate positions of a single symbol with their exits, the same as at the single symbol engine
+    """
+
+    calendar = TradingCalendar.from_df(stock_df)
+    open_, high, low, close = (stock_df[c].to_numpy(dtype=float) for c in ("Open", "High", "Low", "Close"))
+
+    buy_bars, sell_bars = resolve_signal_bars(strategy_class, calendar, recommendation_dates, **strategy_params)
+    candidates = candidate_positions(buy_bars, sell_bars, len(close))
+    exits = candidate_exits(open_, high, low, close, candidates, stop_loss_perc, take_profit_perc)
+
+    return {"entry_bars": candidates["buy_bars"],
+            "entry_prices": close[candidates["buy_bars"]],
+            "exit_bars": exits["exit_signal_bars"],
+            "exit_prices": exits["exit_prices"],
+            "is_closed": exits["is_closed"],
+            "exit_reasons": exits["exit_reasons"]}
+
+
+def run_portfolio(strategy_class,
+                  recommendations_df: pd.DataFrame,
+                  prices: Dict[str, pd.DataFrame],
+                  cash: float,
+                  commission: float,
+                  stop_loss_perc: float = None,
+                  take_profit_perc: float = None,
+                  max_positions: int = 10,
+                  position_size: float = None,
+                  **strategy_params) -> PortfolioResult:
+    """
+    Backtests all the symbols together with a single cash balance
+
+    The bars of the symbols are merged into one sorted timeline. The entries and exits of every symbol follow the
+    rules of the strategy (the same as at `run_vectorized`), then the positions are opened in time order
+    while there is cash and less than `max_positions` open positions (exits are processed before the entries
+    of the same time). The size of a new position is `position_size` fraction of the equity (cash + cost of the open
+    positions), or if it is None, the cash is split equally between the free position slots
+    """
+
+    if max_positions is None and position_size is None:
+        raise ValueError("Either max_positions or position_size should be defined")
+
+    if strategy_params.get("holding_policy") == "lots" and strategy_params.get("max_lots", 1) > 1:
+        raise NotImplementedError("The portfolio engine holds a single position per symbol at a time")
+
+    symbols = []
+    symbol_times = []
+    symbol_candidates = []
+
+    for symbol, dates in recommendations_df.groupby("symbol", observed=True, sort=False)["date"]:
+        if symbol not in prices or len(prices[symbol]) == 0:
+            print(f"There was a problem with {symbol} - There is not data in the dataframe")
+            continue
+        stock_df = prices[symbol]
+        symbols.append(symbol)
+        symbol_times.append(stock_df.index.values.astype("datetime64[ns]"))
+        symbol_candidates.append(_symbol_candidates(strategy_class, stock_df, [pd_date_to_datetime(d) for d in dates],
+                                                    stop_loss_perc, take_profit_perc, strategy_params))
+
+    if len(symbols) == 0:
+        raise RuntimeError("None of the symbols have stock data")
+
+    # Global timeline (in UTC) and the global index of every bar of the symbols
+    timeline = np.unique(np.concatenate(symbol_times))
+    nb_times = len(timeline)
+    symbol_global_bars = [np.searchsorted(timeline, times) for times in symbol_times]
+
+    # All the candidate positions, sorted by their entry time
+    symbol_ids = np.concatenate([np.full(len(c["entry_bars"]), i) for i, c in enumerate(symbol_candidates)])
+    entry_times = np.concatenate([g[c["entry_bars"]] for g, c in zip(symbol_global_bars, symbol_candidates)])
+    exit_times = np.concatenate([np.where(c["is_closed"], g[c["exit_bars"]], nb_times)
+                                 for g, c in zip(symbol_global_bars, symbol_candidates)])
+    candidates = {k: np.concatenate([c[k] for c in symbol_candidates]) for k in symbol_candidates[0].keys()}
+    order = np.argsort(entry_times, kind="stable")
+
+    # Event loop over the candidates (and not over the bars): the exits before the entry are processed first
+    current_cash = float(cash)
+    invested = 0.0
+    open_positions = []
+    held_until = np.zeros(len(symbols), dtype=np.int64)
+    sizes = np.zeros(len(entry_times), dtype=np.int64)
+    rejected = []
+    max_open_positions = 0
+
+    for i in order:
+        entry_time = entry_times[i]
+        while open_positions and open_positions[0][0] <= entry_time:
+            _, j = heapq.heappop(open_positions)
+            current_cash += sizes[j] * candidates["exit_prices"][j] * (1 - commission)
+            invested -= sizes[j] * candidates["entry_prices"][j]
+
+        symbol_id = symbol_ids[i]
+        if entry_time < held_until[symbol_id]:
+            # We are already holding the stock
+            continue
+        if max_positions is not None and len(open_positions) >= max_positions:
+            rejected.append((symbols[symbol_id], timeline[entry_time], "max_positions"))
+            continue
+
+        if position_size is not None:
+            target_value = min(position_size * (current_cash + invested), current_cash) * POSITION_SIZE
+        else:
+            target_value = current_cash * POSITION_SIZE / (max_positions - len(open_positions))
+
+        entry_price = candidates["entry_prices"][i]
+        size = int(target_value // (entry_price * (1 + commission)))
+        if size <= 0:
+            rejected.append((symbols[symbol_id], timeline[entry_time], "cash"))
+            continue
+
+        sizes[i] = size
+        current_cash -= size * entry_price * (1 + commission)
+        invested += size * entry_price
+        held_until[symbol_id] = exit_times[i]
+        heapq.heappush(open_positions, (exit_times[i], i))
+        max_open_positions = max(max_open_positions, len(open_positions))
+
+    opened = np.flatnonzero(sizes > 0)
+    opened = opened[np.argsort(entry_times[opened], kind="stable")]
+    trade_sizes = sizes[opened]
+    entry_prices, exit_prices = candidates["entry_prices"][opened], candidates["exit_prices"][opened]
+    is_closed = candidates["is_closed"][opened]
+
+    # Cash curve from the entry and exit cash flows
+    cash_deltas = np.zeros(nb_times + 1)
+    np.add.at(cash_deltas, entry_times[opened], -trade_sizes * entry_prices * (1 + commission))
+    np.add.at(cash_deltas, exit_times[opened], np.where(is_closed, trade_sizes * exit_prices * (1 - commission), 0))
+    equity = cash + np.cumsum(cash_deltas)[:nb_times]
+
+    # Market value of the positions while they are held (the last close of the symbol is used between its bars)
+    last_prices = np.zeros(len(opened))
+    for k, i in enumerate(opened):
+        global_bars = symbol_global_bars[symbol_ids[i]]
+        close = prices[symbols[symbol_ids[i]]]["Close"].to_numpy(dtype=float)
+        held_times = np.arange(entry_times[i], min(exit_times[i], nb_times))
+        held_bars = np.searchsorted(global_bars, held_times, side="right") - 1
+        equity[held_times] += trade_sizes[k] * close[held_bars]
+        last_prices[k] = close[-1]
+
+    # Positions which are still open are valued at the last close (their exit commission is not paid yet)
+    pnl = np.where(is_closed, trade_sizes * (exit_prices * (1 - commission) - entry_prices * (1 + commission)),
+                   trade_sizes * (last_prices - entry_prices * (1 + commission)))
+
+    trades = pd.DataFrame({
+        "Symbol": [symbols[s] for s in symbol_ids[opened]],
+        "Size": trade_sizes,
+        "EntryTime": pd.DatetimeIndex(timeline[entry_times[opened]]).tz_localize("UTC"),
+        "ExitTime": pd.DatetimeIndex(timeline[np.minimum(exit_times[opened], nb_times - 1)]).tz_localize("UTC")
+        .where(is_closed),
+        "EntryPrice": entry_prices,
+        "ExitPrice": np.where(is_closed, exit_prices, np.nan),
+        "PnL": np.where(is_closed, pnl, np.nan),
+        "ReturnPct": np.where(is_closed, pnl / (trade_sizes * entry_prices), np.nan),
+        "ExitReason": np.where(is_closed, candidates["exit_reasons"][opened], "Open"),
+    }, columns=TRADE_COLUMNS)
+
+    equity = pd.Series(equity, index=pd.DatetimeIndex(timeline).tz_localize("UTC"), name="Equity")
+    drawdown = 1 - equity / equity.cummax()
+    closed_returns = trades["ReturnPct"].dropna().values * 100
+
+    stats = pd.Series({
+        "Start": equity.index[0],
+        "End": equity.index[-1],
+        "Duration": equity.index[-1] - equity.index[0],
+        "Equity Final [$]": equity.iloc[-1],
+        "Equity Peak [$]": equity.max(),
+        "Return [%]": (equity.iloc[-1] - cash) / cash * 100,
+        "Max. Drawdown [%]": -drawdown.max() * 100,
+        "# Symbols": len(symbols),
+        "# Trades": len(closed_returns),
+        "Win Rate [%]": (closed_returns > 0).mean() * 100 if len(closed_returns) else np.nan,
+        "Avg. Trade [%]": closed_returns.mean() if len(closed_returns) else np.nan,
+        "Max. Open Positions": max_open_positions,
+        "# Rejected": len(rejected),
+    })
+
+    rejected_df = pd.DataFrame(rejected, columns=["Symbol", "Time", "Reason"])
+    rejected_df["Time"] = pd.to_datetime(rejected_df["Time"]).dt.tz_localize("UTC")
+    return PortfolioResult(stats, equity, trades, rejected_df)
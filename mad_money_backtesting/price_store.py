@@ -0,0 +1,216 @@
+import concurrent.futures
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import pandas as pd
+from tqdm import tqdm
+
+from mad_money_backtesting.instrumentation import get_instrumentation
+
+DateLike = Union[str, pd.Timestamp]
+
+
+class YFinanceFetcher:
+    """
+    Downloads the stock data with yfinance (this is the default fetcher of the `PriceStore`)
+    """
+
+    def __init__(self, prepost: bool = False):
+        self.prepost = prepost
+
+    def __call__(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> pd.DataFrame:
+        # yfinance is only needed when we actually download something
+        import yfinance
+
+        return yfinance.Ticker(symbol).history(start=start, end=end, interval=interval, prepost=self.prepost)
+
+
+class LocalFetcher:
+    """
+    Serves the stock data from already loaded DataFrames, so the store can be used offline (e.g. in tests)
+
+    Every call is recorded in `calls`, so we can check which ranges were requested
+    """
+
+    def __init__(self, stock_dfs: Dict[str, pd.DataFrame]):
+        self.stock_dfs = stock_dfs
+        self.calls: List[Tuple[str, pd.Timestamp, pd.Timestamp, str]] = []
+
+    def __call__(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> pd.DataFrame:
+        self.calls.append((symbol, start, end, interval))
+
+        if symbol not in self.stock_dfs:
+            return pd.DataFrame()
+
+        stock_df = self.stock_dfs[symbol]
+        return stock_df[_mask_range(stock_df.index, start, end)]
+
+
+def _to_timestamp(date: DateLike, tz=None) -> pd.Timestamp:
+    date = pd.Timestamp(date)
+    if tz is not None and date.tz is None:
+        return date.tz_localize(tz)
+    return date
+
+
+def _mask_range(index: pd.DatetimeIndex, start: pd.Timestamp, end: pd.Timestamp):
+    # The end is exclusive, the same way as at yfinance
+    return (index >= _to_timestamp(start, index.tz)) & (index < _to_timestamp(end, index.tz))
+
+
+class PriceStore:
+    """
+    Local store of the downloaded stock data (one Parquet file per symbol and interval)
+
+    Only the date ranges which are not stored yet are downloaded, e.g. if we already have the data from
+    2020-01-01 to 2021-01-01 and we need it until 2021-02-01, only the last month is fetched
+    """
+
+    def __init__(self, root: Union[str, Path], fetcher=None, interval: str = "1h"):
+        self.root = Path(root)
+        self.fetcher = fetcher if fetcher is not None else YFinanceFetcher()
+        self.interval = interval
+
+        (self.root / self.interval).mkdir(parents=True, exist_ok=True)
+
+    def _data_path(self, symbol: str) -> Path:
+        return self.root / self.interval / f"{symbol.replace('/', '_')}.parquet"
+
+    def _coverage_path(self, symbol: str) -> Path:
+        return self.root / self.interval / f"{symbol.replace('/', '_')}.json"
+
+    def _read_coverage(self, symbol: str) -> Tuple[pd.Timestamp, pd.Timestamp]:
+        """
+        The date range which was already requested for the symbol (end is exclusive)
+        This is not the same as the first and last bars, e.g. there is no data on weekends
+        """
+
+        path = self._coverage_path(symbol)
+        if not path.exists():
+            return None, None
+        coverage = json.loads(path.read_text())
+        return pd.Timestamp(coverage["start"]), pd.Timestamp(coverage["end"])
+
+    def _write_atomic(self, path: Path, write_fn):
+        tmp_path = path.with_name(path.name + ".tmp")
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+
+    def load(self, symbol: str) -> pd.DataFrame:
+        """
+        All the stored data for the symbol (empty DataFrame if there is nothing stored)
+        """
+
+        path = self._data_path(symbol)
+        if not path.exists():
+            return pd.DataFrame()
+        return pd.read_parquet(path)
+
+    def missing_ranges(self, symbol: str, start: DateLike, end: DateLike) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """
+        Date ranges which should be downloaded to have the data for [start, end)
+        """
+
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        covered_start, covered_end = self._read_coverage(symbol)
+
+        if covered_start is None:
+            return [(start, end)]
+
+        ranges = []
+        if start < covered_start:
+            ranges.append((start, covered_start))
+        if end > covered_end:
+            ranges.append((covered_end, end))
+        return ranges
+
+    def update(self, symbol: str, start: DateLike, end: DateLike) -> int:
+        """
+        Downloads the missing data for the symbol, returns the number of new bars
+        """
+
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        missing_ranges = self.missing_ranges(symbol, start, end)
+
+        if len(missing_ranges) == 0:
+            return 0
+
+        instrumentation = get_instrumentation()
+        with instrumentation.symbol(symbol), instrumentation.stage("prices.download"):
+            fetched = [(s, e, self.fetcher(symbol, s, e, self.interval)) for s, e in missing_ranges]
+            # An empty result can be a failed download (yfinance does not raise for most of the errors), so
+            # only the ranges with data are marked as covered, the empty ones are requested again next time
+            fetched = [(s, e, df) for s, e, df in fetched if len(df) > 0]
+            instrumentation.count("prices.downloaded_bars", sum(len(df) for _, _, df in fetched))
+
+        if len(fetched) == 0:
+            return 0
+
+        stock_df = pd.concat([self.load(symbol)] + [df for _, _, df in fetched])
+        stock_df = stock_df[~stock_df.index.duplicated(keep="last")].sort_index()
+        self._write_atomic(self._data_path(symbol), stock_df.to_parquet)
+
+        # The missing ranges are next to the covered range, so the covered range stays continuous
+        covered_start, covered_end = self._read_coverage(symbol)
+        new_start = min(s for s, _, _ in fetched)
+        new_end = max(e for _, e, _ in fetched)
+        if covered_start is not None:
+            new_start, new_end = min(new_start, covered_start), max(new_end, covered_end)
+        # Today is not finished yet, so it always counts as missing
+        new_end = max(min(new_end, pd.Timestamp.now().normalize()), new_start)
+        coverage = json.dumps({"start": new_start.isoformat(), "end": new_end.isoformat()})
+        self._write_atomic(self._coverage_path(symbol), lambda p: p.write_text(coverage))
+
+        return sum(len(df) for _, _, df in fetched)
+
+    def get(self, symbol: str, start: DateLike, end: DateLike, download: bool = True) -> pd.DataFrame:
+        """
+        Stock data for [start, end) in the format we use for backtesting (with a "Date" column)
+        Only the missing ranges are downloaded (nothing is downloaded if `download` is False)
+        """
+
+        if download:
+            self.update(symbol, start, end)
+
+        stock_df = self.load(symbol)
+        if len(stock_df) == 0:
+            return stock_df
+
+        stock_df = stock_df[_mask_range(stock_df.index, pd.Timestamp(start), pd.Timestamp(end))].copy()
+        stock_df["Date"] = stock_df.index
+        stock_df.dropna(inplace=True)
+        return stock_df
+
+    def prefetch(self,
+                 recommendations_df: pd.DataFrame,
+                 start: DateLike,
+                 end: DateLike,
+                 max_workers: int = 8) -> Dict[str, Exception]:
+        """
+        Downloads the missing data for all the symbols in the recommendations DataFrame (in parallel calls)
+
+        Returns the symbols for which the download failed with the errors
+        """
+
+        symbols = recommendations_df["symbol"].unique()
+        failed_symbols = {}
+
+        pbar = tqdm(total=len(symbols), desc="Updating the price store...")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.update, symbol, start, end): symbol for symbol in symbols}
+
+            for f in concurrent.futures.as_completed(futures):
+                symbol = futures[f]
+                try:
+                    f.result()
+                except Exception as e:
+                    print(f"There was a problem with {symbol} - {e}")
+                    failed_symbols[symbol] = e
+                pbar.update(1)
+
+        pbar.close()
+
+        return failed_symbols
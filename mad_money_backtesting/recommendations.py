@@ -0,0 +1,137 @@
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from mad_money_backtesting.untils import pd_date_to_datetime
+
+COLUMNS = ["symbol", "date", "call", "segment", "current_price"]
+
+
+class RecommendationStore:
+    """
+    Indexed view of the transformed recommendations (see `transform_cramer_call_raw_dataframe`)
+
+    The rows are sorted by (symbol, date) once, so the rows of a symbol are a contiguous slice: a symbol lookup is
+    a dict lookup and a date range inside it is a binary search, instead of filtering the whole dataframe
+    for every symbol
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        df = df[[c for c in df.columns if c in COLUMNS or c == "name"]].copy()
+        df["date"] = pd.to_datetime(df["date"])
+        for column in ("symbol", "call", "segment"):
+            if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype("category")
+
+        self.df = df.sort_values(["symbol", "date"], kind="stable").reset_index(drop=True)
+
+        self._dates = self.df["date"].to_numpy(dtype="datetime64[ns]")
+        self._prices = self.df["current_price"].to_numpy(dtype=float)
+
+        # Boundaries of the contiguous symbol blocks
+        symbol_codes = self.df["symbol"].cat.codes.to_numpy()
+        starts = np.flatnonzero(np.diff(symbol_codes, prepend=-2) != 0)
+        stops = np.append(starts[1:], len(self.df))
+        self._slices: Dict[str, slice] = {self.df["symbol"].iat[start]: slice(start, stop)
+                                          for start, stop in zip(starts, stops)}
+
+    @classmethod
+    def from_csv(cls, file_path: Union[str, Path]) -> "RecommendationStore":
+        return cls(pd.read_csv(file_path, parse_dates=["date"]))
+
+    @classmethod
+    def from_parquet(cls, file_path: Union[str, Path]) -> "RecommendationStore":
+        return cls(pd.read_parquet(file_path))
+
+    def to_parquet(self, file_path: Union[str, Path]):
+        """
+        Stores the recommendations with the categorical columns, so loading them does not need any parsing
+        """
+
+        self.df.to_parquet(file_path, index=False)
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._slices
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._slices.keys())
+
+    def _symbol_slice(self, symbol: str, start=None, end=None) -> slice:
+        """
+        Rows of the symbol between `start` (inclusive) and `end` (exclusive)
+        """
+
+        rows = self._slices.get(symbol)
+        if rows is None:
+            return slice(0, 0)
+
+        dates = self._dates[rows]
+        first = np.searchsorted(dates, np.datetime64(pd.Timestamp(start), "ns"), side="left") if start is not None else 0
+        last = np.searchsorted(dates, np.datetime64(pd.Timestamp(end), "ns"), side="left") if end is not None else len(dates)
+        return slice(rows.start + first, rows.start + last)
+
+    def dates(self, symbol: str, start=None, end=None) -> np.ndarray:
+        """
+        Sorted recommendation dates of the symbol (a view, it should not be modified)
+        """
+
+        return self._dates[self._symbol_slice(symbol, start, end)]
+
+    def recommendation_dates(self, symbol: str, start=None, end=None) -> List:
+        """
+        Recommendation dates of the symbol in the format which is expected by the strategies
+        """
+
+        return [pd_date_to_datetime(d) for d in pd.DatetimeIndex(self.dates(symbol, start, end))]
+
+    def for_symbol(self, symbol: str, start=None, end=None) -> pd.DataFrame:
+        return self.df.iloc[self._symbol_slice(symbol, start, end)]
+
+    def iter_symbols(self, symbols: Iterable[str] = None) -> Iterator[Tuple[str, np.ndarray]]:
+        """
+        Yields (symbol, dates) for every symbol (or only for the given ones)
+        """
+
+        for symbol in (self._slices.keys() if symbols is None else symbols):
+            yield symbol, self.dates(symbol)
+
+    def query(self,
+              symbols: Iterable[str] = None,
+              start=None,
+              end=None,
+              calls: Iterable[str] = None,
+              min_price: float = None,
+              max_price: float = None) -> pd.DataFrame:
+        """
+        Filters the recommendations, every condition is optional:
+        - `start` (inclusive) - `end` (exclusive) date range
+        - `calls` e.g. ["buy", "positive"]
+        - `min_price` - `max_price` (both inclusive) band of the price at the time of the call
+        """
+
+        if symbols is not None:
+            rows = [self._symbol_slice(s, start, end) for s in symbols]
+            index = np.concatenate([np.arange(r.start, r.stop) for r in rows] or [np.array([], dtype=int)])
+        else:
+            mask = np.ones(len(self.df), dtype=bool)
+            if start is not None:
+                mask &= self._dates >= np.datetime64(pd.Timestamp(start), "ns")
+            if end is not None:
+                mask &= self._dates < np.datetime64(pd.Timestamp(end), "ns")
+            index = np.flatnonzero(mask)
+
+        mask = np.ones(len(index), dtype=bool)
+        if calls is not None:
+            mask &= self.df["call"].isin(list(calls)).to_numpy()[index]
+        if min_price is not None:
+            mask &= self._prices[index] >= min_price
+        if max_price is not None:
+            mask &= self._prices[index] <= max_price
+
+        return self.df.iloc[index[mask]]
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from mad_money_backtesting.trading_calendar import TradingCalendar
+from mad_money_backtesting.vectorized import _strategy_dates
+
+# Should be increased when a change of the engines changes the results, so the old entries are not used
+CACHE_VERSION = 1
+
+
+# Stats of a result which depend on every bar of the stock data (not only on the bars of the trades)
+RANGE_STATS = ["Start", "End", "Duration", "Buy & Hold Return [%]"]
+
+
+def relevant_bars(strategy_class, stock_df: pd.DataFrame, recommendation_dates: list, strategy_params: dict) -> int:
+    """
+    Number of bars (from the first one) which the trades of a backtest depend on: up to the bar after the last
+    sell signal, which closes every position (the stop loss/take profit can only close them earlier)
+
+    If a position stays open at the end, or a buy/sell date is after the last bar (so it can be resolved to a
+    new bar later), the result depends on every bar
+    """
+
+    nb_bars = len(stock_df)
+    calendar = TradingCalendar.from_df(stock_df)
+    buy_dates, sell_dates = _strategy_dates(strategy_class, recommendation_dates, strategy_params)
+    buy_bars = calendar.search(calendar.localize(buy_dates))
+    sell_bars = calendar.search(calendar.localize(sell_dates))
+
+    if len(buy_bars) == 0 or len(sell_bars) == 0 or max(buy_bars.max(), sell_bars.max()) >= nb_bars:
+        return nb_bars
+    if sell_bars.max() <= buy_bars.max():
+        # The last position is not closed by any sell signal
+        return nb_bars
+    # An order is only filled if there is a bar after the one where it was placed
+    return min(sell_bars.max() + 2, nb_bars)
+
+
+def refresh_range_stats(result: pd.Series, stock_df: pd.DataFrame) -> pd.Series:
+    """
+    Recalculates the `RANGE_STATS` of a cached result for the current stock data
+    """
+
+    close = stock_df["Close"].to_numpy(dtype=float)
+    result = result.copy()
+    result["Start"] = stock_df.index[0]
+    result["End"] = stock_df.index[-1]
+    result["Duration"] = stock_df.index[-1] - stock_df.index[0]
+    result["Buy & Hold Return [%]"] = (close[-1] - close[0]) / close[0] * 100
+    return result
+
+
+def hash_prices(stock_df: pd.DataFrame, nb_bars: int = None) -> str:
+    """
+    Hash of the stock data (timestamps and the numeric columns), so a result is only reused for the same bars
+
+    With `nb_bars`, only the first bars are hashed (see `relevant_bars`)
+    """
+
+    stock_df = stock_df.iloc[:nb_bars]
+    values_df = stock_df.select_dtypes("number")
+    h = hashlib.sha256()
+    h.update(str(stock_df.index.tz).encode())
+    h.update(stock_df.index.values.astype("datetime64[ns]").view(np.int64).tobytes())
+    h.update(",".join(values_df.columns).encode())
+    h.update(np.ascontiguousarray(values_df.to_numpy(dtype=float)).tobytes())
+    return h.hexdigest()
+
+
+def fingerprint(strategy_class, params: dict, recommendation_dates: list, prices_hash: str, cash: float,
+                commission: float, engine: str) -> str:
+    """
+    Key of a backtest result: every input which can change it is in the hash
+    """
+
+    h = hashlib.sha256()
+    h.update(f"{CACHE_VERSION}|{engine}|{strategy_class.__module__}.{strategy_class.__qualname__}".encode())
+    h.update(repr(sorted((k, repr(v)) for k, v in params.items())).encode())
+    h.update(repr([pd.Timestamp(d).isoformat() for d in recommendation_dates]).encode())
+    h.update(f"|{prices_hash}|{cash!r}|{commission!r}".encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of the backtest results (one pickle file per fingerprint)
+
+    When the size of the cache goes above `max_bytes`, the least recently used entries are removed
+    (every hit updates the modification time of the entry)
+    """
+
+    def __init__(self, root: Union[str, Path], max_bytes: int = 1024 ** 3):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._size = sum(p.stat().st_size for p in self._entries())
+
+    def _entries(self):
+        return self.root.glob("*/*.pkl")
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.pkl"
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> pd.Series:
+        """
+        The cached result (None if it is not in the cache)
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result: pd.Series):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        old_size = path.stat().st_size if path.exists() else 0
+
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        self._size += path.stat().st_size - old_size
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """
+        Removes the least recently used entries until the cache fits into `max_bytes`
+        """
+
+        entries = sorted(((p.stat().st_mtime, p.stat().st_size, p) for p in self._entries()), key=lambda e: e[0])
+        self._size = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+
+    def clear(self):
+        for path in self._entries():
+            path.unlink(missing_ok=True)
+        self._size = 0
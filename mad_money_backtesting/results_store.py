@@ -0,0 +1,243 @@
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# Stats which are kept from every backtest result (the fields of `summarize_backtesting_results` and the trade stats)
+STAT_COLUMNS = ["Return [%]", "Equity Final [$]", "Equity Peak [$]", "Buy & Hold Return [%]", "# Trades",
+                "Win Rate [%]", "Start", "End"]
+
+# Columns of the stored trade ledgers (they are common in the vectorized and the backtesting.py trades)
+LEDGER_COLUMNS = ["Size", "EntryBar", "ExitBar", "EntryPrice", "ExitPrice", "PnL", "ReturnPct", "EntryTime",
+                  "ExitTime"]
+
+KEY_COLUMNS = ["Batch", "Run", "Symbol", "Strategy"]
+
+
+class ResultsStore:
+    """
+    Columnar store of backtest results: one row per (symbol, strategy, parameters) run, where the strategy name and
+    every parameter is a column (nothing has to be parsed from `str(_strategy)`)
+
+    The rows are buffered as column lists and packed into DataFrame chunks every `chunk_rows` rows. If `root` is
+    defined, the trade ledgers are spilled to `root/ledgers` (in parts of `spill_rows` trades) instead of being
+    kept in memory, and `save()` writes the results to `root/results`. Stores are merged with `ResultsStore.merge`
+    """
+
+    def __init__(self, root: Union[str, Path] = None, chunk_rows: int = 10_000, spill_rows: int = 100_000):
+        self.root = Path(root) if root is not None else None
+        self.chunk_rows = chunk_rows
+        self.spill_rows = spill_rows
+
+        # Every store instance is a separate batch, so the runs of merged stores do not collide
+        self.batch_id = uuid.uuid4().hex[:12]
+        self._nb_runs = 0
+
+        self._rows: Dict[str, list] = {}
+        self._chunks: List[pd.DataFrame] = []
+
+        self._ledger_buffer: List[pd.DataFrame] = []
+        self._ledger_buffer_rows = 0
+        self.ledger_parts: List[Path] = []
+
+        if self.root is not None:
+            (self.root / "results").mkdir(parents=True, exist_ok=True)
+            (self.root / "ledgers").mkdir(parents=True, exist_ok=True)
+
+    def __len__(self) -> int:
+        return sum(len(c) for c in self._chunks) + len(self._rows.get("Run", []))
+
+    def append(self, symbol: str, strategy: Union[str, type], params: dict, stats: pd.Series,
+               trades: pd.DataFrame = None):
+        """
+        Adds the result of a single backtest
+
+        `params` are the strategy parameters (e.g. stop_loss_perc, sell_horizon), the recommendation dates are
+        not stored. `trades` is only kept if the store has a `root`
+        """
+
+        run = self._nb_runs
+        self._nb_runs += 1
+
+        row = {"Batch": self.batch_id,
+               "Run": run,
+               "Symbol": symbol,
+               "Strategy": strategy if isinstance(strategy, str) else strategy.__name__}
+        row.update({k: v for k, v in params.items() if k != "recommendation_dates"})
+        row.update({k: stats.get(k, np.nan) for k in STAT_COLUMNS})
+
+        nb_rows = len(self._rows.get("Run", []))
+        for k in list(row.keys()) + [k for k in self._rows.keys() if k not in row]:
+            # New parameter columns are filled with None for the previous rows
+            self._rows.setdefault(k, [None] * nb_rows).append(row.get(k))
+
+        if trades is not None and self.root is not None:
+            self._add_ledger(run, trades)
+
+        if nb_rows + 1 >= self.chunk_rows:
+            self._pack_rows()
+
+    def _pack_rows(self):
+        if not self._rows:
+            return
+        # Parameters which are None for some runs (e.g. no stop loss) should still be numeric columns
+        chunk = pd.DataFrame(self._rows).infer_objects()
+        for column in ("Batch", "Symbol", "Strategy"):
+            chunk[column] = chunk[column].astype("category")
+        for column in ("Start", "End"):
+            chunk[column] = pd.to_datetime(chunk[column], utc=True)
+        self._chunks.append(chunk)
+        self._rows = {}
+
+    def _add_ledger(self, run: int, trades: pd.DataFrame):
+        ledger = trades.reindex(columns=LEDGER_COLUMNS).reset_index(drop=True)
+        for column in ("EntryTime", "ExitTime"):
+            # The symbols can have different timezones
+            ledger[column] = pd.to_datetime(ledger[column], utc=True)
+        ledger.insert(0, "Batch", self.batch_id)
+        ledger.insert(1, "Run", run)
+        ledger.insert(2, "Trade", np.arange(len(ledger)))
+
+        self._ledger_buffer.append(ledger)
+        self._ledger_buffer_rows += len(ledger)
+        if self._ledger_buffer_rows >= self.spill_rows:
+            self._spill_ledgers()
+
+    def _spill_ledgers(self):
+        if not self._ledger_buffer:
+            return
+        path = self.root / "ledgers" / f"{self.batch_id}-{len(self.ledger_parts):05d}.parquet"
+        pd.concat(self._ledger_buffer, ignore_index=True).to_parquet(path, index=False)
+        self.ledger_parts.append(path)
+        self._ledger_buffer = []
+        self._ledger_buffer_rows = 0
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        All the runs in a single DataFrame
+        """
+
+        self._pack_rows()
+        if len(self._chunks) == 0:
+            return pd.DataFrame(columns=KEY_COLUMNS + STAT_COLUMNS)
+        if len(self._chunks) > 1:
+            # The chunks are merged, so the next call does not need to concatenate them again
+            self._chunks = [_concat_frames(self._chunks)]
+        return self._chunks[0]
+
+    @property
+    def parameter_columns(self) -> List[str]:
+        return [c for c in self.to_frame().columns if c not in KEY_COLUMNS + STAT_COLUMNS]
+
+    def trades(self, runs: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Stored trade ledgers (of the given runs, e.g. a filtered `to_frame()`), with Batch and Run columns
+        """
+
+        if self.root is not None:
+            self._spill_ledgers()
+        if len(self.ledger_parts) == 0:
+            return pd.DataFrame(columns=["Batch", "Run", "Trade"] + LEDGER_COLUMNS)
+
+        ledgers = pd.concat([pd.read_parquet(p) for p in self.ledger_parts], ignore_index=True)
+        if runs is not None:
+            keys = pd.MultiIndex.from_frame(runs[["Batch", "Run"]].astype({"Batch": str}))
+            ledgers = ledgers[pd.MultiIndex.from_frame(ledgers[["Batch", "Run"]].astype({"Batch": str})).isin(keys)]
+        return ledgers.reset_index(drop=True)
+
+    def summarize(self, include_parameters: bool = True, sort_by: str = None) -> pd.DataFrame:
+        """
+        Same table as `summarize_backtesting_results`, but the parameters are separate columns
+        """
+
+        results_df = self.to_frame()
+        columns = ["Symbol", "Strategy"] + (self.parameter_columns if include_parameters else []) + \
+                  ["Return [%]", "Equity Final [$]", "Equity Peak [$]", "Buy & Hold Return [%]", "Start", "End"]
+        results_df = results_df[columns].set_index("Symbol")
+
+        if sort_by is not None:
+            results_df = results_df.sort_values(sort_by, ascending=False)
+        return results_df
+
+    def aggregate(self, by: Sequence[str] = None, column: str = "Return [%]",
+                  quantiles: Iterable[float] = (0.05, 0.25, 0.5, 0.75, 0.95)) -> pd.DataFrame:
+        """
+        Stats of a result column (across the symbols) for every strategy and parameter combination:
+        mean, median, hit rate (% of the positive values), quantiles and the number of runs
+        """
+
+        results_df = self.to_frame()
+        by = list(by) if by is not None else ["Strategy"] + self.parameter_columns
+        results_df = results_df[by + [column]].assign(hit=(results_df[column] > 0) * 100.0)
+        grouped = results_df.groupby(by, dropna=False, observed=True)
+
+        aggregated_df = pd.DataFrame({"Mean": grouped[column].mean(),
+                                      "Median": grouped[column].median(),
+                                      "Hit Rate [%]": grouped["hit"].mean(),
+                                      "Runs": grouped[column].size()})
+        for q in quantiles:
+            # The groups are in the same order for every aggregation of the same groupby
+            aggregated_df[f"Q{q * 100:g}"] = grouped[column].quantile(q).to_numpy()
+
+        return aggregated_df.reset_index()
+
+    def save(self):
+        """
+        Writes the results of this store to `root/results` (the ledgers are already in `root/ledgers`)
+        """
+
+        if self.root is None:
+            raise ValueError("The store has no root directory")
+
+        self._spill_ledgers()
+        ledgers_dir = self.root / "ledgers"
+        for i, path in enumerate(self.ledger_parts):
+            if path.parent.resolve() != ledgers_dir.resolve():
+                # Ledgers of merged stores are copied next to the results
+                target_path = ledgers_dir / path.name
+                shutil.copy(path, target_path)
+                self.ledger_parts[i] = target_path
+
+        results_df = self.to_frame()
+        for batch_id, batch_df in results_df.groupby("Batch", observed=True):
+            batch_df.to_parquet(self.root / "results" / f"{batch_id}.parquet", index=False)
+
+    @classmethod
+    def load(cls, root: Union[str, Path]) -> "ResultsStore":
+        """
+        Loads every stored batch of the directory (new results can be appended to it as a new batch)
+        """
+
+        store = cls(root)
+        result_paths = sorted(store.root.glob("results/*.parquet"))
+        if result_paths:
+            store._chunks = [_concat_frames([pd.read_parquet(p) for p in result_paths])]
+        store.ledger_parts = sorted(store.root.glob("ledgers/*.parquet"))
+        return store
+
+    @classmethod
+    def merge(cls, stores: Iterable["ResultsStore"], root: Union[str, Path] = None) -> "ResultsStore":
+        merged = cls(root)
+        stores = list(stores)
+        merged._chunks = [_concat_frames([s.to_frame() for s in stores])]
+        for store in stores:
+            if store.root is not None:
+                store._spill_ledgers()
+            merged.ledger_parts.extend(store.ledger_parts)
+        return merged
+
+
+def _concat_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    frames = [f for f in frames if len(f) > 0]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=KEY_COLUMNS + STAT_COLUMNS)
+
+    # A parameter which is None in every run of a chunk is an object column there, it is numeric again after this
+    df = pd.concat(frames, ignore_index=True).infer_objects()
+    # The categories of the chunks are different, so they are restored after the concatenation
+    for column in ("Batch", "Symbol", "Strategy"):
+        df[column] = df[column].astype("category")
+    return df
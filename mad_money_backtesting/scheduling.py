@@ -0,0 +1,60 @@
+from collections import deque
+from datetime import timedelta
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+# - skip: new recommendations are ignored while we hold the stock
+# - extend: a new recommendation while we hold the stock extends the holding period from the new date
+# - lots: every recommendation opens a new lot, as long as there are less than `max_lots` open lots
+HOLDING_POLICIES = {"skip", "extend", "lots"}
+
+
+def schedule_positions(buy_dates,
+                       holding_period: timedelta,
+                       policy: str = "skip",
+                       max_lots: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Schedules the positions for the buy dates in a single pass over the (sorted) dates
+
+    Returns the buy dates which open a position and the sell dates for them (as `datetime64` arrays, where
+    the i-th sell date belongs to the i-th buy date).
+    Example: buy_dates=[1, 3, 4, 12, 15, 34, 36], holding_period=10
+    - skip: buy=[1, 12, 34], sell=[11, 22, 44]
+    - extend: buy=[1, 34], sell=[25, 46]
+    - lots (max_lots=2): buy=[1, 3, 12, 15, 34, 36], sell=[11, 13, 22, 25, 44, 46]
+    """
+
+    assert policy in HOLDING_POLICIES, f"Policy {policy} not available"
+    assert max_lots >= 1, "At least 1 lot should be allowed"
+
+    buy_dates = np.sort(pd.DatetimeIndex(buy_dates).values)
+    sell_dates = buy_dates + np.timedelta64(pd.Timedelta(holding_period))
+
+    if policy == "skip":
+        max_lots = 1
+
+    kept = np.zeros(len(buy_dates), dtype=bool)
+
+    if policy == "extend":
+        # Index of the buy which opened the current position
+        current = -1
+        for i, buy in enumerate(buy_dates):
+            if current >= 0 and buy < sell_dates[current]:
+                sell_dates[current] = sell_dates[i]
+            else:
+                current = i
+                kept[i] = True
+        return buy_dates[kept], sell_dates[kept]
+
+    # The holding period is the same for every lot, so the lots are closed in the order they were opened
+    open_lot_sells = deque()
+    for i, buy in enumerate(buy_dates):
+        while open_lot_sells and open_lot_sells[0] <= buy:
+            open_lot_sells.popleft()
+        if len(open_lot_sells) < max_lots:
+            open_lot_sells.append(sell_dates[i])
+            kept[i] = True
+
+    return buy_dates[kept], sell_dates[kept]
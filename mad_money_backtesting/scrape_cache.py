@@ -0,0 +1,87 @@
+import datetime
+import json
+import os
+from pathlib import Path
+from typing import List, Union
+
+import pandas as pd
+
+
+def date_to_str(date: Union[str, datetime.datetime]) -> str:
+    return pd.to_datetime(date).strftime("%Y-%m-%d")
+
+
+class ScrapeCache:
+    """
+    On-disk cache of the scraped data, one file per date (so a crash only loses the dates in progress)
+
+    Dates without a show (`NoDataForDateException`) are also stored, so they are not requested again.
+    A date is stale (and should be scraped again) if it was scraped less than `stale_after_days` days after
+    the date itself, as the page can still change for recent dates
+    """
+
+    def __init__(self, root: Union[str, Path], keep_html: bool = False, stale_after_days: int = 3):
+        self.root = Path(root)
+        self.keep_html = keep_html
+        self.stale_after_days = stale_after_days
+
+        (self.root / "rows").mkdir(parents=True, exist_ok=True)
+        if self.keep_html:
+            (self.root / "html").mkdir(parents=True, exist_ok=True)
+
+    def _rows_path(self, date: str) -> Path:
+        return self.root / "rows" / f"{date}.json"
+
+    def _html_path(self, date: str) -> Path:
+        return self.root / "html" / f"{date}.html"
+
+    def _write_atomic(self, path: Path, text: str):
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def _read_entry(self, date: str) -> dict:
+        path = self._rows_path(date)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def is_cached(self, date: Union[str, datetime.datetime]) -> bool:
+        """
+        True if the date is in the cache and it is not stale
+        """
+
+        date = date_to_str(date)
+        entry = self._read_entry(date)
+        if entry is None:
+            return False
+        scraped_after = pd.Timestamp(entry["scraped_at"]) - pd.Timestamp(date)
+        return scraped_after >= pd.Timedelta(days=self.stale_after_days)
+
+    def get_rows(self, date: Union[str, datetime.datetime]) -> List[dict]:
+        """
+        Cached rows for the date (empty list if there was no show on that day)
+        """
+
+        entry = self._read_entry(date_to_str(date))
+        if entry is None:
+            raise KeyError(f"{date} is not cached")
+        return entry["rows"]
+
+    def put_rows(self, date: Union[str, datetime.datetime], rows: List[dict], no_data: bool = False):
+        date = date_to_str(date)
+        entry = {"date": date, "scraped_at": datetime.datetime.now().isoformat(), "no_data": no_data, "rows": rows}
+        self._write_atomic(self._rows_path(date), json.dumps(entry))
+
+    def put_no_data(self, date: Union[str, datetime.datetime]):
+        self.put_rows(date, [], no_data=True)
+
+    def put_html(self, date: Union[str, datetime.datetime], html: str):
+        if self.keep_html:
+            self._write_atomic(self._html_path(date_to_str(date)), html)
+
+    def get_html(self, date: Union[str, datetime.datetime]) -> str:
+        return self._html_path(date_to_str(date)).read_text(encoding="utf-8")
+
+    def cached_dates(self) -> List[str]:
+        return sorted(p.stem for p in (self.root / "rows").glob("*.json"))
@@ -0,0 +1,382 @@
+import concurrent.futures
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from mad_money_backtesting import batch
+from mad_money_backtesting.backtesting_strategies import BuyAndHold, _QuickBuySellStrategies
+from mad_money_backtesting.batch import SharedPrices
+from mad_money_backtesting.instrumentation import get_instrumentation
+from mad_money_backtesting.trading_calendar import DEFAULT_TZ, TradingCalendar
+from mad_money_backtesting.untils import pd_date_to_datetime
+from mad_money_backtesting.vectorized import POSITION_SIZE, _date_rules, candidate_exits, candidate_positions, \
+    candidate_windows, resolve_signal_bars, simulate_candidates
+
+SUMMARY_COLUMNS = ["Symbol", "# Recommendations", "Return [%]", "Random Mean [%]", "Random Median [%]",
+                   "CI Low [%]", "CI High [%]", "Excess Return [%]", "p-value"]
+
+
+class MonteCarloResult:
+    """
+    Result of the random date baseline: the real and the random returns of every symbol
+
+    `summary` has one row per symbol, `random_returns` has one column per random date set (the i-th set of every
+    symbol is a "random Cramer" for the whole universe, see `universe()`)
+    """
+
+    def __init__(self, summary: pd.DataFrame, random_returns: pd.DataFrame, failed: Dict[str, str],
+                 confidence: float):
+        self.summary = summary
+        self.random_returns = random_returns
+        self.failed = failed
+        self.confidence = confidence
+
+    def universe(self) -> pd.Series:
+        """
+        Tests the mean return across the symbols against the mean returns of the random date sets
+        """
+
+        real_mean = self.summary.set_index("Symbol").loc[self.random_returns.index, "Return [%]"].mean()
+        random_means = self.random_returns.mean(axis=0).to_numpy()
+        ci_low, ci_high = _confidence_interval(random_means, self.confidence)
+
+        return pd.Series({"# Symbols": len(self.random_returns),
+                          "Mean Return [%]": real_mean,
+                          "Random Mean [%]": random_means.mean(),
+                          "CI Low [%]": ci_low,
+                          "CI High [%]": ci_high,
+                          "Excess Return [%]": real_mean - random_means.mean(),
+                          "p-value": p_value(real_mean, random_means)})
+
+
+def p_value(real_value: float, random_values: np.ndarray) -> float:
+    """
+    One-sided permutation p-value: how likely it is to get at least the real value with random dates
+    """
+
+    return (1 + np.count_nonzero(random_values >= real_value)) / (len(random_values) + 1)
+
+
+def _confidence_interval(values: np.ndarray, confidence: float) -> Tuple[float, float]:
+    tail = (1 - confidence) / 2 * 100
+    return tuple(np.percentile(values, [tail, 100 - tail]))
+
+
+def _trading_days(calendar: TradingCalendar) -> List[datetime]:
+    """
+    Days of the stock data (midnight in New York time), the random recommendation dates are drawn from these
+    """
+
+    bar_dates = calendar.bar_dates
+    if bar_dates.tz is not None:
+        bar_dates = bar_dates.tz_convert(DEFAULT_TZ).tz_localize(None)
+    return list(bar_dates.normalize().unique().to_pydatetime())
+
+
+def random_date_sets(nb_days: int, nb_dates: int, nb_sets: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Indices of `nb_sets` random sets of `nb_dates` different days (sorted in every set)
+    """
+
+    nb_dates = min(nb_dates, nb_days)
+    indices = np.argpartition(rng.random((nb_sets, nb_days)), nb_dates - 1, axis=1)[:, :nb_dates]
+    return np.sort(indices, axis=1)
+
+
+def _resolve_bars_keep_invalid(calendar: TradingCalendar, dates) -> np.ndarray:
+    """
+    Same as `calendar.resolve_bars(dates, mode="next_date")`, but the dates without a bar are -1 instead of dropped,
+    so the dates of all the sets can be resolved together
+    """
+
+    bars = calendar.search(calendar.localize(dates), side="left")
+    return np.where(bars < len(calendar.bar_dates), bars, -1)
+
+
+def _set_signal_bars(strategy_class, calendar: TradingCalendar, days: List[datetime], day_sets: np.ndarray,
+                     strategy_params: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Buy and sell bars of every random set with the date rules of the strategy, as (set id, bar) pairs
+
+    The date rules are evaluated once per day where they allow it: the quick buy/sell strategies calculate both
+    dates of every recommendation independently, `BuyAndHold` only its buy dates (the sell dates depend on the
+    other recommendations through the holding policy, so they are scheduled for every set). Other strategies
+    calculate the dates of every set. The dates of all the sets are resolved to bars together
+    """
+
+    nb_sets, nb_dates = day_sets.shape
+    date_rules = _date_rules(strategy_class, strategy_params)
+
+    if isinstance(date_rules, _QuickBuySellStrategies):
+        buy_dates, sell_dates = date_rules._calculate_buy_sell_dates(days)
+        day_buy_bars = _resolve_bars_keep_invalid(calendar, buy_dates)
+        day_sell_bars = _resolve_bars_keep_invalid(calendar, sell_dates)
+        set_ids = np.repeat(np.arange(nb_sets), nb_dates)
+        return set_ids, day_buy_bars[day_sets.ravel()], set_ids, day_sell_bars[day_sets.ravel()]
+
+    if isinstance(date_rules, BuyAndHold):
+        day_buy_dates = pd.DatetimeIndex([date_rules._calc_buy_date(d) for d in days]).values
+        set_dates = [date_rules._schedule_positions(day_buy_dates[day_indices]) for day_indices in day_sets]
+    else:
+        set_dates = [date_rules._calculate_buy_sell_dates([days[i] for i in day_indices]) for day_indices in day_sets]
+
+    buy_dates = [pd.DatetimeIndex(set_buy_dates).values for set_buy_dates, _ in set_dates]
+    sell_dates = [pd.DatetimeIndex(set_sell_dates).values for _, set_sell_dates in set_dates]
+    buy_set_ids = np.repeat(np.arange(nb_sets), [len(d) for d in buy_dates])
+    sell_set_ids = np.repeat(np.arange(nb_sets), [len(d) for d in sell_dates])
+
+    return buy_set_ids, _resolve_bars_keep_invalid(calendar, np.concatenate(buy_dates)), \
+        sell_set_ids, _resolve_bars_keep_invalid(calendar, np.concatenate(sell_dates))
+
+
+def _set_keys(set_ids: np.ndarray, bars: np.ndarray, stride: int) -> np.ndarray:
+    """
+    Sorted, unique (set id, bar) pairs encoded as `set_id * stride + bar` (the invalid bars are dropped)
+    """
+
+    valid = bars >= 0
+    return np.unique(set_ids[valid] * stride + bars[valid])
+
+
+def batched_candidates(buy_keys: np.ndarray, sell_keys: np.ndarray, nb_bars: int,
+                       stride: int) -> Tuple[np.ndarray, dict]:
+    """
+    `candidate_positions` for many date sets at once: a buy is closed on the first sell bar after it in its own set
+
+    Returns the set id of every candidate and the candidates (which can be passed to `candidate_exits`)
+    """
+
+    set_ids, buy_bars = buy_keys // stride, buy_keys % stride
+    # Orders placed in the first and last bars are never executed by the engine
+    valid = (buy_bars > 0) & (buy_bars < nb_bars - 1)
+    set_ids, buy_bars, buy_keys = set_ids[valid], buy_bars[valid], buy_keys[valid]
+
+    next_sell_indices = np.minimum(np.searchsorted(sell_keys, buy_keys, side="right"), len(sell_keys) - 1)
+    next_sell_keys = sell_keys[next_sell_indices] if len(sell_keys) else np.full(len(buy_keys), -1)
+    has_sell = (next_sell_keys > buy_keys) & (next_sell_keys // stride == set_ids)
+    sell_signal_bars = np.where(has_sell, next_sell_keys % stride, nb_bars - 1)
+
+    window_ids, window_bars = candidate_windows(buy_bars, sell_signal_bars)
+    return set_ids, {"nb_bars": nb_bars,
+                     "buy_bars": buy_bars,
+                     "sell_signal_bars": sell_signal_bars,
+                     "has_sell": has_sell,
+                     "window_ids": window_ids,
+                     "window_bars": window_bars}
+
+
+def simulate_sets(close: np.ndarray, set_ids: np.ndarray, candidates: dict, exits: dict, nb_sets: int,
+                  cash: float, commission: float) -> np.ndarray:
+    """
+    Final equity of every date set, with the same position selection and sizing as `simulate_candidates`
+
+    The candidates are ordered by (set, buy bar), so this is a single loop over the candidates of all the sets
+    """
+
+    nb_bars = candidates["nb_bars"]
+    buy_bars = candidates["buy_bars"].tolist()
+    entry_prices = close[candidates["buy_bars"]].tolist()
+    exit_bars = exits["exit_signal_bars"].tolist()
+    exit_prices = exits["exit_prices"].tolist()
+    is_closed = exits["is_closed"].tolist()
+    last_close = close[-1]
+
+    equity_final = np.full(nb_sets, float(cash))
+    current_set = -1
+    current_cash = free_from_bar = 0
+
+    for i, set_id in enumerate(set_ids.tolist()):
+        if set_id != current_set:
+            if current_set >= 0:
+                equity_final[current_set] = current_cash
+            current_set, current_cash, free_from_bar = set_id, float(cash), 0
+
+        if buy_bars[i] < free_from_bar:
+            continue
+        free_from_bar = exit_bars[i] if is_closed[i] else nb_bars
+
+        entry_price = entry_prices[i]
+        size = int((current_cash * POSITION_SIZE) // (entry_price * (1 + commission)))
+        if is_closed[i]:
+            current_cash += size * (exit_prices[i] * (1 - commission) - entry_price * (1 + commission))
+        else:
+            # Still open at the end, valued at the last close (its exit commission is not paid yet)
+            current_cash += size * (last_close - entry_price * (1 + commission))
+
+    if current_set >= 0:
+        equity_final[current_set] = current_cash
+    return equity_final
+
+
+def random_returns_for_symbol(strategy_class, stock_df: pd.DataFrame, nb_dates: int, nb_sets: int,
+                              rng: np.random.Generator, cash: float, commission: float,
+                              stop_loss_perc: float = None, take_profit_perc: float = None,
+                              block_size: int = 256, **strategy_params) -> np.ndarray:
+    """
+    Returns [%] of `nb_sets` random sets of `nb_dates` recommendation days for a single symbol
+
+    The sets are evaluated in blocks of `block_size` sets (every block is a single vectorized pass, the memory of the
+    stop loss/take profit windows grows with the block size)
+    """
+
+    calendar = TradingCalendar.from_df(stock_df)
+    open_, high, low, close = (stock_df[c].to_numpy(dtype=float) for c in ("Open", "High", "Low", "Close"))
+    nb_bars = len(close)
+    stride = nb_bars + 1
+
+    days = _trading_days(calendar)
+    day_sets = random_date_sets(len(days), nb_dates, nb_sets, rng)
+
+    equity_final = np.empty(nb_sets)
+    for start in range(0, nb_sets, block_size):
+        block = day_sets[start:start + block_size]
+        buy_set_ids, buy_bars, sell_set_ids, sell_bars = _set_signal_bars(strategy_class, calendar, days, block,
+                                                                          strategy_params)
+        set_ids, candidates = batched_candidates(_set_keys(buy_set_ids, buy_bars, stride),
+                                                 _set_keys(sell_set_ids, sell_bars, stride), nb_bars, stride)
+        exits = candidate_exits(open_, high, low, close, candidates, stop_loss_perc, take_profit_perc)
+        equity_final[start:start + len(block)] = simulate_sets(close, set_ids, candidates, exits, len(block), cash,
+                                                               commission)
+
+    return (equity_final - cash) / cash * 100
+
+
+def _monte_carlo_symbol(strategy_class, symbol: str, stock_df: pd.DataFrame, recommendation_dates: list,
+                        config: dict) -> Tuple[dict, np.ndarray]:
+    """
+    Real return of the symbol (the same as `run_vectorized`) and the returns of the random date sets
+    """
+
+    cash, commission = config["cash"], config["commission"]
+    risk_params = {"stop_loss_perc": config["stop_loss_perc"], "take_profit_perc": config["take_profit_perc"]}
+    instrumentation = get_instrumentation()
+
+    with instrumentation.symbol(symbol), instrumentation.stage("monte_carlo"):
+        calendar = TradingCalendar.from_df(stock_df)
+        open_, high, low, close = (stock_df[c].to_numpy(dtype=float) for c in ("Open", "High", "Low", "Close"))
+        buy_bars, sell_bars = resolve_signal_bars(strategy_class, calendar, recommendation_dates,
+                                                  **config["strategy_params"])
+        candidates = candidate_positions(buy_bars, sell_bars, len(close))
+        real_return = (simulate_candidates(open_, high, low, close, candidates, cash, commission,
+                                           **risk_params)["equity_final"] - cash) / cash * 100
+
+        # Every symbol has its own random stream, so the results do not depend on the chunks of the workers
+        rng = np.random.default_rng([config["seed"], zlib.crc32(symbol.encode())])
+        nb_dates = len({pd_date_to_datetime(d).date() for d in recommendation_dates})
+        random_returns = random_returns_for_symbol(strategy_class, stock_df, nb_dates, config["nb_sets"], rng, cash,
+                                                   commission, block_size=config["block_size"], **risk_params,
+                                                   **config["strategy_params"])
+        instrumentation.count("monte_carlo.sets", config["nb_sets"])
+
+    ci_low, ci_high = _confidence_interval(random_returns, config["confidence"])
+    row = {"Symbol": symbol,
+           "# Recommendations": nb_dates,
+           "Return [%]": real_return,
+           "Random Mean [%]": random_returns.mean(),
+           "Random Median [%]": np.median(random_returns),
+           "CI Low [%]": ci_low,
+           "CI High [%]": ci_high,
+           "Excess Return [%]": real_return - random_returns.mean(),
+           "p-value": p_value(real_return, random_returns)}
+    return row, random_returns
+
+
+def _monte_carlo_chunk(strategy_class, chunk: List[Tuple[str, list]],
+                       config: dict) -> Tuple[List[Tuple[dict, np.ndarray]], Dict[str, str]]:
+    """
+    Evaluates a chunk of symbols in a worker process (the prices are read from shared memory)
+    """
+
+    results = []
+    failed = {}
+    for symbol, recommendation_dates in chunk:
+        try:
+            results.append(_monte_carlo_symbol(strategy_class, symbol, batch._worker_prices.stock_df(symbol),
+                                               recommendation_dates, config))
+        except Exception as e:
+            failed[symbol] = str(e)
+    return results, failed
+
+
+def monte_carlo(strategy_class,
+                recommendations_df: pd.DataFrame,
+                prices: Dict[str, pd.DataFrame],
+                cash: float,
+                commission: float,
+                nb_sets: int = 1000,
+                stop_loss_perc: float = None,
+                take_profit_perc: float = None,
+                confidence: float = 0.95,
+                seed: int = 0,
+                max_workers: int = None,
+                chunk_size: int = 16,
+                block_size: int = 256,
+                progress: bool = True,
+                **strategy_params) -> MonteCarloResult:
+    """
+    Random date baseline: does following the recommendations beat buying the same stocks on random days?
+
+    For every symbol `nb_sets` random sets of recommendation days are drawn from the days of its stock data (as many
+    days as it was recommended on), and they are backtested with the date rules of the strategy in a vectorized way.
+    The real return is reported next to the distribution of the random returns (mean, median, `confidence`
+    interval) and the one-sided p-value of the real return
+    """
+
+    if strategy_params.get("holding_policy") == "lots" and strategy_params.get("max_lots", 1) > 1:
+        raise NotImplementedError("The vectorized engine holds a single position at a time")
+
+    config = {"cash": cash,
+              "commission": commission,
+              "nb_sets": nb_sets,
+              "stop_loss_perc": stop_loss_perc,
+              "take_profit_perc": take_profit_perc,
+              "confidence": confidence,
+              "seed": seed,
+              "block_size": block_size,
+              "strategy_params": strategy_params}
+
+    tasks = []
+    for symbol, dates in recommendations_df.groupby("symbol", observed=True, sort=False)["date"]:
+        if symbol not in prices or len(prices[symbol]) == 0:
+            print(f"There was a problem with {symbol} - There is not data in the dataframe")
+            continue
+        tasks.append((symbol, [pd_date_to_datetime(d) for d in dates]))
+
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    shared_prices = SharedPrices.create({symbol: prices[symbol] for symbol, _ in tasks})
+    rows, random_returns, all_failed = [], {}, {}
+
+    pbar = tqdm(total=len(tasks), desc="Simulating random dates...", disable=not progress)
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                                    initializer=batch._attach_shared_prices,
+                                                    initargs=(shared_prices,)) as executor:
+            futures = {executor.submit(_monte_carlo_chunk, strategy_class, chunk, config): chunk for chunk in chunks}
+
+            for f in concurrent.futures.as_completed(futures):
+                try:
+                    results, failed = f.result()
+                except Exception as e:
+                    # The whole worker failed (e.g. it was killed), every symbol of the chunk is marked as failed
+                    results, failed = [], {symbol: str(e) for symbol, _ in futures[f]}
+                for symbol, error in failed.items():
+                    print(f"There was a problem with {symbol} - {error}")
+                all_failed.update(failed)
+                for row, symbol_random_returns in results:
+                    rows.append(row)
+                    random_returns[row["Symbol"]] = symbol_random_returns
+                pbar.update(len(futures[f]))
+    finally:
+        pbar.close()
+        shared_prices.close(unlink=True)
+
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS).sort_values("Symbol", ignore_index=True)
+    random_returns_df = pd.DataFrame.from_dict(random_returns, orient="index").reindex(summary["Symbol"])
+    random_returns_df.index.name = "Symbol"
+    return MonteCarloResult(summary, random_returns_df, all_failed, confidence)
@@ -0,0 +1,168 @@
+import concurrent.futures
+import itertools
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from mad_money_backtesting import batch
+from mad_money_backtesting.batch import SharedPrices
+from mad_money_backtesting.trading_calendar import TradingCalendar
+from mad_money_backtesting.untils import pd_date_to_datetime
+from mad_money_backtesting.vectorized import candidate_positions, resolve_signal_bars, simulate_candidates
+
+# These parameters do not change the buy/sell dates, so the resolved bars can be reused for them
+RISK_PARAMETERS = ("stop_loss_perc", "take_profit_perc")
+
+RESULT_COLUMNS = ["Return [%]", "Equity Final [$]", "# Trades", "Win Rate [%]"]
+
+
+def _expand_grid(param_grid: Dict[str, list]) -> Tuple[List[dict], List[dict]]:
+    """
+    Splits the grid to the combinations of the date parameters and the combinations of the risk parameters
+    """
+
+    date_grid = {k: v for k, v in param_grid.items() if k not in RISK_PARAMETERS}
+    risk_grid = {k: param_grid.get(k, [None]) for k in RISK_PARAMETERS}
+
+    date_combinations = [dict(zip(date_grid.keys(), values)) for values in itertools.product(*date_grid.values())]
+    risk_combinations = [dict(zip(risk_grid.keys(), values)) for values in itertools.product(*risk_grid.values())]
+    return date_combinations, risk_combinations
+
+
+def _sweep_symbol(strategy_class, symbol: str, stock_df: pd.DataFrame, recommendation_dates: list,
+                  config: dict) -> Dict[str, list]:
+    """
+    Evaluates every parameter combination for a single symbol
+
+    The price arrays and the calendar are created once, and the buy/sell bars are resolved once for every
+    combination of the date parameters (the stop loss/take profit combinations reuse them)
+    """
+
+    cash, commission = config["cash"], config["commission"]
+    calendar = TradingCalendar.from_df(stock_df)
+    open_, high, low, close = (stock_df[c].to_numpy(dtype=float) for c in ("Open", "High", "Low", "Close"))
+
+    rows = {k: [] for k in ["Symbol"] + config["param_names"] + RESULT_COLUMNS}
+
+    for date_params in config["date_combinations"]:
+        buy_bars, sell_bars = resolve_signal_bars(strategy_class, calendar, recommendation_dates, **date_params)
+        candidates = candidate_positions(buy_bars, sell_bars, len(close))
+
+        for risk_params in config["risk_combinations"]:
+            simulated = simulate_candidates(open_, high, low, close, candidates, cash, commission, **risk_params)
+            closed_pnl = simulated["pnl"][simulated["is_closed"]]
+
+            rows["Symbol"].append(symbol)
+            for k, v in itertools.chain(date_params.items(), risk_params.items()):
+                rows[k].append(v)
+            rows["Return [%]"].append((simulated["equity_final"] - cash) / cash * 100)
+            rows["Equity Final [$]"].append(simulated["equity_final"])
+            rows["# Trades"].append(len(closed_pnl))
+            rows["Win Rate [%]"].append((closed_pnl > 0).mean() * 100 if len(closed_pnl) else np.nan)
+
+    return rows
+
+
+def _sweep_chunk(strategy_class, chunk: List[Tuple[str, list]], config: dict) -> Tuple[Dict[str, list], Dict[str, str]]:
+    """
+    Sweeps a chunk of symbols in a worker process (the prices are read from shared memory)
+    """
+
+    chunk_rows = {}
+    failed = {}
+    for symbol, recommendation_dates in chunk:
+        try:
+            rows = _sweep_symbol(strategy_class, symbol, batch._worker_prices.stock_df(symbol), recommendation_dates,
+                                 config)
+        except Exception as e:
+            failed[symbol] = str(e)
+            continue
+        for k, v in rows.items():
+            chunk_rows.setdefault(k, []).extend(v)
+    return chunk_rows, failed
+
+
+def sweep(strategy_class,
+          recommendations_df: pd.DataFrame,
+          prices: Dict[str, pd.DataFrame],
+          param_grid: Dict[str, list],
+          cash: float,
+          commission: float,
+          max_workers: int = None,
+          chunk_size: int = 16,
+          progress: bool = True) -> pd.DataFrame:
+    """
+    Evaluates every combination of the parameter grid (e.g. stop_loss_perc, take_profit_perc, sell_horizon)
+    across all the symbols with the vectorized engine
+
+    Returns a tidy DataFrame with one row per (symbol, parameters), see `rank_sweep_results` for the aggregation
+    """
+
+    date_combinations, risk_combinations = _expand_grid(param_grid)
+    for date_params in date_combinations:
+        if date_params.get("holding_policy") == "lots" and date_params.get("max_lots", 1) > 1:
+            raise NotImplementedError(f"The vectorized engine holds a single position at a time: {date_params}")
+
+    config = {"cash": cash,
+              "commission": commission,
+              "param_names": list(date_combinations[0].keys()) + list(RISK_PARAMETERS),
+              "date_combinations": date_combinations,
+              "risk_combinations": risk_combinations}
+
+    tasks = []
+    for symbol, dates in recommendations_df.groupby("symbol", observed=True, sort=False)["date"]:
+        if symbol not in prices or len(prices[symbol]) == 0:
+            print(f"There was a problem with {symbol} - There is not data in the dataframe")
+            continue
+        tasks.append((symbol, [pd_date_to_datetime(d) for d in dates]))
+
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    shared_prices = SharedPrices.create({symbol: prices[symbol] for symbol, _ in tasks})
+    all_rows = {}
+
+    pbar = tqdm(total=len(tasks), desc="Sweeping parameters...", disable=not progress)
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                                    initializer=batch._attach_shared_prices,
+                                                    initargs=(shared_prices,)) as executor:
+            futures = {executor.submit(_sweep_chunk, strategy_class, chunk, config): chunk for chunk in chunks}
+
+            for f in concurrent.futures.as_completed(futures):
+                try:
+                    chunk_rows, failed = f.result()
+                except Exception as e:
+                    # The whole worker failed (e.g. it was killed), every symbol of the chunk is marked as failed
+                    chunk_rows, failed = {}, {symbol: str(e) for symbol, _ in futures[f]}
+                for symbol, error in failed.items():
+                    print(f"There was a problem with {symbol} - {error}")
+                for k, v in chunk_rows.items():
+                    all_rows.setdefault(k, []).extend(v)
+                pbar.update(len(futures[f]))
+    finally:
+        pbar.close()
+        shared_prices.close(unlink=True)
+
+    if len(all_rows) == 0:
+        return pd.DataFrame(columns=["Symbol"] + config["param_names"] + RESULT_COLUMNS)
+    return pd.DataFrame(all_rows)
+
+
+def rank_sweep_results(sweep_df: pd.DataFrame, by: str = "Mean Return [%]") -> pd.DataFrame:
+    """
+    Aggregates the sweep results across the symbols for every parameter combination and ranks them
+    """
+
+    param_names = [c for c in sweep_df.columns if c not in ["Symbol"] + RESULT_COLUMNS]
+    grouped = sweep_df.groupby(param_names, dropna=False)["Return [%]"]
+
+    ranking_df = pd.DataFrame({"Mean Return [%]": grouped.mean(),
+                               "Median Return [%]": grouped.median(),
+                               "Positive Returns [%]": grouped.apply(lambda x: (x > 0).mean() * 100),
+                               "Symbols": grouped.size()})
+    ranking_df = ranking_df.sort_values(by, ascending=False)
+    ranking_df["Rank"] = np.arange(1, len(ranking_df) + 1)
+    return ranking_df.reset_index()
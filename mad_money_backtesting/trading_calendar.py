@@ -0,0 +1,104 @@
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Cramer's recommendation dates (and the dates we calculate from them) are in New York time
+DEFAULT_TZ = "America/New_York"
+
+
+class TradingCalendar:
+    """
+    Sorted index of the available bars of a single symbol
+
+    It is built once per symbol and it is used to map the calculated buy/sell dates to existing bars
+    with binary search (instead of scanning the whole date column for every date)
+    """
+
+    RESOLVE_MODES = {"drop", "next_date", "prev_date"}
+
+    def __init__(self, bar_dates):
+        self.bar_dates = pd.DatetimeIndex(bar_dates)
+
+        if not self.bar_dates.is_monotonic_increasing:
+            raise ValueError("The bar dates should be sorted ascending")
+
+    @classmethod
+    def from_df(cls, stock_df: pd.DataFrame) -> "TradingCalendar":
+        return cls(stock_df["Date"])
+
+    def __len__(self):
+        return len(self.bar_dates)
+
+    def localize(self, dates) -> pd.DatetimeIndex:
+        """
+        Assign TZs to the (whole list of) dates and convert them to the TZ of the bars
+
+        Naive dates are treated as New York time, dates which already have a TZ are only converted
+        """
+
+        dates = pd.DatetimeIndex(dates)
+
+        if dates.tz is None:
+            dates = dates.tz_localize(DEFAULT_TZ)
+
+        if self.bar_dates.tz is None:
+            return dates.tz_convert(DEFAULT_TZ).tz_localize(None)
+        return dates.tz_convert(self.bar_dates.tz)
+
+    def search(self, dates: pd.DatetimeIndex, side: str = "left") -> np.ndarray:
+        """
+        `self.bar_dates.searchsorted(dates, side)` for localized dates
+
+        The dates after the last bar are not passed to the binary search, as they could be out of the bounds of the
+        unit of the bars (e.g. a long sell horizon can go past 2262 which does not fit to nanoseconds)
+        """
+
+        nb_bars = len(self.bar_dates)
+        if nb_bars == 0:
+            return np.zeros(len(dates), dtype=np.intp)
+
+        is_after = np.asarray(dates > self.bar_dates[-1])
+        if not is_after.any():
+            return self.bar_dates.searchsorted(dates, side=side)
+
+        bars = np.full(len(dates), nb_bars, dtype=np.intp)
+        bars[~is_after] = self.bar_dates.searchsorted(dates[~is_after], side=side)
+        return bars
+
+    def resolve_bars(self, dates, mode: str = "next_date") -> np.ndarray:
+        """
+        Some dates are non existent in our downloaded stock data (e.g. missing days), this maps every date to
+        the index of a bar based on the mode:
+
+        - drop: date is dropped if there is no bar for it
+        - next_date: the first bar at or after the date is used (dropped if there is no later bar)
+        - prev_date: the last bar at or before the date is used (dropped if there is no earlier bar)
+
+        The order of the dates is kept
+        """
+
+        assert mode in self.RESOLVE_MODES, f"Mode {mode} not available"
+
+        dates = self.localize(dates)
+        nb_bars = len(self.bar_dates)
+
+        if mode == "prev_date":
+            bars = self.search(dates, side="right") - 1
+            return bars[bars >= 0]
+
+        bars = self.search(dates, side="left")
+        is_valid = bars < nb_bars
+
+        if mode == "drop":
+            is_valid[is_valid] = self.bar_dates[bars[is_valid]] == dates[is_valid]
+
+        return bars[is_valid]
+
+    def resolve_dates(self, dates, mode: str = "next_date") -> List[datetime]:
+        """
+        Same as `resolve_bars`, but it returns the dates of the bars
+        """
+
+        return list(self.bar_dates[self.resolve_bars(dates, mode)].to_pydatetime())
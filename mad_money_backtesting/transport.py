@@ -0,0 +1,149 @@
+import concurrent.futures
+import itertools
+import random
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Tuple, Type
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter which spaces out the requests, so there are at most `requests_per_second` requests
+    in every second (None means no limit)
+    """
+
+    def __init__(self, requests_per_second: float = None):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class ScraperTransport:
+    """
+    HTTP layer of the scraper: one pooled session for all the requests, bounded concurrency, rate limiting and
+    retries with exponential backoff (with jitter)
+
+    The URL is a parameter, so it can be pointed to a local server (e.g. in tests)
+    """
+
+    def __init__(self,
+                 url: str,
+                 max_workers: int = 8,
+                 requests_per_second: float = 4.0,
+                 max_attempts: int = 5,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 30.0,
+                 timeout: int = 10):
+        assert max_workers >= 1, "At least 1 worker is needed"
+        assert max_attempts >= 1, "At least 1 attempt is needed"
+
+        self.url = url
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.rate_limiter = RateLimiter(requests_per_second)
+
+        # The pool should have a connection for every worker, so the connections are reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Number of retried attempts (over all the calls)
+        self.nb_retries = 0
+        self._retries_lock = threading.Lock()
+
+    def get(self, **kwargs) -> requests.Response:
+        self.rate_limiter.wait()
+        return self.session.get(self.url, timeout=self.timeout, **kwargs)
+
+    def post(self, **kwargs) -> requests.Response:
+        self.rate_limiter.wait()
+        response = self.session.post(self.url, timeout=self.timeout, **kwargs)
+        # Error pages (e.g. 429 or 503 when we are throttled) should be retried
+        response.raise_for_status()
+        return response
+
+    def backoff_time(self, attempt: int) -> float:
+        """
+        Exponential backoff with "full jitter", so the retrying workers do not hit the site at the same time
+        """
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def call_with_retries(self, fn: Callable, *args, no_retry: Tuple[Type[Exception], ...] = (), **kwargs):
+        """
+        Calls the function until it succeeds or we run out of attempts (then the last error is raised)
+        Errors in `no_retry` are raised immediately
+        """
+
+        for attempt in range(self.max_attempts):
+            try:
+                return fn(*args, **kwargs)
+            except no_retry:
+                raise
+            except Exception:
+                if attempt == self.max_attempts - 1:
+                    raise
+                with self._retries_lock:
+                    self.nb_retries += 1
+                time.sleep(self.backoff_time(attempt))
+
+    def map(self, fn: Callable, items: Iterable,
+            no_retry: Tuple[Type[Exception], ...] = ()) -> Iterator[Tuple[object, object, Exception]]:
+        """
+        Calls the function (with retries) for every item with `max_workers` parallel calls
+
+        Yields (item, result, error) as the calls complete, error is None if the call succeeded. At most
+        2 x `max_workers` calls are submitted at a time (new ones are submitted as the calls complete), so the
+        results which were already yielded are not kept in memory, and closing the generator early does not wait
+        for all the remaining items
+        """
+
+        items = iter(items)
+        max_in_flight = 2 * self.max_workers
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            try:
+                while True:
+                    for item in itertools.islice(items, max_in_flight - len(futures)):
+                        futures[executor.submit(self.call_with_retries, fn, item, no_retry=no_retry)] = item
+                    if len(futures) == 0:
+                        break
+
+                    done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for f in done:
+                        item = futures.pop(f)
+                        try:
+                            result, error = f.result(), None
+                        except Exception as e:
+                            result, error = None, e
+                        yield item, result, error
+            finally:
+                # E.g. the generator is closed early, the calls which are not running yet are not started
+                for f in futures:
+                    f.cancel()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
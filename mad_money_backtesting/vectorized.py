@@ -0,0 +1,382 @@
+from datetime import datetime
+from numbers import Number
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from mad_money_backtesting.instrumentation import count_resolved_dates, get_instrumentation
+from mad_money_backtesting.trading_calendar import TradingCalendar
+from mad_money_backtesting.untils import pd_date_to_datetime
+
+# Commission is paid on every order, this is the fraction of the equity which is used for a new position
+# (the same as the `size` in `_BaseMadMoneyStrategy.next()`)
+POSITION_SIZE = 0.999
+
+TRADE_COLUMNS = ["Size", "EntryBar", "ExitBar", "EntryPrice", "ExitPrice", "PnL", "ReturnPct", "EntryTime",
+                 "ExitTime", "ExitReason"]
+
+
+def _date_rules(strategy_class, strategy_params: dict):
+    """
+    Strategy instance which is not connected to any data or broker, we only need its date calculation
+    """
+
+    strategy = strategy_class.__new__(strategy_class)
+    strategy._declare_parameters()
+    for k, v in strategy_params.items():
+        setattr(strategy, k, v)
+    return strategy
+
+
+def _strategy_dates(strategy_class, recommendation_dates: List[datetime], strategy_params: dict) -> Tuple[list, list]:
+    """
+    Calculates the (not localized) buy and sell dates with the date rules of the strategy class
+    """
+
+    return _date_rules(strategy_class, strategy_params)._calculate_buy_sell_dates(recommendation_dates)
+
+
+def resolve_signal_bars(strategy_class,
+                        calendar: TradingCalendar,
+                        recommendation_dates: List[datetime],
+                        **strategy_params) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Resolves the (sorted, unique) buy and sell bar indices for a strategy - this is the vectorized version of
+    `_BaseMadMoneyStrategy.__init__`
+    """
+
+    buy_dates, sell_dates = _strategy_dates(strategy_class, recommendation_dates, strategy_params)
+    buy_bars = calendar.resolve_bars(buy_dates, mode="next_date")
+    sell_bars = calendar.resolve_bars(sell_dates, mode="next_date")
+    count_resolved_dates(calendar, buy_dates, len(buy_bars))
+    count_resolved_dates(calendar, sell_dates, len(sell_bars))
+    return np.unique(buy_bars), np.unique(sell_bars)
+
+
+def candidate_windows(buy_bars: np.ndarray, sell_signal_bars: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Flattened [buy + 1, sell] windows of the candidate positions: the position index and the bar of every element
+    """
+
+    window_lengths = np.maximum(sell_signal_bars - buy_bars, 0)
+    window_starts = np.cumsum(window_lengths) - window_lengths
+    window_ids = np.repeat(np.arange(len(buy_bars)), window_lengths)
+    window_bars = np.arange(window_lengths.sum()) - np.repeat(window_starts, window_lengths) + \
+        np.repeat(buy_bars + 1, window_lengths)
+    return window_ids, window_bars
+
+
+def candidate_positions(buy_bars: np.ndarray, sell_bars: np.ndarray, nb_bars: int) -> dict:
+    """
+    Every buy bar is a candidate position which is closed on the first sell bar after the buy
+    (or it is held until the end). These only depend on the resolved dates, so they can be reused when only
+    the stop loss/take profit or the cash/commission changes
+
+    Every candidate also gets its window of bars in which it can be stopped out: [buy + 1, sell]
+    """
+
+    # Orders placed in the first and last bars are never executed by the engine
+    buy_bars = buy_bars[(buy_bars > 0) & (buy_bars < nb_bars - 1)]
+
+    next_sell_indices = np.searchsorted(sell_bars, buy_bars, side="right")
+    has_sell = next_sell_indices < len(sell_bars)
+    # Without any sell bar (e.g. the sell horizon is longer than the data) every position is held until the end
+    next_sell_bars = sell_bars[np.minimum(next_sell_indices, len(sell_bars) - 1)] if len(sell_bars) else nb_bars - 1
+    sell_signal_bars = np.where(has_sell, next_sell_bars, nb_bars - 1)
+
+    window_ids, window_bars = candidate_windows(buy_bars, sell_signal_bars)
+
+    return {"nb_bars": nb_bars,
+            "buy_bars": buy_bars,
+            "sell_signal_bars": sell_signal_bars,
+            "has_sell": has_sell,
+            "window_ids": window_ids,
+            "window_bars": window_bars}
+
+
+def _first_exit_hits(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                     candidates: dict,
+                     stop_loss_perc: float = None, take_profit_perc: float = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the first stop loss or take profit hit for every candidate position in one go
+
+    Returns the bar of the hit (-1 if there was no hit) and the fill price of the hit
+    """
+
+    entry_bars = candidates["buy_bars"]
+    nb_positions = len(entry_bars)
+    hit_bars = np.full(nb_positions, -1, dtype=np.int64)
+    hit_prices = np.full(nb_positions, np.nan)
+
+    if nb_positions == 0 or (not stop_loss_perc and not take_profit_perc):
+        return hit_bars, hit_prices
+
+    position_ids, bars = candidates["window_ids"], candidates["window_bars"]
+
+    entry_close = close[entry_bars]
+    stop_levels = entry_close - entry_close * stop_loss_perc if stop_loss_perc else np.full(nb_positions, -np.inf)
+    take_levels = entry_close + entry_close * take_profit_perc if take_profit_perc else np.full(nb_positions, np.inf)
+
+    stop_hit = low[bars] <= stop_levels[position_ids]
+    take_hit = high[bars] >= take_levels[position_ids]
+    any_hit = stop_hit | take_hit
+
+    # First hit in every window (the windows are ordered, so the first occurrence of a position id is the first hit)
+    hit_rows = np.flatnonzero(any_hit)
+    hit_positions, first_rows = np.unique(position_ids[hit_rows], return_index=True)
+    first_rows = hit_rows[first_rows]
+    hit_bar_values = bars[first_rows]
+
+    # When both of them are hit in the same bar, the stop loss order is processed first (pessimistic)
+    stop_fill = np.minimum(open_[hit_bar_values], stop_levels[hit_positions])
+    take_fill = np.maximum(open_[hit_bar_values], take_levels[hit_positions])
+
+    hit_bars[hit_positions] = hit_bar_values
+    hit_prices[hit_positions] = np.where(stop_hit[first_rows], stop_fill, take_fill)
+    return hit_bars, hit_prices
+
+
+def candidate_exits(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                    candidates: dict,
+                    stop_loss_perc: float = None, take_profit_perc: float = None) -> Dict[str, np.ndarray]:
+    """
+    Resolves the exit of every candidate position (the first stop loss/take profit hit or the sell signal)
+
+    The exits do not depend on the other positions, only the selection of the opened positions does
+    """
+
+    nb_bars = candidates["nb_bars"]
+    buy_bars, sell_signal_bars, has_sell = candidates["buy_bars"], candidates["sell_signal_bars"], \
+        candidates["has_sell"]
+
+    hit_bars, hit_prices = _first_exit_hits(open_, high, low, close, candidates, stop_loss_perc, take_profit_perc)
+    is_hit = hit_bars >= 0
+
+    # The bar from which we are allowed to buy again, and the bar from which the exit is reflected in the equity
+    return {"exit_signal_bars": np.where(is_hit, hit_bars, sell_signal_bars),
+            "exit_fill_bars": np.where(is_hit, hit_bars, sell_signal_bars + 1),
+            "exit_prices": np.where(is_hit, hit_prices, close[sell_signal_bars]),
+            "is_closed": is_hit | (has_sell & (sell_signal_bars < nb_bars - 1)),
+            "exit_reasons": np.where(is_hit, np.where(hit_prices < close[buy_bars], "SL", "TP"), "Sell")}
+
+
+def simulate_candidates(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                        candidates: dict,
+                        cash: float, commission: float,
+                        stop_loss_perc: float = None, take_profit_perc: float = None) -> dict:
+    """
+    Simulates the candidate positions (see `simulate_positions`) and returns the trades as arrays
+    """
+
+    nb_bars = candidates["nb_bars"]
+    buy_bars = candidates["buy_bars"]
+
+    exits = candidate_exits(open_, high, low, close, candidates, stop_loss_perc, take_profit_perc)
+    exit_signal_bars, exit_fill_bars, exit_prices, is_closed, exit_reasons = \
+        exits["exit_signal_bars"], exits["exit_fill_bars"], exits["exit_prices"], exits["is_closed"], \
+        exits["exit_reasons"]
+
+    # Selecting the positions which are actually opened, this is sequential, but it is a loop over the
+    # recommendations and not over the bars
+    selected = np.zeros(len(buy_bars), dtype=bool)
+    free_from_bar = 0
+    for i, buy_bar in enumerate(buy_bars):
+        if buy_bar >= free_from_bar:
+            selected[i] = True
+            free_from_bar = exit_signal_bars[i] if is_closed[i] else nb_bars
+
+    entry_bars = buy_bars[selected]
+    entry_prices = close[entry_bars]
+    exit_prices = exit_prices[selected]
+    is_closed = is_closed[selected]
+
+    # Position sizes depend on the cash we have after the previous trades
+    gross_returns = exit_prices / entry_prices
+    sizes = np.zeros(len(entry_bars), dtype=np.int64)
+    current_cash = cash
+    for i in range(len(entry_bars)):
+        sizes[i] = int((current_cash * POSITION_SIZE) // (entry_prices[i] * (1 + commission)))
+        if not is_closed[i]:
+            break
+        current_cash += sizes[i] * entry_prices[i] * (gross_returns[i] - 1 - commission * (1 + gross_returns[i]))
+
+    # Not enough cash even for a single share, the broker cancels the order
+    valid = sizes > 0
+    sizes, entry_bars, entry_prices, exit_prices, is_closed = sizes[valid], entry_bars[valid], entry_prices[valid], \
+        exit_prices[valid], is_closed[valid]
+
+    entry_commissions = sizes * entry_prices * commission
+    exit_commissions = sizes * exit_prices * commission
+    pnl = sizes * (exit_prices - entry_prices) - entry_commissions - exit_commissions
+
+    # Positions which are still open are valued at the last close (their exit commission is not paid yet)
+    open_pnl = sizes * (close[-1] - entry_prices) - entry_commissions
+
+    return {"sizes": sizes,
+            "entry_bars": entry_bars,
+            "exit_signal_bars": exit_signal_bars[selected][valid],
+            "exit_fill_bars": exit_fill_bars[selected][valid],
+            "entry_prices": entry_prices,
+            "exit_prices": exit_prices,
+            "entry_commissions": entry_commissions,
+            "pnl": pnl,
+            "is_closed": is_closed,
+            "exit_reasons": exit_reasons[selected][valid],
+            "equity_final": cash + np.where(is_closed, pnl, open_pnl).sum()}
+
+
+def _equity_curve(close: np.ndarray, simulated: dict, cash: float) -> np.ndarray:
+    """
+    Equity curve: cash + mark-to-market value of the open position, built from the deltas at the entries and exits
+    """
+
+    nb_bars = len(close)
+    sizes, entry_prices, is_closed = simulated["sizes"], simulated["entry_prices"], simulated["is_closed"]
+
+    cash_deltas = np.zeros(nb_bars + 1)
+    share_deltas = np.zeros(nb_bars + 1)
+    basis_deltas = np.zeros(nb_bars + 1)
+    fill_bars = simulated["entry_bars"] + 1
+    exit_fill_bars = np.where(is_closed, simulated["exit_fill_bars"], nb_bars)
+    np.add.at(cash_deltas, fill_bars, -simulated["entry_commissions"])
+    np.add.at(cash_deltas, exit_fill_bars, np.where(is_closed, simulated["pnl"] + simulated["entry_commissions"], 0))
+    np.add.at(share_deltas, fill_bars, sizes)
+    np.add.at(share_deltas, exit_fill_bars, -sizes)
+    np.add.at(basis_deltas, fill_bars, sizes * entry_prices)
+    np.add.at(basis_deltas, exit_fill_bars, -sizes * entry_prices)
+
+    return cash + np.cumsum(cash_deltas)[:nb_bars] + np.cumsum(share_deltas)[:nb_bars] * close - \
+        np.cumsum(basis_deltas)[:nb_bars]
+
+
+def simulate_positions(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                       buy_bars: np.ndarray, sell_bars: np.ndarray,
+                       cash: float, commission: float,
+                       stop_loss_perc: float = None, take_profit_perc: float = None) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Simulates the long positions opened on the buy bars and closed on the sell bars (or on stop loss/take profit)
+
+    It follows the order handling of `backtesting.Backtest(..., trade_on_close=True)`:
+    - orders are filled at the close of the bar in which they were placed
+    - a new position is only opened when we are not holding the stock
+    - the stop loss/take profit levels are relative to the close price of the buy bar
+    - commission is paid at entry and at exit
+
+    Returns the trades (positions which are still open at the end have no exit) and the equity curve
+    """
+
+    candidates = candidate_positions(buy_bars, sell_bars, len(close))
+    simulated = simulate_candidates(open_, high, low, close, candidates, cash, commission, stop_loss_perc,
+                                    take_profit_perc)
+    equity = _equity_curve(close, simulated, cash)
+
+    sizes, entry_prices, is_closed, pnl = simulated["sizes"], simulated["entry_prices"], simulated["is_closed"], \
+        simulated["pnl"]
+    trades = pd.DataFrame({"Size": sizes,
+                           "EntryBar": simulated["entry_bars"],
+                           "ExitBar": np.where(is_closed, simulated["exit_signal_bars"], -1),
+                           "EntryPrice": entry_prices,
+                           "ExitPrice": np.where(is_closed, simulated["exit_prices"], np.nan),
+                           "PnL": np.where(is_closed, pnl, np.nan),
+                           "ReturnPct": np.where(is_closed, pnl / (sizes * entry_prices), np.nan),
+                           "ExitReason": np.where(is_closed, simulated["exit_reasons"], "Open")})
+    return trades, equity
+
+
+def _strategy_str(strategy_class, params: dict) -> str:
+    """
+    Same format as `str(backtesting.Strategy)`, so `summarize_backtesting_results` can split it
+    """
+
+    params = ",".join(f"{k}={v if isinstance(v, (Number, str)) else ''}" for k, v in params.items())
+    return f"{strategy_class.__name__}({params})"
+
+
+def run_vectorized(stock_df: pd.DataFrame,
+                   strategy_class,
+                   recommendation_dates: List[datetime],
+                   cash: float,
+                   commission: float,
+                   stop_loss_perc: float = None,
+                   take_profit_perc: float = None,
+                   calendar: TradingCalendar = None,
+                   **strategy_params) -> pd.Series:
+    """
+    Vectorized alternative of `backtesting.Backtest(stock_df, strategy_class, trade_on_close=True).run(...)`
+
+    Only the buy and sell bars are resolved (with array lookups) instead of calling `next()` on every bar.
+    The returned Series has the same fields which are used by `summarize_backtesting_results`
+    """
+
+    if len(recommendation_dates) == 0:
+        raise RuntimeError("No recommendation dates are defined")
+
+    if strategy_params.get("holding_policy") == "lots" and strategy_params.get("max_lots", 1) > 1:
+        raise NotImplementedError("The vectorized engine holds a single position at a time, use backtesting.Backtest")
+
+    instrumentation = get_instrumentation()
+    instrumentation.count("bars", len(stock_df))
+
+    with instrumentation.stage("dates.resolve"):
+        if calendar is None:
+            calendar = TradingCalendar.from_df(stock_df)
+        bar_dates = calendar.bar_dates
+        buy_bars, sell_bars = resolve_signal_bars(strategy_class, calendar, recommendation_dates, **strategy_params)
+
+    with instrumentation.stage("vectorized.simulate"):
+        open_, high, low, close = (stock_df[c].to_numpy(dtype=float) for c in ("Open", "High", "Low", "Close"))
+        trades, equity = simulate_positions(open_, high, low, close, buy_bars, sell_bars, cash, commission,
+                                            stop_loss_perc, take_profit_perc)
+
+    trades["EntryTime"] = bar_dates[trades["EntryBar"].values]
+    trades["ExitTime"] = pd.Series(bar_dates[trades["ExitBar"].values], index=trades.index).where(
+        trades["ExitBar"] >= 0)
+    trades = trades[TRADE_COLUMNS]
+
+    closed_returns = trades["ReturnPct"].dropna().values * 100
+    params = {"recommendation_dates": recommendation_dates,
+              "stop_loss_perc": stop_loss_perc,
+              "take_profit_perc": take_profit_perc,
+              **strategy_params}
+
+    return pd.Series({
+        "Start": stock_df.index[0],
+        "End": stock_df.index[-1],
+        "Duration": stock_df.index[-1] - stock_df.index[0],
+        "Equity Final [$]": equity[-1],
+        "Equity Peak [$]": max(cash, equity.max()),
+        "Return [%]": (equity[-1] - cash) / cash * 100,
+        "Buy & Hold Return [%]": (close[-1] - close[0]) / close[0] * 100,
+        "# Trades": len(closed_returns),
+        "Win Rate [%]": (closed_returns > 0).mean() * 100 if len(closed_returns) else np.nan,
+        "Best Trade [%]": closed_returns.max() if len(closed_returns) else np.nan,
+        "Worst Trade [%]": closed_returns.min() if len(closed_returns) else np.nan,
+        "Avg. Trade [%]": closed_returns.mean() if len(closed_returns) else np.nan,
+        "_strategy": _strategy_str(strategy_class, params),
+        "_trades": trades,
+    })
+
+
+def run_vectorized_for_symbols(stock_dfs: Dict[str, pd.DataFrame],
+                               strategy_class,
+                               mad_money_df: pd.DataFrame,
+                               cash: float,
+                               commission: float,
+                               stop_loss_perc: float = None,
+                               take_profit_perc: float = None,
+                               **strategy_params) -> Dict[str, pd.Series]:
+    """
+    Runs the vectorized backtest for every symbol which has stock data and recommendations
+    """
+
+    results = {}
+    recommendations = mad_money_df.groupby("symbol", observed=True)["date"]
+
+    for symbol, dates in recommendations:
+        if symbol not in stock_dfs:
+            continue
+        recommendation_dates = [pd_date_to_datetime(d) for d in dates]
+        results[symbol] = run_vectorized(stock_dfs[symbol], strategy_class, recommendation_dates, cash, commission,
+                                         stop_loss_perc, take_profit_perc, **strategy_params)
+    return results
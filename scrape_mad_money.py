@@ -1,32 +1,22 @@
 import argparse
-from pathlib import Path
+import os
+import sys
+from typing import List
 
-import mad_money_backtesting as mmb
+from mad_money_backtesting.cli import add_scrape_arguments, scrape
 
 
-def get_args():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-f", "--from-date", type=str, default="2020-01-01",
-                        help="The scraping will start at this date.")
-    parser.add_argument("-t", "--to-date", type=str, default=None,
-                        help="The scraping will end at this date. If not defined, then today will be used")
-    parser.add_argument("-o", "--output", type=str, default="mad_money.csv", help="Output file path")
-    parser.add_argument("-p", "--max-price", type=int, default=1000)
-    args = parser.parse_args()
-    return args
+def get_parser() -> argparse.ArgumentParser:
+    # Same as `python -m mad_money_backtesting scrape ...`, but the usage shows the name of this script
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]),
+                                     description="Scrape the recommendations of Cramer")
+    add_scrape_arguments(parser)
+    return parser
 
 
-if __name__ == "__main__":
-    args = get_args()
-
-    output_path = Path(args.output)
+def main(argv: List[str] = None):
+    scrape(get_parser().parse_args(argv))
 
-    try:
-        df = mmb.scrape_cramer_calls(args.from_date, args.to_date, args.max_price, request_timeout=10)
-    except mmb.PageNotWorkingError:
-        print("Page is not working, so we are not scraping the site")
-        raise SystemExit
-    df.to_csv(f"{output_path.stem}_RAW.csv", index=False)
 
-    df = mmb.transform_cramer_call_raw_dataframe(df=df)
-    df.to_csv(output_path, index=False)
+if __name__ == "__main__":
+    main()
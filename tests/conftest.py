@@ -0,0 +1,68 @@
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# The tests run on the seeded synthetic data of the benchmarks
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+
+def pytest_configure(config):
+    # backtesting.py warns about the positions which are still open at the end and the orders without enough cash
+    config.addinivalue_line("filterwarnings", "ignore:Some trades remain open:UserWarning")
+    config.addinivalue_line("filterwarnings", "ignore:.*Broker canceled:UserWarning")
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self._respond(200, "")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        server = self.server
+        with server.lock:
+            server.requests.append(body)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            self._respond(*server.respond(body))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _respond(self, status: int, text: str):
+        content = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def local_server():
+    """
+    Local HTTP server for the transport: the POST requests are answered by `server.respond(body) -> (status, text)`
+    and they are recorded in `server.requests`
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    server.respond = lambda body: (200, "")
+    server.requests = []
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.lock = threading.Lock()
+
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
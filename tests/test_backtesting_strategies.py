@@ -0,0 +1,76 @@
+import backtesting
+import numpy as np
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting.vectorized import _strategy_dates
+from synthetic import START_DATE, make_stock_df
+
+NB_DAYS = 40
+
+STRATEGIES = [(mmb.AfterShowBuyNextDayCloseSell, {}),
+              (mmb.AfterShowBuyNextDayOpenSell, {}),
+              (mmb.NextDayOpenBuyNextDayCloseSell, {}),
+              (mmb.BuyAndHold, {"sell_horizon": 5}),
+              (mmb.BuyAndHold, {"sell_horizon": 5, "holding_policy": "extend"}),
+              (mmb.BuyAndHold, {"sell_horizon": 5, "holding_policy": "lots", "max_lots": 3})]
+
+STAT_KEYS = ["Return [%]", "Equity Final [$]", "Equity Peak [$]", "# Trades", "Win Rate [%]"]
+
+
+def _recommendation_dates(seed: int, nb_dates: int = 10) -> list:
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(START_DATE, periods=NB_DAYS)
+    return [mmb.pd_date_to_datetime(d) for d in np.sort(rng.choice(days, nb_dates, replace=False))]
+
+
+def _run(stock_df: pd.DataFrame, strategy_class, recommendation_dates: list, **params) -> pd.Series:
+    bt = backtesting.Backtest(stock_df, strategy_class, cash=1000, commission=0.002, trade_on_close=True)
+    return bt.run(recommendation_dates=recommendation_dates, **params)
+
+
+@pytest.mark.parametrize("seed", range(2))
+@pytest.mark.parametrize("stop_loss_perc, take_profit_perc", [(None, None), (0.01, 0.02)])
+@pytest.mark.parametrize("strategy_class, params", STRATEGIES)
+def test_precomputed_signals_give_the_same_results(strategy_class, params, stop_loss_perc, take_profit_perc, seed):
+    stock_df = make_stock_df(NB_DAYS, seed=seed)
+    recommendation_dates = _recommendation_dates(seed)
+    params = {"stop_loss_perc": stop_loss_perc, "take_profit_perc": take_profit_perc, **params}
+
+    per_bar = _run(stock_df, strategy_class, recommendation_dates, precompute_signals=False, **params)
+    precomputed = _run(stock_df, strategy_class, recommendation_dates, precompute_signals=True, **params)
+
+    for key in STAT_KEYS:
+        assert precomputed[key] == pytest.approx(per_bar[key], nan_ok=True), key
+    pd.testing.assert_frame_equal(precomputed["_trades"][["Size", "EntryBar", "ExitBar", "EntryPrice", "ExitPrice"]],
+                                  per_bar["_trades"][["Size", "EntryBar", "ExitBar", "EntryPrice", "ExitPrice"]])
+
+
+@pytest.mark.parametrize("seed", range(2))
+@pytest.mark.parametrize("max_lots", [2, 3])
+def test_lots_follow_the_schedule(max_lots, seed):
+    stock_df = make_stock_df(NB_DAYS, seed=seed)
+    recommendation_dates = _recommendation_dates(seed)
+    params = {"sell_horizon": 5, "holding_policy": "lots", "max_lots": max_lots}
+
+    stats = _run(stock_df, mmb.BuyAndHold, recommendation_dates, **params)
+
+    # Every scheduled lot is opened on its buy bar and closed on its own sell bar
+    buy_dates, sell_dates = _strategy_dates(mmb.BuyAndHold, recommendation_dates, params)
+    calendar = mmb.TradingCalendar.from_df(stock_df)
+    buy_bars = calendar.resolve_bars(buy_dates, mode="next_date")
+    sell_bars = calendar.resolve_bars(sell_dates, mode="next_date")
+    trades = stats["_trades"]
+    np.testing.assert_array_equal(trades["EntryBar"], buy_bars[:len(trades)])
+    np.testing.assert_array_equal(trades["ExitBar"], sell_bars[:len(trades)])
+    assert len(trades) + len(stats["_strategy"].trades) == len(buy_bars)
+
+
+@pytest.mark.parametrize("params", [{"holding_policy": "hold"}, {"holding_policy": "lots", "max_lots": 0}])
+def test_invalid_holding_parameters(params):
+    with pytest.raises(ValueError):
+        _run(make_stock_df(NB_DAYS), mmb.BuyAndHold, _recommendation_dates(0), sell_horizon=5, **params)
+    with pytest.raises(ValueError):
+        mmb.run_vectorized(make_stock_df(NB_DAYS), mmb.BuyAndHold, _recommendation_dates(0), 1000, 0.002,
+                           sell_horizon=5, **params)
@@ -0,0 +1,132 @@
+import re
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from mad_money_backtesting import cli, data
+from mad_money_backtesting import transport as transport_module
+
+FIXTURES_DIR = Path(__file__).resolve().parents[1] / "benchmarks" / "fixtures"
+SHOW_PAGE = (FIXTURES_DIR / "screener_2021-06-01.html").read_text(encoding="utf-8")
+
+
+@pytest.fixture()
+def scrape_server(local_server, monkeypatch, tmp_path):
+    """
+    The scraper is pointed to the local server, which serves the same page for every date,
+    except the `failing_dates` (503)
+    """
+
+    local_server.failing_dates = set()
+
+    def respond(body):
+        date = re.search(r"airdate=([\d-]+)", body).group(1)
+        if date in local_server.failing_dates:
+            return 503, "Service Unavailable"
+        return 200, SHOW_PAGE
+
+    local_server.respond = respond
+    monkeypatch.setattr(data, "URL", local_server.url)
+    monkeypatch.setattr(transport_module.ScraperTransport, "backoff_time", lambda self, attempt: 0)
+    monkeypatch.setattr(transport_module.RateLimiter, "wait", lambda self: None)
+    monkeypatch.chdir(tmp_path)
+    return local_server
+
+
+def _scrape(*args):
+    cli.main(["scrape", "-f", "2021-06-01", "-t", "2021-06-03", "-o", "mad_money.csv", "--parser", "lxml", *args])
+
+
+def test_scrape(scrape_server, tmp_path):
+    closed = []
+    original_close = transport_module.ScraperTransport.close
+
+    def close(transport):
+        closed.append(transport)
+        original_close(transport)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(transport_module.ScraperTransport, "close", close)
+        _scrape()
+
+    assert len(closed) == 1
+    raw_df = pd.read_csv(tmp_path / "mad_money_RAW.csv")
+    assert sorted(raw_df["date"].unique()) == ["2021-06-01", "2021-06-02", "2021-06-03"]
+    assert len(pd.read_csv(tmp_path / "mad_money.csv")) == len(raw_df)
+
+
+def test_failed_dates_do_not_overwrite_the_outputs(scrape_server, tmp_path):
+    _scrape()
+    outputs = {name: (tmp_path / name).read_bytes() for name in ("mad_money_RAW.csv", "mad_money.csv")}
+
+    scrape_server.failing_dates = {"2021-06-03"}
+    with pytest.raises(SystemExit) as exc_info:
+        _scrape("-t", "2021-06-04")
+
+    assert exc_info.value.code == 1
+    assert {name: (tmp_path / name).read_bytes() for name in outputs} == outputs
+
+
+def test_failed_dates_of_the_stream(scrape_server, tmp_path, capsys):
+    scrape_server.failing_dates = {"2021-06-02"}
+    with pytest.raises(SystemExit) as exc_info:
+        _scrape("--stream-to", "dataset")
+
+    assert exc_info.value.code == 1
+    assert "--from-date 2021-06-02" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("text, expected", [("sell_horizon=7", ("sell_horizon", 7)),
+                                            ("stop_loss_perc=0.05", ("stop_loss_perc", 0.05)),
+                                            ("holding_policy=extend", ("holding_policy", "extend")),
+                                            ("name=a=b", ("name", "a=b"))])
+def test_parse_param(text, expected):
+    assert cli._parse_param(text) == expected
+
+
+def test_backtest_arguments():
+    args = cli.get_parser().parse_args(["backtest", "-r", "recommendations.parquet", "--prices", "prices",
+                                        "-P", "sell_horizon=7", "-P", "holding_policy=lots", "-P", "max_lots=2",
+                                        "--calls", "buy", "positive", "--engine", "backtesting"])
+
+    assert args.func is cli.backtest
+    assert dict(args.param) == {"sell_horizon": 7, "holding_policy": "lots", "max_lots": 2}
+    assert args.calls == ["buy", "positive"]
+    assert args.strategy == "BuyAndHold" and args.engine == "backtesting"
+
+
+def test_scrape_and_summarize_arguments():
+    args = cli.get_parser().parse_args(["scrape", "-f", "2021-06-01", "-i", "--keep-html", "-c", "cache"])
+    assert args.func is cli.scrape
+    assert args.incremental and args.keep_html and args.cache_dir == "cache"
+    assert args.to_date is None and args.parser == "bs4"
+
+    args = cli.get_parser().parse_args(["summarize", "store", "--by", "Strategy", "sell_horizon"])
+    assert args.func is cli.summarize
+    assert args.store == "store" and args.by == ["Strategy", "sell_horizon"]
+
+
+@pytest.mark.parametrize("argv", [[], ["unknown"], ["backtest", "-r", "r.csv"],
+                                  ["backtest", "-r", "r.csv", "--prices", "p", "-P", "sell_horizon"],
+                                  ["backtest", "-r", "r.csv", "--prices", "p", "-s", "UnknownStrategy"]])
+def test_invalid_arguments(argv):
+    with pytest.raises(SystemExit) as exc_info:
+        cli.get_parser().parse_args(argv)
+    assert exc_info.value.code == 2
+
+
+def test_strategies_exist():
+    import mad_money_backtesting as mmb
+
+    for name in cli.STRATEGIES:
+        assert issubclass(getattr(mmb, name), mmb.backtesting_strategies._BaseMadMoneyStrategy)
+
+
+def test_scrape_script_usage(monkeypatch, capsys):
+    import scrape_mad_money
+
+    monkeypatch.setattr("sys.argv", ["/some/dir/scrape_mad_money.py", "--help"])
+    with pytest.raises(SystemExit):
+        scrape_mad_money.main()
+    assert capsys.readouterr().out.startswith("usage: scrape_mad_money.py [-h]")
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import mad_money_backtesting as mmb
+from synthetic import make_prices, make_recommendations_df, make_symbols
+
+STRATEGIES = [(mmb.AfterShowBuyNextDayCloseSell, {}),
+              (mmb.BuyAndHold, {"sell_horizon": 10}),
+              # Every position is still open at the end
+              (mmb.BuyAndHold, {"sell_horizon": 100000})]
+
+
+@pytest.fixture(scope="module")
+def data():
+    symbols = make_symbols(6)
+    return make_prices(symbols, 60), make_recommendations_df(symbols, 5, 60)
+
+
+def _run(data, root, engine: str, commission: float) -> mmb.ResultsStore:
+    prices, recommendations_df = data
+    store = mmb.ResultsStore(root)
+    for strategy_class, params in STRATEGIES:
+        mmb.run_batch(strategy_class, recommendations_df, prices, 1000, commission, 0.03, None, engine=engine,
+                      max_workers=1, progress=False, store=store, **params)
+    return store
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "backtesting"])
+def test_original_commission_reproduces_the_stored_returns(data, tmp_path, engine):
+    store = _run(data, tmp_path, engine, 0.002)
+    repriced_df = mmb.reprice(store, [mmb.CostModel(percentage=0.002)], 0.002)
+
+    np.testing.assert_allclose(repriced_df["Return [%]"].to_numpy(), store.to_frame()["Return [%]"].to_numpy(),
+                               atol=1e-9)
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "backtesting"])
+def test_other_commission_matches_a_new_run(data, tmp_path, engine):
+    store = _run(data, tmp_path / "original", engine, 0.002)
+    new_store = _run(data, tmp_path / "new", engine, 0.01)
+    repriced_df = mmb.reprice(store, [mmb.CostModel(percentage=0.01)], 0.002)
+
+    np.testing.assert_allclose(repriced_df["Equity Final [$]"].to_numpy(),
+                               new_store.to_frame()["Equity Final [$]"].to_numpy(), atol=1e-6)
+
+
+def test_costs_lower_the_returns(data, tmp_path):
+    store = _run(data, tmp_path, "vectorized", 0.002)
+    scenarios = mmb.cost_grid(fixed=[0, 1], slippage=[0, 0.001])
+    repriced_df = mmb.reprice(store, scenarios, 0.002)
+
+    assert len(repriced_df) == len(store.to_frame()) * len(scenarios)
+    returns = repriced_df.pivot_table(index=["Batch", "Run"], columns="Scenario", values="Return [%]", observed=True)
+    free = returns[scenarios[0].name]
+    for scenario in scenarios[1:]:
+        assert np.all(returns[scenario.name] <= free + 1e-9)
+
+    sensitivity_df = mmb.cost_sensitivity(repriced_df)
+    assert len(sensitivity_df) == len(STRATEGIES) * len(scenarios)
+
+
+def test_store_without_ledgers(data):
+    prices, recommendations_df = data
+    store = mmb.ResultsStore()
+    mmb.run_batch(mmb.AfterShowBuyNextDayCloseSell, recommendations_df, prices, 1000, 0.002, max_workers=1,
+                  progress=False, store=store)
+
+    with pytest.raises(ValueError):
+        mmb.reprice(store, [mmb.CostModel()], 0.002)
+
+    repriced_df = mmb.reprice_ledgers(store.to_frame(), store.trades(), [mmb.CostModel()], 0.002)
+    assert repriced_df["Equity Final [$]"].isna().all()
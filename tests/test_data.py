@@ -0,0 +1,79 @@
+import re
+
+import pandas as pd
+import pytest
+
+from mad_money_backtesting.data import CALLS, transform_cramer_call_raw_dataframe
+from synthetic import make_raw_recommendations_df, make_symbols
+
+
+def _old_transform(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The transform before it was vectorized (row by row lambdas), the reference of the new one
+    """
+
+    df["date"] = pd.to_datetime(df["date"])
+    call_dict = {1: "sell", 2: "negative", 3: "hold", 4: "positive", 5: "buy", 6: "I have no idea what is this"}
+    df["call"] = df["call"].astype(int).transform(lambda x: call_dict[x])
+    df["current_price"] = df["current_price"].replace(r"[\$,]", "", regex=True).astype(float)
+    df["symbol"] = df["name"].transform(lambda x: re.findall(r"\(([^\)]+)\)", x)[-1].upper())
+    df = df.sort_values(["date", "name"])
+    return df.reset_index(drop=True)
+
+
+def _raw_df() -> pd.DataFrame:
+    raw_df = make_raw_recommendations_df(make_symbols(20), 5, 30, seed=2)
+    # Names with more parentheses (the symbol is the last one), prices with thousands separators
+    raw_df.loc[0, "name"] = "Berkshire Hathaway (Class B) (brk.b)"
+    raw_df.loc[1, "name"] = "Company (Holdings) Inc (abc)"
+    raw_df.loc[2, "current_price"] = "$1,234.56"
+    raw_df.loc[3, "call"] = "6"
+    return raw_df
+
+
+def test_same_output_as_the_old_transform():
+    new_df = transform_cramer_call_raw_dataframe(df=_raw_df())
+    old_df = _old_transform(_raw_df())
+
+    for column in ("call", "segment", "symbol"):
+        assert isinstance(new_df[column].dtype, pd.CategoricalDtype), column
+    # Only the values are compared, the string dtype depends on the pandas version
+    for column in ("name", "month_and_day", "call", "segment", "symbol"):
+        new_df[column] = new_df[column].astype(object)
+        old_df[column] = old_df[column].astype(object)
+    pd.testing.assert_frame_equal(new_df, old_df[new_df.columns])
+
+    assert set(new_df["symbol"]) >= {"BRK.B", "ABC"}
+    assert 1234.56 in new_df["current_price"].tolist()
+
+
+def test_file_path(tmp_path):
+    _raw_df().to_csv(tmp_path / "raw.csv", index=False)
+
+    from_file_df = transform_cramer_call_raw_dataframe(file_path=tmp_path / "raw.csv")
+    pd.testing.assert_frame_equal(from_file_df, transform_cramer_call_raw_dataframe(df=_raw_df()))
+
+
+@pytest.mark.parametrize("call", ["0", "7", "buy", None])
+def test_unknown_call_codes(call):
+    raw_df = _raw_df()
+    raw_df.loc[5, "call"] = call
+
+    with pytest.raises(ValueError, match="call codes"):
+        transform_cramer_call_raw_dataframe(df=raw_df)
+
+
+def test_names_without_symbol():
+    raw_df = _raw_df()
+    raw_df.loc[5, "name"] = "Company without symbol"
+
+    with pytest.raises(ValueError, match="Company without symbol"):
+        transform_cramer_call_raw_dataframe(df=raw_df)
+
+
+def test_every_call_code():
+    raw_df = _raw_df().iloc[:len(CALLS)].copy()
+    raw_df["call"] = [str(i + 1) for i in range(len(CALLS))]
+
+    df = transform_cramer_call_raw_dataframe(df=raw_df)
+    assert sorted(df["call"].astype(str)) == sorted(CALLS)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting.event_study import ANCHORS
+from synthetic import make_prices, make_recommendations_df, make_symbols
+
+
+@pytest.fixture(scope="module")
+def data():
+    symbols = make_symbols(5)
+    prices = make_prices(symbols, 40)
+    # Some of the recommendations are after the last bar, and one of the symbols has no prices
+    recommendations_df = make_recommendations_df(symbols, 6, 45)
+    prices.pop("SYM4")
+    return prices, recommendations_df
+
+
+@pytest.mark.parametrize("anchor", list(ANCHORS))
+def test_windows_match_the_prices(data, anchor):
+    prices, recommendations_df = data
+    windows = mmb.event_windows(recommendations_df, prices, before=7, after=20, anchor=anchor)
+    days, hour, minute = ANCHORS[anchor]
+
+    assert "SYM4" not in set(windows.events["symbol"])
+    assert windows.values.shape == (len(windows), 28, 4)
+
+    close = windows.field("Close")
+    for event, row in windows.events.iterrows():
+        stock_df = prices[row["symbol"]]
+        anchor_time = (pd.Timestamp(row["date"]) + pd.Timedelta(days=days)).replace(hour=hour, minute=minute)
+        anchor_bar = stock_df.index.searchsorted(anchor_time.tz_localize("America/New_York"))
+        assert stock_df.index[anchor_bar] == row["anchor_time"]
+
+        for j, offset in enumerate(windows.offsets):
+            bar = anchor_bar + offset
+            if 0 <= bar < len(stock_df):
+                assert not close.mask[event, j]
+                assert close[event, j] == stock_df["Close"].iloc[bar]
+            else:
+                assert close.mask[event, j]
+
+
+def test_events_after_the_last_bar_are_dropped(data):
+    prices, recommendations_df = data
+    windows = mmb.event_windows(recommendations_df, prices, anchor="next_day_close")
+
+    last_dates = {symbol: stock_df.index[-1] for symbol, stock_df in prices.items()}
+    assert np.all(windows.events["anchor_time"] <= windows.events["symbol"].map(last_dates))
+    assert len(windows) < recommendations_df["symbol"].isin(list(prices)).sum()
+
+
+def test_curves(data):
+    prices, recommendations_df = data
+    windows = mmb.event_windows(recommendations_df, prices, before=3, after=5)
+    curves_df = windows.curves(by="call")
+
+    assert list(curves_df.columns) == ["call", "Offset", "Mean [%]", "Median [%]", "Events"]
+    # The returns are relative to the anchor bar
+    assert np.allclose(curves_df.loc[curves_df["Offset"] == 0, "Mean [%]"], 0)
+    assert curves_df.groupby("call", observed=True)["Events"].max().sum() == len(windows)
@@ -0,0 +1,107 @@
+import json
+import threading
+
+import pytest
+
+import mad_money_backtesting as mmb
+from synthetic import make_prices, make_recommendations_df, make_symbols
+
+SYMBOLS = make_symbols(3)
+NB_DAYS = 40
+
+ENGINE_STAGES = {"vectorized": {"backtest", "dates.resolve", "vectorized.simulate"},
+                 "backtesting": {"backtest", "dates.calculate", "dates.fix"}}
+
+
+@pytest.fixture(scope="module")
+def data():
+    # Created before the instrumentation is enabled, so the transform is not recorded
+    return make_prices(SYMBOLS, NB_DAYS), make_recommendations_df(SYMBOLS, 4, NB_DAYS)
+
+
+@pytest.fixture()
+def instrumentation(tmp_path):
+    instrumentation = mmb.enable_instrumentation(profile_dir=tmp_path / "profiles")
+    yield instrumentation
+    mmb.disable_instrumentation()
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "backtesting"])
+def test_run_batch_stages_and_counters(data, instrumentation, tmp_path, engine):
+    prices, recommendations_df = data
+    result = mmb.run_batch(mmb.BuyAndHold, recommendations_df, prices, 1000, 0.002, engine=engine, max_workers=2,
+                           progress=False, sell_horizon=5)
+    result.summarize()
+
+    report = instrumentation.to_dict()
+    totals = report["totals"]
+    assert set(totals["stages"]) == ENGINE_STAGES[engine] | {"summarize"}
+    assert totals["stages"]["backtest"]["calls"] == len(SYMBOLS)
+    assert totals["stages"]["summarize"]["calls"] == 1
+    assert all(stage["total_s"] > 0 for stage in totals["stages"].values())
+    assert totals["counters"]["bars"] == sum(len(df) for df in prices.values())
+    assert {"dates.dropped", "dates.fixed"} <= set(totals["counters"])
+
+    # The reports of the worker processes are merged per symbol, and they add up to the totals
+    assert sorted(report["symbols"]) == SYMBOLS
+    for symbol in SYMBOLS:
+        symbol_report = report["symbols"][symbol]
+        assert set(symbol_report["stages"]) == ENGINE_STAGES[engine]
+        assert symbol_report["counters"]["bars"] == len(prices[symbol])
+    for name in totals["counters"]:
+        assert totals["counters"][name] == sum(r["counters"][name] for r in report["symbols"].values())
+
+    # Every symbol is profiled separately
+    assert sorted(p.name for p in (tmp_path / "profiles").iterdir()) == [f"{s}.prof" for s in SYMBOLS]
+
+    assert json.loads(instrumentation.to_json(tmp_path / "timings.json")) == report
+    assert json.loads((tmp_path / "timings.json").read_text()) == report
+
+
+def test_price_store_downloads(data, instrumentation, tmp_path):
+    prices, recommendations_df = data
+    store = mmb.PriceStore(tmp_path / "prices", fetcher=mmb.LocalFetcher({s: df.drop(columns="Date")
+                                                                          for s, df in prices.items()}))
+    failed = store.prefetch(recommendations_df, "2020-01-01", "2020-04-01", max_workers=3)
+
+    assert failed == {}
+    report = instrumentation.to_dict()
+    assert report["totals"]["stages"]["prices.download"]["calls"] == len(SYMBOLS)
+    assert report["totals"]["counters"]["prices.downloaded_bars"] == sum(len(df) for df in prices.values())
+    for symbol in SYMBOLS:
+        assert report["symbols"][symbol]["counters"]["prices.downloaded_bars"] == len(prices[symbol])
+
+    # Nothing is downloaded for the covered ranges
+    store.update(SYMBOLS[0], "2020-01-01", "2020-02-01")
+    assert instrumentation.to_dict()["totals"]["stages"]["prices.download"]["calls"] == len(SYMBOLS)
+
+
+def test_symbols_are_thread_local():
+    instrumentation = mmb.enable_instrumentation()
+    try:
+        def work(symbol: str):
+            with instrumentation.symbol(symbol):
+                for _ in range(100):
+                    instrumentation.count("calls")
+
+        threads = [threading.Thread(target=work, args=(s,)) for s in SYMBOLS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        instrumentation.count("outside")
+    finally:
+        mmb.disable_instrumentation()
+
+    report = instrumentation.to_dict()
+    assert report["totals"]["counters"] == {"calls": 300, "outside": 1}
+    assert {s: r["counters"] for s, r in report["symbols"].items()} == {s: {"calls": 100} for s in SYMBOLS}
+
+
+def test_disabled_by_default():
+    instrumentation = mmb.get_instrumentation()
+
+    assert not instrumentation.enabled
+    with instrumentation.symbol("SYM0"), instrumentation.stage("backtest"), instrumentation.profile("SYM0"):
+        instrumentation.count("bars", 10)
+    assert instrumentation.to_dict() == {"totals": {"stages": {}, "counters": {}}, "symbols": {}}
@@ -0,0 +1,30 @@
+import importlib
+import subprocess
+import sys
+
+import pytest
+
+import mad_money_backtesting as mmb
+
+
+@pytest.mark.parametrize("name, module_name", sorted(mmb._ATTRIBUTES.items()))
+def test_every_public_name_resolves(name, module_name):
+    module = importlib.import_module(f"mad_money_backtesting.{module_name}")
+    assert getattr(mmb, name) is getattr(module, name)
+
+
+def test_dir_and_all():
+    assert set(mmb._ATTRIBUTES) <= set(dir(mmb))
+    assert sorted(mmb.__all__) == sorted(mmb._ATTRIBUTES)
+
+
+def test_unknown_name():
+    with pytest.raises(AttributeError):
+        mmb.not_a_public_name
+
+
+def test_import_does_not_load_the_dependencies():
+    code = ("import sys, mad_money_backtesting; "
+            "print(sorted(m for m in ('pandas', 'backtesting', 'requests', 'lxml') if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
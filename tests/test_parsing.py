@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import pytest
+
+from mad_money_backtesting.data import NoDataForDateException, _parse_daily_data
+from mad_money_backtesting.parsing import columns_to_rows, parse_stock_table
+
+FIXTURES_DIR = Path(__file__).resolve().parents[1] / "benchmarks" / "fixtures"
+
+SEGMENTS = {"D", "F", "I", "L", "M"}
+
+
+def _row(name: str, segment: str = "D", call: str = "5") -> str:
+    return (f'<tr><td>{name}</td><td>6/1</td><td><img src="/images/segments/0.gif" alt="{segment}"></td>'
+            f'<td><img src="/images/call/0.gif" alt="{call}"></td><td>$10.00</td><td></td></tr>')
+
+
+def _page(rows: str) -> str:
+    return (f'<html><body><table id="layout"><tr><td><table id="stockTable"><tr><th>Company</th></tr>{rows}'
+            f'</table></td></tr></table></body></html>')
+
+
+@pytest.mark.parametrize("fixture_path", sorted(FIXTURES_DIR.glob("screener_*.html")), ids=lambda p: p.name)
+def test_parsers_give_the_same_rows(fixture_path):
+    html = fixture_path.read_text(encoding="utf-8")
+
+    rows = {}
+    for parser in ("bs4", "lxml"):
+        try:
+            rows[parser] = _parse_daily_data(html, "2021-06-01", parser)
+        except NoDataForDateException:
+            rows[parser] = []
+
+    assert rows["lxml"] == rows["bs4"]
+    assert {row["segment"] for row in rows["lxml"]} <= SEGMENTS
+    assert {row["call"] for row in rows["lxml"]} <= {"1", "2", "3", "4", "5"}
+
+
+def test_fixture_rows():
+    html = (FIXTURES_DIR / "screener_500_rows.html").read_text(encoding="utf-8")
+    rows = columns_to_rows(parse_stock_table(html))
+
+    assert len(rows) == 500
+    assert {row["segment"] for row in rows} == SEGMENTS
+    assert list(rows[0].keys()) == ["name", "month_and_day", "segment", "call", "current_price"]
+
+
+def test_nested_tables_do_not_truncate_the_table():
+    rows = _row("Company A (a)") + \
+        '<tr><td colspan="6"><table><tr><td>Note</td></tr></table></td></tr>' + \
+        '<tr><td colspan="6" title="</table>">Ad</td></tr>' + \
+        _row("Company B (b)", segment="L", call="1")
+
+    result = columns_to_rows(parse_stock_table(_page(rows)))
+
+    assert [row["name"] for row in result] == ["Company A (a)", "Company B (b)"]
+    assert result[1]["segment"] == "L" and result[1]["call"] == "1"
+    assert _parse_daily_data(_page(rows), "2021-06-01", "bs4") == _parse_daily_data(_page(rows), "2021-06-01",
+                                                                                     "lxml")
+
+
+def test_page_without_the_table():
+    with pytest.raises(ValueError):
+        parse_stock_table("<html><body><table id='other'></table></body></html>")
@@ -0,0 +1,116 @@
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting import partitioned_dataset
+from mad_money_backtesting.data import transform_cramer_call_raw_dataframe
+from synthetic import make_raw_recommendations_df, make_symbols
+from tests.test_scraping import _StubTransport
+
+FILE_FORMATS = ["parquet", "csv"]
+
+
+@pytest.fixture(scope="module")
+def recommendations_df():
+    # 2020-01-02 - 2020-03-11, 3 monthly partitions
+    return transform_cramer_call_raw_dataframe(df=make_raw_recommendations_df(make_symbols(10), 6, 50, seed=5))
+
+
+def _write_all(dataset: mmb.PartitionedDataset, recommendations_df: pd.DataFrame):
+    for date, df in recommendations_df.groupby("date"):
+        dataset.write_date(date, df)
+
+
+def _compare(df: pd.DataFrame, expected_df: pd.DataFrame):
+    expected_df = expected_df.sort_values(["date", "name"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(df.astype(str), expected_df[df.columns].astype(str))
+
+
+@pytest.mark.parametrize("file_format", FILE_FORMATS)
+def test_monthly_partitions(tmp_path, recommendations_df, file_format):
+    dataset = mmb.PartitionedDataset(tmp_path, file_format)
+    _write_all(dataset, recommendations_df)
+
+    assert [p.relative_to(tmp_path).as_posix() for p in dataset.partitions()] == \
+        [f"year=2020/month={m}/part.{file_format}" for m in ("01", "02", "03")]
+    february_df = dataset._read_partition(dataset.partition_path("2020-02-15"))
+    assert (february_df["date"].dt.month == 2).all()
+    assert february_df["date"].is_monotonic_increasing
+
+    df = dataset.read()
+    _compare(df, recommendations_df)
+    for column in partitioned_dataset.CATEGORICAL_COLUMNS:
+        assert isinstance(df[column].dtype, pd.CategoricalDtype), column
+
+    # No temporary files are left behind
+    assert list(tmp_path.rglob("*.tmp")) == []
+
+
+@pytest.mark.parametrize("file_format", FILE_FORMATS)
+def test_read_date_range(tmp_path, recommendations_df, file_format):
+    dataset = mmb.PartitionedDataset(tmp_path, file_format)
+    _write_all(dataset, recommendations_df)
+
+    df = dataset.read(start="2020-01-20", end="2020-02-10")
+    dates = recommendations_df["date"]
+    _compare(df, recommendations_df[(dates >= "2020-01-20") & (dates <= "2020-02-10")])
+    assert len(dataset.read(start="2021-01-01")) == 0
+
+
+@pytest.mark.parametrize("file_format", FILE_FORMATS)
+def test_rewriting_a_date_replaces_its_rows(tmp_path, recommendations_df, file_format):
+    dataset = mmb.PartitionedDataset(tmp_path, file_format)
+    _write_all(dataset, recommendations_df)
+
+    last_date = recommendations_df["date"].max()
+    assert dataset.last_date() == last_date
+
+    # The last date is scraped again (e.g. by an incremental run), now with a single row
+    new_df = recommendations_df[recommendations_df["date"] == last_date].iloc[:1]
+    dataset.write_date(last_date, new_df)
+
+    expected_df = pd.concat([recommendations_df[recommendations_df["date"] != last_date], new_df])
+    _compare(dataset.read(), expected_df)
+    assert dataset.last_date() == last_date
+
+
+def test_failed_write_keeps_the_partition(tmp_path, recommendations_df, monkeypatch):
+    dataset = mmb.PartitionedDataset(tmp_path)
+    _write_all(dataset, recommendations_df)
+    before_df = dataset.read()
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(partitioned_dataset.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        dataset.write_date(recommendations_df["date"].max(), recommendations_df.iloc[:1])
+
+    # The partition was not touched, and the temporary file (starting with a dot) is skipped by the readers
+    pd.testing.assert_frame_equal(dataset.read(), before_df)
+    assert len(pd.read_parquet(tmp_path)) == len(recommendations_df)
+
+
+def test_empty_dataset(tmp_path):
+    dataset = mmb.PartitionedDataset(tmp_path)
+
+    assert dataset.last_date() is None
+    assert len(dataset.read()) == 0
+
+
+@pytest.mark.parametrize("file_format", FILE_FORMATS)
+def test_stream_cramer_calls(tmp_path, file_format):
+    dataset = mmb.PartitionedDataset(tmp_path / "dataset", file_format)
+    transport = _StubTransport(no_show_dates={"2021-06-29"}, failing_dates={"2021-07-01"})
+
+    failed_dates = mmb.stream_cramer_calls(dataset, "2021-06-28", "2021-07-02", transport=transport, parser="lxml")
+
+    assert failed_dates == ["2021-07-01"]
+    assert [p.parent.name for p in dataset.partitions()] == ["month=06", "month=07"]
+    df = dataset.read()
+    assert sorted(df["date"].dt.strftime("%Y-%m-%d").unique()) == ["2021-06-28", "2021-06-30", "2021-07-02"]
+    assert dataset.last_date() == pd.Timestamp("2021-07-02")
+
+    # The same rows as the transform of the scraped frame
+    scraped_df = mmb.scrape_cramer_calls("2021-06-28", "2021-06-28", transport=_StubTransport(), parser="lxml")
+    _compare(dataset.read(end="2021-06-28"), transform_cramer_call_raw_dataframe(df=scraped_df))
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from synthetic import make_prices, make_recommendations_df, make_stock_df
+
+NB_DAYS = 10
+
+# 2020-01-02 is a Thursday
+DAYS = pd.bdate_range("2020-01-02", periods=NB_DAYS)
+
+
+def _flat_df(price: float) -> pd.DataFrame:
+    stock_df = make_stock_df(NB_DAYS)
+    stock_df[["Open", "High", "Low", "Close"]] = price
+    return stock_df
+
+
+def _recommendations(calls: list) -> pd.DataFrame:
+    """
+    (symbol, day index) pairs to a recommendations DataFrame
+    """
+
+    return pd.DataFrame({"symbol": pd.Categorical([s for s, _ in calls]),
+                         "date": [DAYS[d] for _, d in calls]})
+
+
+def _run(calls: list, prices: dict, **kwargs) -> mmb.PortfolioResult:
+    kwargs = {"cash": 1000, "commission": 0, **kwargs}
+    return mmb.run_portfolio(mmb.AfterShowBuyNextDayCloseSell, _recommendations(calls), prices, **kwargs)
+
+
+def test_single_symbol_matches_run_vectorized():
+    prices = make_prices(["SYM0"], 40, seed=7)
+    recommendations_df = make_recommendations_df(["SYM0"], 8, 40, seed=7)
+    dates = [mmb.pd_date_to_datetime(d) for d in recommendations_df["date"]]
+
+    for strategy_class, params in [(mmb.AfterShowBuyNextDayCloseSell, {}), (mmb.BuyAndHold, {"sell_horizon": 5})]:
+        result = mmb.run_portfolio(strategy_class, recommendations_df, prices, 1000, 0.002, 0.02, None,
+                                   max_positions=1, **params)
+        expected = mmb.run_vectorized(prices["SYM0"], strategy_class, dates, 1000, 0.002, 0.02, None, **params)
+
+        assert result.stats["Equity Final [$]"] == pytest.approx(expected["Equity Final [$]"])
+        assert result.stats["# Trades"] == expected["# Trades"]
+        closed = expected["_trades"][expected["_trades"]["ExitBar"] >= 0]
+        np.testing.assert_array_equal(result.trades["Size"].to_numpy()[:len(closed)], closed["Size"].to_numpy())
+
+
+def test_max_positions_with_several_symbols():
+    prices = {s: _flat_df(100) for s in ("A", "B", "C")}
+    result = _run([("A", 0), ("B", 0), ("C", 0), ("C", 3)], prices, max_positions=2)
+
+    # The third position of the same bar does not fit, later C gets a free slot
+    assert result.rejected[["Symbol", "Reason"]].values.tolist() == [["C", "max_positions"]]
+    assert result.trades["Symbol"].tolist() == ["A", "B", "C"]
+    assert result.stats["Max. Open Positions"] == 2
+    # The cash is split equally between the free slots: 999 / 2, then 599.4 for the last slot
+    assert result.trades["Size"].tolist() == [4, 5, 4]
+    # Flat prices without commission
+    assert np.allclose(result.equity, 1000)
+
+
+def test_capital_limit():
+    prices = {"A": _flat_df(100), "B": _flat_df(600)}
+    result = _run([("A", 0), ("B", 0)], prices, max_positions=None, position_size=0.5)
+
+    # A uses half of the equity, the rest of the cash is not enough for a single share of B
+    assert result.trades["Symbol"].tolist() == ["A"]
+    assert result.trades["Size"].tolist() == [4]
+    assert result.rejected[["Symbol", "Reason"]].values.tolist() == [["B", "cash"]]
+    assert result.stats["# Rejected"] == 1
+
+
+def test_buy_and_sell_on_the_same_bar():
+    prices = {"A": _flat_df(100), "B": _flat_df(50)}
+    prices["A"].loc[prices["A"].index >= pd.Timestamp("2020-01-03 15:30", tz="America/New_York"), "Close"] = 110
+    result = _run([("A", 0), ("B", 1)], prices, max_positions=1)
+
+    # A is sold at the same bar as B is bought: the exit is processed first, so B gets its slot and its cash
+    assert len(result.rejected) == 0
+    trades = result.trades
+    assert trades["Symbol"].tolist() == ["A", "B"]
+    assert trades["ExitTime"].iloc[0] == trades["EntryTime"].iloc[1]
+    assert trades["Size"].tolist() == [9, (1000 + 9 * 10) * 0.999 // 50]
+    assert result.stats["Max. Open Positions"] == 1
+    assert result.stats["Equity Final [$]"] == pytest.approx(1090)
+
+
+def test_invalid_limits():
+    prices = {"A": _flat_df(100)}
+    with pytest.raises(ValueError):
+        _run([("A", 0)], prices, max_positions=None)
+    with pytest.raises(NotImplementedError):
+        mmb.run_portfolio(mmb.BuyAndHold, _recommendations([("A", 0)]), prices, 1000, 0, sell_horizon=3,
+                          holding_policy="lots", max_lots=2)
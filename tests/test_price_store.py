@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from synthetic import make_stock_df
+
+SYMBOL = "SYM0"
+
+
+@pytest.fixture()
+def stock_df():
+    # 2020-01-02 - 2020-03-11
+    return make_stock_df(50).drop(columns="Date")
+
+
+@pytest.fixture()
+def fetcher(stock_df):
+    return mmb.LocalFetcher({SYMBOL: stock_df})
+
+
+def _bars(stock_df: pd.DataFrame, start: str, end: str) -> int:
+    return int(((stock_df.index >= pd.Timestamp(start, tz=stock_df.index.tz))
+                & (stock_df.index < pd.Timestamp(end, tz=stock_df.index.tz))).sum())
+
+
+def test_first_download(tmp_path, stock_df, fetcher):
+    store = mmb.PriceStore(tmp_path, fetcher=fetcher)
+
+    assert store.update(SYMBOL, "2020-01-10", "2020-02-01") == _bars(stock_df, "2020-01-10", "2020-02-01")
+    assert fetcher.calls == [(SYMBOL, pd.Timestamp("2020-01-10"), pd.Timestamp("2020-02-01"), "1h")]
+
+    result = store.get(SYMBOL, "2020-01-10", "2020-02-01")
+    pd.testing.assert_frame_equal(result.drop(columns="Date"),
+                                  stock_df.loc["2020-01-10":"2020-01-31"], check_freq=False)
+
+    # Everything is covered, nothing is downloaded again
+    assert store.update(SYMBOL, "2020-01-15", "2020-01-20") == 0
+    assert len(fetcher.calls) == 1
+
+
+def test_extension_on_both_sides(tmp_path, stock_df, fetcher):
+    store = mmb.PriceStore(tmp_path, fetcher=fetcher)
+    store.update(SYMBOL, "2020-01-10", "2020-02-01")
+
+    assert store.missing_ranges(SYMBOL, "2020-01-02", "2020-02-15") == [
+        (pd.Timestamp("2020-01-02"), pd.Timestamp("2020-01-10")),
+        (pd.Timestamp("2020-02-01"), pd.Timestamp("2020-02-15"))]
+    assert store.update(SYMBOL, "2020-01-02", "2020-02-15") == _bars(stock_df, "2020-01-02", "2020-01-10") + \
+        _bars(stock_df, "2020-02-01", "2020-02-15")
+    assert fetcher.calls[1:] == [(SYMBOL, pd.Timestamp("2020-01-02"), pd.Timestamp("2020-01-10"), "1h"),
+                                 (SYMBOL, pd.Timestamp("2020-02-01"), pd.Timestamp("2020-02-15"), "1h")]
+
+    assert store.missing_ranges(SYMBOL, "2020-01-02", "2020-02-15") == []
+    assert len(store.load(SYMBOL)) == _bars(stock_df, "2020-01-02", "2020-02-15")
+    assert store.load(SYMBOL).index.is_monotonic_increasing
+
+
+def test_today_is_fetched_again(tmp_path):
+    today = pd.Timestamp.now().normalize()
+    stock_df = make_stock_df(10, start_date=str((today - pd.offsets.BDay(9)).date())).drop(columns="Date")
+    store = mmb.PriceStore(tmp_path, fetcher=mmb.LocalFetcher({SYMBOL: stock_df}))
+
+    tomorrow = today + pd.Timedelta(days=1)
+    store.update(SYMBOL, today - pd.Timedelta(days=30), tomorrow)
+
+    assert store.missing_ranges(SYMBOL, today - pd.Timedelta(days=30), tomorrow) == [(today, tomorrow)]
+
+
+def test_empty_fetch_is_not_covered(tmp_path, stock_df, fetcher):
+    store = mmb.PriceStore(tmp_path, fetcher=fetcher)
+
+    # Unknown symbol (or a failed download): nothing is stored, the next update tries again
+    assert store.update("UNKNOWN", "2020-01-10", "2020-02-01") == 0
+    assert store.missing_ranges("UNKNOWN", "2020-01-10", "2020-02-01") == [(pd.Timestamp("2020-01-10"),
+                                                                          pd.Timestamp("2020-02-01"))]
+    assert len(store.get("UNKNOWN", "2020-01-10", "2020-02-01", download=False)) == 0
+
+    # The range after the last bar is empty, only the range before the data extends the coverage
+    store.update(SYMBOL, "2020-01-10", "2020-03-12")
+    store.update(SYMBOL, "2020-01-02", "2020-06-01")
+    assert store.missing_ranges(SYMBOL, "2020-01-02", "2020-06-01") == [(pd.Timestamp("2020-03-12"),
+                                                                        pd.Timestamp("2020-06-01"))]
+    assert len(store.load(SYMBOL)) == len(stock_df)
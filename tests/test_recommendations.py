@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from synthetic import make_recommendations_df, make_symbols
+
+SYMBOLS = make_symbols(8)
+
+
+@pytest.fixture(scope="module")
+def recommendations_df():
+    return make_recommendations_df(SYMBOLS, 12, 40, seed=4)
+
+
+@pytest.fixture(scope="module")
+def store(recommendations_df):
+    return mmb.RecommendationStore(recommendations_df)
+
+
+def _expected(df: pd.DataFrame, symbols=None, start=None, end=None, calls=None, min_price=None, max_price=None):
+    mask = np.ones(len(df), dtype=bool)
+    if symbols is not None:
+        mask &= df["symbol"].isin(symbols)
+    if start is not None:
+        mask &= df["date"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df["date"] < pd.Timestamp(end)
+    if calls is not None:
+        mask &= df["call"].isin(calls)
+    if min_price is not None:
+        mask &= df["current_price"] >= min_price
+    if max_price is not None:
+        mask &= df["current_price"] <= max_price
+    return df[mask]
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(["symbol", "date"], kind="stable").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("filters", [{},
+                                     {"symbols": ["SYM1", "SYM5"]},
+                                     {"symbols": ["SYM1", "UNKNOWN"], "start": "2020-01-10"},
+                                     {"start": "2020-01-10", "end": "2020-02-01"},
+                                     {"calls": ["buy", "positive"]},
+                                     {"min_price": 100, "max_price": 800},
+                                     {"symbols": ["SYM2"], "end": "2020-02-10", "calls": ["sell", "negative", "hold"],
+                                      "max_price": 1000}])
+def test_query(store, recommendations_df, filters):
+    result = store.query(**filters)
+    expected = _expected(recommendations_df, **filters)
+
+    assert len(result) == len(expected)
+    pd.testing.assert_frame_equal(_sorted(result), _sorted(expected)[result.columns], check_dtype=False,
+                                  check_categorical=False)
+
+
+def test_symbol_lookups(store, recommendations_df):
+    assert sorted(store.symbols) == sorted(SYMBOLS)
+    assert "SYM3" in store and "UNKNOWN" not in store
+    assert len(store) == len(recommendations_df)
+
+    symbol_df = recommendations_df[recommendations_df["symbol"] == "SYM3"].sort_values("date")
+    np.testing.assert_array_equal(store.dates("SYM3"), symbol_df["date"].to_numpy(dtype="datetime64[ns]"))
+    assert store.recommendation_dates("SYM3", start="2020-01-15") == \
+        [mmb.pd_date_to_datetime(d) for d in symbol_df["date"] if d >= pd.Timestamp("2020-01-15")]
+    assert len(store.for_symbol("UNKNOWN")) == 0
+    assert dict((s, len(d)) for s, d in store.iter_symbols(["SYM0", "SYM1"])) == {"SYM0": 12, "SYM1": 12}
+
+
+def test_categorical_columns(store, tmp_path):
+    for column in ("symbol", "call", "segment"):
+        assert isinstance(store.df[column].dtype, pd.CategoricalDtype), column
+
+    store.to_parquet(tmp_path / "recommendations.parquet")
+    loaded = mmb.RecommendationStore.from_parquet(tmp_path / "recommendations.parquet")
+    for column in ("symbol", "call", "segment"):
+        assert isinstance(loaded.df[column].dtype, pd.CategoricalDtype), column
+    pd.testing.assert_frame_equal(loaded.df, store.df, check_categorical=False)
+
+
+def test_from_csv(store, recommendations_df, tmp_path):
+    recommendations_df.to_csv(tmp_path / "recommendations.csv", index=False)
+    loaded = mmb.RecommendationStore.from_csv(tmp_path / "recommendations.csv")
+
+    assert isinstance(loaded.df["call"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(loaded.query(calls=["buy"]).astype(str), store.query(calls=["buy"]).astype(str))
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting.result_cache import hash_prices, relevant_bars
+from mad_money_backtesting.untils import pd_date_to_datetime
+from synthetic import make_prices, make_recommendations_df, make_symbols
+
+# One day of hourly bars
+NB_DAY_BARS = 7
+
+
+def _prices_and_recommendations(nb_symbols: int = 6, nb_days: int = 120):
+    symbols = make_symbols(nb_symbols)
+    new_prices = make_prices(symbols, nb_days)
+    old_prices = {symbol: stock_df.iloc[:-NB_DAY_BARS] for symbol, stock_df in new_prices.items()}
+    # The recommendations are in the first half of the prices, so every position is closed before the new day
+    recommendations_df = make_recommendations_df(symbols, 4, nb_days // 2)
+    return old_prices, new_prices, recommendations_df
+
+
+def _prices_key(strategy_class, stock_df: pd.DataFrame, dates: pd.Series, strategy_params: dict) -> str:
+    recommendation_dates = [pd_date_to_datetime(d) for d in dates]
+    return hash_prices(stock_df, relevant_bars(strategy_class, stock_df, recommendation_dates, strategy_params))
+
+
+def test_new_bars_after_the_last_trade_keep_the_key():
+    old_prices, new_prices, recommendations_df = _prices_and_recommendations()
+
+    for symbol, dates in recommendations_df.groupby("symbol", observed=True)["date"]:
+        for strategy_class, params in [(mmb.AfterShowBuyNextDayCloseSell, {}), (mmb.BuyAndHold, {"sell_horizon": 10})]:
+            assert _prices_key(strategy_class, old_prices[symbol], dates, params) == \
+                _prices_key(strategy_class, new_prices[symbol], dates, params)
+
+
+def test_new_bars_change_the_key_of_open_positions():
+    old_prices, new_prices, recommendations_df = _prices_and_recommendations()
+    params = {"sell_horizon": 100000}
+
+    for symbol, dates in recommendations_df.groupby("symbol", observed=True)["date"]:
+        assert _prices_key(mmb.BuyAndHold, old_prices[symbol], dates, params) != \
+            _prices_key(mmb.BuyAndHold, new_prices[symbol], dates, params)
+
+
+def test_changed_bars_before_the_last_trade_change_the_key():
+    old_prices, _, recommendations_df = _prices_and_recommendations()
+    symbol, dates = next(iter(recommendations_df.groupby("symbol", observed=True)["date"]))
+
+    changed_df = old_prices[symbol].copy()
+    changed_df.iloc[0, changed_df.columns.get_loc("Close")] *= 1.01
+
+    assert _prices_key(mmb.AfterShowBuyNextDayCloseSell, old_prices[symbol], dates, {}) != \
+        _prices_key(mmb.AfterShowBuyNextDayCloseSell, changed_df, dates, {})
+
+
+def test_run_batch_reads_the_cache_after_a_new_day(tmp_path):
+    old_prices, new_prices, recommendations_df = _prices_and_recommendations()
+    params = {"sell_horizon": 10}
+
+    cache = mmb.ResultCache(tmp_path)
+    mmb.run_batch(mmb.BuyAndHold, recommendations_df, old_prices, 1000, 0.002, max_workers=1, progress=False,
+                  cache=cache, **params)
+
+    cache = mmb.ResultCache(tmp_path)
+    cached_df = mmb.run_batch(mmb.BuyAndHold, recommendations_df, new_prices, 1000, 0.002, max_workers=1,
+                              progress=False, cache=cache, **params).summarize()
+    fresh_df = mmb.run_batch(mmb.BuyAndHold, recommendations_df, new_prices, 1000, 0.002, max_workers=1,
+                             progress=False, **params).summarize()
+
+    assert cache.hits == len(new_prices)
+    assert cache.misses == 0
+    # The fresh results have the nanosecond timestamps of the shared memory
+    pd.testing.assert_frame_equal(cached_df.sort_index(), fresh_df.sort_index(), check_dtype=False)
+    assert np.all(cached_df["End"] == new_prices["SYM0"].index[-1])
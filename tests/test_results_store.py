@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting.results_store import LEDGER_COLUMNS, STAT_COLUMNS
+
+START = pd.Timestamp("2021-06-01 09:30", tz="America/New_York")
+
+
+def _stats(i: int) -> pd.Series:
+    return pd.Series({"Return [%]": i - 2.5, "Equity Final [$]": 1000 + i, "Equity Peak [$]": 1100 + i,
+                      "Buy & Hold Return [%]": 1.5 * i, "# Trades": i % 4, "Win Rate [%]": 50.0,
+                      "Start": START, "End": START + pd.Timedelta(days=30), "_strategy": "not stored"})
+
+
+def _trades(i: int, nb_trades: int) -> pd.DataFrame:
+    entry_bars = np.arange(nb_trades) * 5 + i
+    return pd.DataFrame({"Size": np.full(nb_trades, 3), "EntryBar": entry_bars, "ExitBar": entry_bars + 2,
+                         "EntryPrice": 100.0 + entry_bars, "ExitPrice": 101.0 + entry_bars,
+                         "PnL": np.full(nb_trades, 3.0), "ReturnPct": np.full(nb_trades, 0.01),
+                         "EntryTime": START + pd.to_timedelta(entry_bars, unit="h"),
+                         "ExitTime": START + pd.to_timedelta(entry_bars + 2, unit="h")})
+
+
+def _fill(store: mmb.ResultsStore, nb_runs: int = 7):
+    for i in range(nb_runs):
+        # The stop loss is only defined for some runs, the horizon only for BuyAndHold
+        params = {"stop_loss_perc": 0.05 if i % 2 else None, "recommendation_dates": ["not stored"]}
+        strategy = mmb.BuyAndHold if i % 3 else "AfterShowBuyNextDayCloseSell"
+        if strategy is mmb.BuyAndHold:
+            params["sell_horizon"] = 10 + i
+        store.append(f"SYM{i % 3}", strategy, params, _stats(i), trades=_trades(i, i % 4))
+
+
+def test_columnar_rows(tmp_path):
+    store = mmb.ResultsStore(tmp_path, chunk_rows=3)
+    _fill(store)
+
+    assert len(store) == 7
+    df = store.to_frame()
+    assert df["Run"].tolist() == list(range(7))
+    assert sorted(store.parameter_columns) == ["sell_horizon", "stop_loss_perc"]
+    assert "recommendation_dates" not in df.columns and "_strategy" not in df.columns
+    assert df["Strategy"].tolist()[:3] == ["AfterShowBuyNextDayCloseSell", "BuyAndHold", "BuyAndHold"]
+    for column in ("Batch", "Symbol", "Strategy"):
+        assert isinstance(df[column].dtype, pd.CategoricalDtype), column
+    assert pd.api.types.is_float_dtype(df["stop_loss_perc"])
+    assert df["stop_loss_perc"].isna().tolist() == [i % 2 == 0 for i in range(7)]
+    assert df["sell_horizon"].isna().sum() == 3
+    np.testing.assert_allclose(df["Return [%]"], np.arange(7) - 2.5)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    store = mmb.ResultsStore(tmp_path, chunk_rows=3, spill_rows=4)
+    _fill(store)
+    store.save()
+
+    loaded = mmb.ResultsStore.load(tmp_path)
+    pd.testing.assert_frame_equal(loaded.to_frame(), store.to_frame())
+    pd.testing.assert_frame_equal(loaded.trades(), store.trades())
+    assert loaded.batch_id != store.batch_id
+
+    # New runs of the loaded store are a new batch next to the old one
+    _fill(loaded, 2)
+    loaded.save()
+    reloaded = mmb.ResultsStore.load(tmp_path)
+    assert len(reloaded) == 9
+    assert reloaded.to_frame().groupby("Batch", observed=True).size().sort_values().tolist() == [2, 7]
+
+
+def test_ledgers_are_spilled(tmp_path):
+    store = mmb.ResultsStore(tmp_path, spill_rows=4)
+    _fill(store)
+
+    # 0 + 1 + 2 + 3 + 0 + 1 + 2 trades, spilled as soon as there are at least 4 of them
+    assert len(store.ledger_parts) == 1
+    assert store._ledger_buffer_rows == 3
+
+    trades = store.trades()
+    assert len(store.ledger_parts) == 2
+    assert len(trades) == 9
+    assert list(trades.columns) == ["Batch", "Run", "Trade"] + LEDGER_COLUMNS
+    assert trades.groupby("Run").size().to_dict() == {1: 1, 2: 2, 3: 3, 5: 1, 6: 2}
+    assert str(trades["EntryTime"].dt.tz) == "UTC"
+
+    expected = _trades(3, 3)
+    np.testing.assert_array_equal(trades.loc[trades["Run"] == 3, "EntryBar"], expected["EntryBar"])
+    assert trades.loc[trades["Run"] == 3, "Trade"].tolist() == [0, 1, 2]
+
+    runs = store.to_frame()
+    selected = store.trades(runs[runs["Symbol"] == "SYM0"])
+    assert sorted(selected["Run"].unique()) == [3, 6]
+
+
+def test_merge(tmp_path):
+    stores = [mmb.ResultsStore(tmp_path / f"store{i}", spill_rows=4) for i in range(2)]
+    for store in stores:
+        _fill(store)
+
+    merged = mmb.ResultsStore.merge(stores, root=tmp_path / "merged")
+    assert len(merged) == 14
+    assert merged.to_frame()["Batch"].nunique() == 2
+    assert len(merged.trades()) == 18
+
+    merged.save()
+    loaded = mmb.ResultsStore.load(tmp_path / "merged")
+    assert len(loaded) == 14
+    assert all(p.parent == tmp_path / "merged" / "ledgers" for p in loaded.ledger_parts)
+    pd.testing.assert_frame_equal(loaded.trades().sort_values(["Batch", "Run", "Trade"]).reset_index(drop=True),
+                                  merged.trades().sort_values(["Batch", "Run", "Trade"]).reset_index(drop=True))
+
+
+def test_store_without_ledgers():
+    store = mmb.ResultsStore()
+    _fill(store)
+
+    assert len(store) == 7
+    assert len(store.trades()) == 0
+    with pytest.raises(ValueError):
+        store.save()
+    with pytest.raises(ValueError, match="no trade ledgers"):
+        mmb.reprice(store, [mmb.CostModel(percentage=0.01)], 0.002)
+
+
+def test_summarize_and_aggregate(tmp_path):
+    store = mmb.ResultsStore(tmp_path)
+    _fill(store)
+
+    summary_df = store.summarize(sort_by="Return [%]")
+    assert summary_df.index.name == "Symbol"
+    assert summary_df["Return [%]"].is_monotonic_decreasing
+    assert {"Strategy", "stop_loss_perc", "sell_horizon"} <= set(summary_df.columns)
+
+    aggregated_df = store.aggregate(by=["Strategy"])
+    assert aggregated_df.set_index("Strategy")["Runs"].to_dict() == {"AfterShowBuyNextDayCloseSell": 3,
+                                                                     "BuyAndHold": 4}
+    returns = store.to_frame().groupby("Strategy", observed=True)["Return [%]"]
+    np.testing.assert_allclose(aggregated_df["Mean"], returns.mean().to_numpy())
+    np.testing.assert_allclose(aggregated_df["Hit Rate [%]"], returns.apply(lambda x: (x > 0).mean() * 100))
+    assert set(STAT_COLUMNS) <= set(store.to_frame().columns)
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mad_money_backtesting.scheduling import schedule_positions
+
+START = datetime(2021, 6, 1)
+
+
+def _dates(days: list) -> list:
+    return [START + timedelta(days=d) for d in days]
+
+
+def _days(dates: np.ndarray) -> list:
+    return list((pd.DatetimeIndex(dates) - START).days)
+
+
+# The example of the `schedule_positions` docstring
+BUY_DAYS = [1, 3, 4, 12, 15, 36, 34]
+
+
+@pytest.mark.parametrize("policy, max_lots, expected_buys, expected_sells",
+                         [("skip", 1, [1, 12, 34], [11, 22, 44]),
+                          ("skip", 3, [1, 12, 34], [11, 22, 44]),
+                          ("extend", 1, [1, 34], [25, 46]),
+                          ("lots", 1, [1, 12, 34], [11, 22, 44]),
+                          ("lots", 2, [1, 3, 12, 15, 34, 36], [11, 13, 22, 25, 44, 46]),
+                          ("lots", 3, [1, 3, 4, 12, 15, 34, 36], [11, 13, 14, 22, 25, 44, 46])])
+def test_schedule_positions(policy, max_lots, expected_buys, expected_sells):
+    buys, sells = schedule_positions(_dates(BUY_DAYS), timedelta(days=10), policy=policy, max_lots=max_lots)
+    assert _days(buys) == expected_buys
+    assert _days(sells) == expected_sells
+
+
+def test_lots_overlapping_horizons():
+    # Every lot overlaps with the next one, but at most 2 are open at the same time
+    buys, sells = schedule_positions(_dates([0, 2, 4, 6, 8, 10]), timedelta(days=5), policy="lots", max_lots=2)
+    assert _days(buys) == [0, 2, 6, 8]
+    assert _days(sells) == [5, 7, 11, 13]
+
+
+def test_lots_max_lots_reached():
+    # The 4th recommendation comes while 3 lots are open, it is dropped, the 5th comes after the first sell
+    buys, sells = schedule_positions(_dates([0, 1, 2, 3, 10]), timedelta(days=10), policy="lots", max_lots=3)
+    assert _days(buys) == [0, 1, 2, 10]
+    assert _days(sells) == [10, 11, 12, 20]
+
+
+def test_extend_chains_the_recommendations():
+    buys, sells = schedule_positions(_dates([0, 9, 18, 40]), timedelta(days=10), policy="extend")
+    assert _days(buys) == [0, 40]
+    assert _days(sells) == [28, 50]
+
+
+def test_unsorted_and_empty_dates():
+    buys, _ = schedule_positions(_dates([12, 1, 3]), timedelta(days=10))
+    assert _days(buys) == [1, 12]
+    buys, sells = schedule_positions([], timedelta(days=10), policy="lots", max_lots=2)
+    assert len(buys) == len(sells) == 0
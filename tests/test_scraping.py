@@ -0,0 +1,124 @@
+import json
+import re
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import requests
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting.scrape_cache import ScrapeCache
+
+FIXTURES_DIR = Path(__file__).resolve().parents[1] / "benchmarks" / "fixtures"
+SHOW_PAGE = (FIXTURES_DIR / "screener_2021-06-01.html").read_text(encoding="utf-8")
+NO_SHOW_PAGE = (FIXTURES_DIR / "screener_no_show.html").read_text(encoding="utf-8")
+
+
+class _Response:
+
+    def __init__(self, text: str, status_code: int = 200):
+        self.text = text
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+
+class _StubTransport(mmb.ScraperTransport):
+    """
+    Serves the fixture pages instead of the site: every date has a show, except the `no_show_dates`,
+    and the `failing_dates` always return 503
+    """
+
+    def __init__(self, no_show_dates=(), failing_dates=()):
+        super().__init__("http://localhost", max_workers=2, requests_per_second=None, max_attempts=2,
+                         backoff_base=0)
+        self.no_show_dates = set(no_show_dates)
+        self.failing_dates = set(failing_dates)
+        self.requested_dates = []
+
+    def get(self, **kwargs):
+        return _Response("")
+
+    def post(self, data: str, **kwargs):
+        date = re.search(r"airdate=([\d-]+)", data).group(1)
+        self.requested_dates.append(date)
+        if date in self.failing_dates:
+            response = _Response("", status_code=503)
+        else:
+            response = _Response(NO_SHOW_PAGE if date in self.no_show_dates else SHOW_PAGE)
+        response.raise_for_status()
+        return response
+
+
+def _scrape(cache_dir, transport, from_date="2021-06-01", to_date="2021-06-04", **kwargs) -> pd.DataFrame:
+    return mmb.scrape_cramer_calls(from_date, to_date, cache_dir=cache_dir, transport=transport, parser="lxml",
+                                   **kwargs)
+
+
+def test_every_date_is_cached(tmp_path):
+    transport = _StubTransport(no_show_dates={"2021-06-02"})
+    df = _scrape(tmp_path, transport)
+
+    cache = ScrapeCache(tmp_path)
+    assert cache.cached_dates() == ["2021-06-01", "2021-06-02", "2021-06-03", "2021-06-04"]
+    assert cache.get_rows("2021-06-02") == []
+    assert len(cache.get_rows("2021-06-01")) > 0
+    assert sorted(df["date"].unique()) == ["2021-06-01", "2021-06-03", "2021-06-04"]
+    assert df.attrs["failed_dates"] == []
+
+    # The pages are only kept when asked
+    assert not (tmp_path / "html").exists()
+    _scrape(tmp_path / "with_html", _StubTransport(), keep_html=True)
+    assert ScrapeCache(tmp_path / "with_html").get_html("2021-06-03") == SHOW_PAGE
+
+
+def test_resume_only_scrapes_the_new_dates(tmp_path):
+    first_df = _scrape(tmp_path, _StubTransport())
+
+    transport = _StubTransport()
+    df = _scrape(tmp_path, transport, to_date="2021-06-08")
+
+    # 2021-06-05 and 06 is a weekend
+    assert sorted(transport.requested_dates) == ["2021-06-07", "2021-06-08"]
+    # The scraped dates are in the order of completion
+    cached_df = df[df["date"] <= "2021-06-04"].sort_values("date", kind="stable").reset_index(drop=True)
+    pd.testing.assert_frame_equal(cached_df, first_df.sort_values("date", kind="stable").reset_index(drop=True))
+
+    # Without resume everything is scraped again
+    transport = _StubTransport()
+    _scrape(tmp_path, transport, to_date="2021-06-08", resume=False)
+    assert len(transport.requested_dates) == 6
+
+
+def test_stale_dates_are_scraped_again(tmp_path):
+    _scrape(tmp_path, _StubTransport())
+
+    # 2021-06-03 was scraped on the next day, the page could still change
+    rows_path = tmp_path / "rows" / "2021-06-03.json"
+    entry = json.loads(rows_path.read_text())
+    entry["scraped_at"] = "2021-06-04T10:00:00"
+    rows_path.write_text(json.dumps(entry))
+
+    assert not ScrapeCache(tmp_path).is_cached("2021-06-03")
+    assert ScrapeCache(tmp_path, stale_after_days=1).is_cached("2021-06-03")
+
+    transport = _StubTransport()
+    _scrape(tmp_path, transport)
+    assert transport.requested_dates == ["2021-06-03"]
+    assert ScrapeCache(tmp_path).is_cached("2021-06-03")
+
+
+def test_failed_dates_are_not_cached(tmp_path):
+    transport = _StubTransport(failing_dates={"2021-06-03"})
+    df = _scrape(tmp_path, transport)
+
+    assert df.attrs["failed_dates"] == ["2021-06-03"]
+    assert transport.requested_dates.count("2021-06-03") == transport.max_attempts
+    assert "2021-06-03" not in ScrapeCache(tmp_path).cached_dates()
+
+    # The next run only scrapes the failed date
+    transport = _StubTransport()
+    _scrape(tmp_path, transport)
+    assert transport.requested_dates == ["2021-06-03"]
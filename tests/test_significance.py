@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting.significance import _trading_days, p_value, random_date_sets, random_returns_for_symbol
+from mad_money_backtesting.trading_calendar import TradingCalendar
+from synthetic import make_prices, make_recommendations_df, make_stock_df
+
+NB_SETS = 8
+NB_DATES = 6
+
+STRATEGIES = [(mmb.AfterShowBuyNextDayCloseSell, {}),
+              (mmb.NextDayOpenBuyNextDayCloseSell, {}),
+              (mmb.BuyAndHold, {"sell_horizon": 5}),
+              (mmb.BuyAndHold, {"sell_horizon": 3, "holding_policy": "extend"}),
+              (mmb.BuyAndHold, {"sell_horizon": 100000})]
+
+
+@pytest.mark.parametrize("stop_loss_perc, take_profit_perc", [(None, None), (0.01, 0.02)])
+@pytest.mark.parametrize("strategy_class, params", STRATEGIES)
+def test_random_sets_match_run_vectorized(strategy_class, params, stop_loss_perc, take_profit_perc):
+    stock_df = make_stock_df(60, seed=3)
+    days = _trading_days(TradingCalendar.from_df(stock_df))
+
+    # The sets are evaluated in several blocks
+    random_returns = random_returns_for_symbol(strategy_class, stock_df, NB_DATES, NB_SETS,
+                                               np.random.default_rng(0), 1000, 0.01, stop_loss_perc,
+                                               take_profit_perc, block_size=3, **params)
+    day_sets = random_date_sets(len(days), NB_DATES, NB_SETS, np.random.default_rng(0))
+
+    for day_set, random_return in zip(day_sets, random_returns):
+        result = mmb.run_vectorized(stock_df, strategy_class, [days[i] for i in day_set], 1000, 0.01,
+                                    stop_loss_perc, take_profit_perc, **params)
+        assert random_return == pytest.approx(result["Return [%]"])
+
+
+def test_random_date_sets_are_sorted_and_unique():
+    day_sets = random_date_sets(20, 5, 100, np.random.default_rng(0))
+
+    assert day_sets.shape == (100, 5)
+    assert np.all(np.diff(day_sets, axis=1) > 0)
+    assert day_sets.min() >= 0 and day_sets.max() < 20
+
+
+def test_p_value():
+    assert p_value(10.0, np.arange(9.0)) == pytest.approx(0.1)
+    assert p_value(-1.0, np.arange(9.0)) == pytest.approx(1.0)
+
+
+def test_monte_carlo_does_not_depend_on_the_chunks():
+    symbols = ["SYM0", "SYM1", "SYM2"]
+    prices = make_prices(symbols, 40)
+    recommendations_df = make_recommendations_df(symbols, 4, 40)
+
+    results = [mmb.monte_carlo(mmb.AfterShowBuyNextDayCloseSell, recommendations_df, prices, 1000, 0.002,
+                               nb_sets=50, max_workers=1, chunk_size=chunk_size, block_size=block_size,
+                               progress=False)
+               for chunk_size, block_size in [(16, 256), (1, 7)]]
+
+    assert len(results[0].summary) == len(symbols)
+    np.testing.assert_allclose(results[0].random_returns.to_numpy(), results[1].random_returns.to_numpy())
+    for symbol, stock_df in prices.items():
+        dates = [mmb.pd_date_to_datetime(d) for d in recommendations_df.loc[recommendations_df["symbol"] == symbol,
+                                                                            "date"]]
+        real_return = mmb.run_vectorized(stock_df, mmb.AfterShowBuyNextDayCloseSell, dates, 1000, 0.002)["Return [%]"]
+        summary_row = results[0].summary.set_index("Symbol").loc[symbol]
+        assert summary_row["Return [%]"] == pytest.approx(real_return)
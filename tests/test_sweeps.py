@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting.untils import pd_date_to_datetime
+from synthetic import make_prices, make_recommendations_df, make_symbols
+
+SYMBOLS = make_symbols(3)
+NB_DAYS = 60
+
+PARAM_GRID = {"sell_horizon": [2, 7],
+              "holding_policy": ["skip", "extend"],
+              "stop_loss_perc": [None, 0.02],
+              "take_profit_perc": [None, 0.03]}
+
+
+@pytest.fixture(scope="module")
+def sweep_inputs():
+    recommendations_df = make_recommendations_df(SYMBOLS, 6, NB_DAYS, seed=1)
+    prices = make_prices(SYMBOLS, NB_DAYS, seed=1)
+    sweep_df = mmb.sweep(mmb.BuyAndHold, recommendations_df, prices, PARAM_GRID, 1000, 0.002, max_workers=2,
+                         chunk_size=2, progress=False)
+    return recommendations_df, prices, sweep_df
+
+
+def test_every_grid_point_matches_run_vectorized(sweep_inputs):
+    recommendations_df, prices, sweep_df = sweep_inputs
+
+    assert len(sweep_df) == len(SYMBOLS) * 16
+    for row in sweep_df.to_dict("records"):
+        dates = [pd_date_to_datetime(d) for d in recommendations_df.loc[recommendations_df["symbol"] == row["Symbol"],
+                                                                        "date"]]
+        params = {k: None if pd.isna(row[k]) else row[k] for k in PARAM_GRID}
+        expected = mmb.run_vectorized(prices[row["Symbol"]], mmb.BuyAndHold, dates, 1000, 0.002, **params)
+
+        assert row["Return [%]"] == pytest.approx(expected["Return [%]"]), params
+        assert row["Equity Final [$]"] == pytest.approx(expected["Equity Final [$]"]), params
+        assert row["# Trades"] == expected["# Trades"], params
+
+
+def test_rank_sweep_results(sweep_inputs):
+    _, _, sweep_df = sweep_inputs
+
+    ranking_df = mmb.rank_sweep_results(sweep_df)
+
+    assert len(ranking_df) == 16
+    assert (ranking_df["Symbols"] == len(SYMBOLS)).all()
+    assert ranking_df["Rank"].tolist() == list(range(1, 17))
+    assert ranking_df["Mean Return [%]"].is_monotonic_decreasing
+    best = ranking_df.iloc[0]
+    mask = np.ones(len(sweep_df), dtype=bool)
+    for k in PARAM_GRID:
+        mask &= (sweep_df[k] == best[k]) | (sweep_df[k].isna() & pd.isna(best[k]))
+    assert best["Mean Return [%]"] == pytest.approx(sweep_df.loc[mask, "Return [%]"].mean())
+
+
+def test_lots_are_not_supported():
+    with pytest.raises(NotImplementedError):
+        mmb.sweep(mmb.BuyAndHold, make_recommendations_df(SYMBOLS, 2, NB_DAYS), make_prices(SYMBOLS, NB_DAYS),
+                  {"sell_horizon": [2], "holding_policy": ["lots"], "max_lots": [2]}, 1000, 0.002, progress=False)
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mad_money_backtesting.trading_calendar import TradingCalendar
+
+BAR_DATES = pd.DatetimeIndex(["2021-06-01 09:30", "2021-06-01 15:30", "2021-06-02 09:30", "2021-06-04 15:30"])
+
+# Before the first bar, exactly a bar, between two bars, after the last bar
+DATES = [datetime(2021, 5, 31, 15, 30), datetime(2021, 6, 1, 15, 30), datetime(2021, 6, 3, 9, 30),
+         datetime(2021, 6, 7, 9, 30)]
+
+
+@pytest.fixture(params=[None, "America/New_York", "UTC"], ids=["naive", "new_york", "utc"])
+def calendar(request) -> TradingCalendar:
+    bar_dates = BAR_DATES if request.param is None else \
+        BAR_DATES.tz_localize("America/New_York").tz_convert(request.param)
+    return TradingCalendar(bar_dates)
+
+
+@pytest.mark.parametrize("mode, expected_bars", [("next_date", [0, 1, 3]),
+                                                 ("prev_date", [1, 2, 3]),
+                                                 ("drop", [1])])
+def test_resolve_modes(calendar, mode, expected_bars):
+    np.testing.assert_array_equal(calendar.resolve_bars(DATES, mode), expected_bars)
+
+
+def test_resolve_dates(calendar):
+    assert calendar.resolve_dates(DATES[:2]) == list(calendar.bar_dates[[0, 1]].to_pydatetime())
+
+
+def test_dates_past_the_nanosecond_range(calendar):
+    bar_dates = TradingCalendar(calendar.bar_dates.as_unit("ns"))
+    dates = pd.DatetimeIndex(["2300-01-01", "2021-06-02"]).as_unit("us")
+
+    np.testing.assert_array_equal(bar_dates.resolve_bars(dates, "next_date"), [2])
+    np.testing.assert_array_equal(bar_dates.resolve_bars(dates, "prev_date"), [3, 1])
+    assert len(bar_dates.resolve_bars(dates, "drop")) == 0
+
+
+def test_unsorted_bars():
+    with pytest.raises(ValueError):
+        TradingCalendar(BAR_DATES[::-1])
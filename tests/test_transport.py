@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import mad_money_backtesting as mmb
+from mad_money_backtesting import transport as transport_module
+
+
+def _transport(url: str, **kwargs) -> mmb.ScraperTransport:
+    kwargs = {"requests_per_second": None, "backoff_base": 0.01, "backoff_max": 0.05, **kwargs}
+    return mmb.ScraperTransport(url, **kwargs)
+
+
+def _fail_first(nb_failures: int):
+    """
+    Every request body fails `nb_failures` times with 503 before it succeeds
+    """
+
+    counts = {}
+    lock = threading.Lock()
+
+    def respond(body):
+        with lock:
+            counts[body] = counts.get(body, 0) + 1
+            if counts[body] <= nb_failures:
+                return 503, "Service Unavailable"
+        return 200, f"ok {body}"
+
+    return respond
+
+
+def test_retries_until_success(local_server, monkeypatch):
+    local_server.respond = _fail_first(2)
+    sleeps = []
+    monkeypatch.setattr(transport_module.time, "sleep", sleeps.append)
+
+    with _transport(local_server.url, max_attempts=5, backoff_base=1.0, backoff_max=3.0) as transport:
+        response = transport.call_with_retries(transport.post, data="a=1")
+
+    assert response.text == "ok a=1"
+    assert local_server.requests == ["a=1"] * 3
+    assert transport.nb_retries == 2
+    # Full jitter: the n-th backoff is in [0, min(backoff_max, backoff_base * 2 ** n)]
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 1.0 and 0 <= sleeps[1] <= 2.0
+
+
+def test_backoff_time_is_capped():
+    transport = _transport("http://127.0.0.1/", backoff_base=1.0, backoff_max=4.0)
+    for attempt in range(10):
+        assert 0 <= transport.backoff_time(attempt) <= min(4.0, 2 ** attempt)
+    transport.close()
+
+
+def test_retry_cap(local_server):
+    local_server.respond = lambda body: (503, "Service Unavailable")
+
+    with _transport(local_server.url, max_attempts=3) as transport:
+        with pytest.raises(requests.HTTPError):
+            transport.call_with_retries(transport.post, data="a=1")
+
+    assert len(local_server.requests) == 3
+    assert transport.nb_retries == 2
+
+
+def test_no_retry_errors_are_raised_right_away(local_server):
+    with _transport(local_server.url, max_attempts=3) as transport:
+        def fn(item):
+            transport.post(data=item)
+            raise KeyError(item)
+
+        with pytest.raises(KeyError):
+            transport.call_with_retries(fn, "a=1", no_retry=(KeyError,))
+
+    assert local_server.requests == ["a=1"]
+    assert transport.nb_retries == 0
+
+
+def test_map_results_and_errors(local_server):
+    local_server.respond = _fail_first(1)
+
+    with _transport(local_server.url, max_workers=3, max_attempts=2) as transport:
+        results = {item: (result, error)
+                   for item, result, error in transport.map(lambda item: transport.post(data=item).text,
+                                                            [f"i={i}" for i in range(20)])}
+
+    assert results == {f"i={i}": (f"ok i={i}", None) for i in range(20)}
+    assert transport.nb_retries == 20
+    assert local_server.max_in_flight <= 3
+
+    with _transport(local_server.url, max_attempts=2) as transport:
+        local_server.respond = lambda body: (503, "Service Unavailable")
+        (item, result, error), = transport.map(lambda item: transport.post(data=item), ["x=1"])
+    assert item == "x=1" and result is None and isinstance(error, requests.HTTPError)
+
+
+def test_map_keeps_a_bounded_number_of_calls_in_flight(local_server):
+    local_server.respond = lambda body: (time.sleep(0.01), (200, body))[1]
+    max_workers = 2
+    nb_items = 50
+    nb_pulled = 0
+
+    def items():
+        nonlocal nb_pulled
+        for i in range(nb_items):
+            nb_pulled += 1
+            yield f"i={i}"
+
+    with _transport(local_server.url, max_workers=max_workers) as transport:
+        results = transport.map(lambda item: transport.post(data=item).text, items())
+
+        nb_yielded = 0
+        for _ in results:
+            nb_yielded += 1
+            # At most 2 x max_workers items are submitted and not yielded yet
+            assert nb_pulled - nb_yielded < 2 * max_workers
+            if nb_yielded == 10:
+                break
+        results.close()
+
+    # Closing the generator early does not call the remaining items
+    assert nb_pulled < nb_items
+    assert len(local_server.requests) <= 10 + 2 * max_workers
+
+
+def test_transport_closes_its_session(local_server):
+    with _transport(local_server.url) as transport:
+        transport.post(data="a=1")
+        assert len(transport.session.adapters["http://"].poolmanager.pools) == 1
+    assert len(transport.session.adapters["http://"].poolmanager.pools) == 0
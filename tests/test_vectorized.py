@@ -0,0 +1,55 @@
+import backtesting
+import numpy as np
+import pandas as pd
+import pytest
+
+import mad_money_backtesting as mmb
+from synthetic import START_DATE, make_stock_df
+
+NB_DAYS = 60
+
+STRATEGIES = [(mmb.AfterShowBuyNextDayCloseSell, {}),
+              (mmb.AfterShowBuyNextDayOpenSell, {}),
+              (mmb.NextDayOpenBuyNextDayCloseSell, {}),
+              (mmb.BuyAndHold, {"sell_horizon": 5}),
+              (mmb.BuyAndHold, {"sell_horizon": 5, "holding_policy": "extend"}),
+              (mmb.BuyAndHold, {"sell_horizon": 5, "holding_policy": "lots", "max_lots": 1}),
+              (mmb.BuyAndHold, {"sell_horizon": 100000})]
+
+RISK_LEVELS = [(None, None), (0.01, 0.02), (0.03, None)]
+
+STAT_KEYS = ["Return [%]", "Equity Final [$]", "Equity Peak [$]", "Buy & Hold Return [%]", "# Trades"]
+
+
+def _recommendation_dates(seed: int, nb_dates: int = 8) -> list:
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(START_DATE, periods=NB_DAYS + 5)
+    return [mmb.pd_date_to_datetime(d) for d in np.sort(rng.choice(days, nb_dates, replace=False))]
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("stop_loss_perc, take_profit_perc", RISK_LEVELS)
+@pytest.mark.parametrize("strategy_class, params", STRATEGIES)
+def test_same_results_as_backtesting_py(strategy_class, params, stop_loss_perc, take_profit_perc, seed):
+    stock_df = make_stock_df(NB_DAYS, seed=seed)
+    recommendation_dates = _recommendation_dates(seed)
+
+    bt = backtesting.Backtest(stock_df, strategy_class, cash=1000, commission=0.01, trade_on_close=True)
+    expected = bt.run(recommendation_dates=recommendation_dates, stop_loss_perc=stop_loss_perc,
+                      take_profit_perc=take_profit_perc, **params)
+    result = mmb.run_vectorized(stock_df, strategy_class, recommendation_dates, 1000, 0.01, stop_loss_perc,
+                                take_profit_perc, **params)
+
+    for key in STAT_KEYS:
+        assert result[key] == pytest.approx(expected[key]), key
+    assert result["_strategy"] == str(expected["_strategy"])
+
+    closed_trades = result["_trades"][result["_trades"]["ExitBar"] >= 0]
+    np.testing.assert_array_equal(closed_trades[["EntryBar", "ExitBar", "Size"]].to_numpy(),
+                                  expected["_trades"][["EntryBar", "ExitBar", "Size"]].to_numpy())
+
+
+def test_lots_are_not_supported():
+    with pytest.raises(NotImplementedError):
+        mmb.run_vectorized(make_stock_df(10), mmb.BuyAndHold, _recommendation_dates(0), 1000, 0.01,
+                           sell_horizon=5, holding_policy="lots", max_lots=2)